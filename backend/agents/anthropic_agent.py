@@ -1,15 +1,13 @@
-from instructor import patch
-from anthropic import Anthropic
 from typing import List
 from pydantic import BaseModel, Field
 
 from config import get_settings
+from services.http_clients import clients
+from services.structured_logging import get_logger
 from models import ControlNetParams, ProductSuggestion, DesignRequest
 
 settings = get_settings()
-# Patch the Anthropic client with Instructor
-anthropic_client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-patched_client = patch(anthropic_client)
+logger = get_logger("agents.anthropic")
 
 
 class DesignAgentResponse(BaseModel):
@@ -45,8 +43,19 @@ class AnthropicDesignAgent:
     """
     
     def __init__(self):
-        """Initialize the agent with Anthropic client"""
-        self.client = patched_client
+        """Initialize the agent; the patched client is built on first use"""
+        self._client = None
+    
+    @property
+    def client(self):
+        """Anthropic client patched with Instructor"""
+        if self._client is None:
+            from instructor import patch
+            from anthropic import Anthropic
+            # patch() rewrites the client in place, so this agent gets its own
+            # wrapper (on the shared connection pool) instead of the shared client
+            self._client = patch(Anthropic(api_key=settings.ANTHROPIC_API_KEY, http_client=clients.httpx_client()))
+        return self._client
     
     def generate_design(
         self,
@@ -109,11 +118,11 @@ Generate a complete design specification."""
                 system=system_prompt,
             )
             
-            print(f"✅ Successfully generated design with {len(response.prompt)} character prompt")
+            logger.info(f"Generated design with {len(response.prompt)} character prompt")
             return response
             
         except Exception as e:
-            print(f"Anthropic Agent Error: {str(e)}")
+            logger.error(f"Anthropic Agent Error: {str(e)}")
             # Fallback response
             return DesignAgentResponse(
                 prompt=f"A beautiful {user_request.room_type.value} with {user_request.prompt}, "
@@ -130,15 +139,14 @@ Generate a complete design specification."""
     def test_connection(self) -> bool:
         """Quick test to verify Anthropic API is working"""
         try:
-            test_client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-            response = test_client.messages.create(
+            response = clients.anthropic().messages.create(
                 model="claude-3-opus-20240229",
                 max_tokens=50,
                 messages=[{"role": "user", "content": "Reply with: API_OK"}]
             )
             return "API_OK" in response.content
         except Exception as e:
-            print(f"Anthropic connection test failed: {str(e)}")
+            logger.warning(f"Anthropic connection test failed: {str(e)}")
             return False
 
 
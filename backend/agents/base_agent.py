@@ -3,14 +3,54 @@ Base Agent Class
 All specialized agents inherit from this to ensure consistent interface
 """
 from abc import ABC, abstractmethod
-from anthropic import Anthropic
-from typing import Any, Dict, List
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
 from pydantic import BaseModel
+import contextvars
+import threading
+import time
 
 from config import get_settings
+from agents.deadline import remaining_call_time, PhaseTimeout
+from agents.hedging import LatencyHistogram, HedgeCancelled, hedge_budget, hedge_executor
+from agents.usage import TimeToFirstToken, TokenUsageStats, record_call_metrics
+from agents.schemas import StructuredOutputError, parse_structured, tool_definition
+from agents.streaming import IncrementalArrayParser
+from agents.model_router import model_router
+from services.rate_limiter import anthropic_limiter, estimate_tokens
+from services.resilience import call_with_retry
+from services.http_clients import clients
+from services.metrics import agent_fallbacks, llm_latency, llm_requests
+from services.tracing import span
+from services.structured_logging import get_logger
 
 settings = get_settings()
 
+# LLM paths of raced agents keep running here after the local answer wins
+_race_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="race")
+
+# Cancel event of the raced LLM path running in this context (None elsewhere)
+_race_cancel: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar("race_cancel", default=None)
+
+
+def race_cancelled() -> bool:
+    """Whether this code runs in a raced LLM path nobody is waiting for any more"""
+    cancel_event = _race_cancel.get()
+    return cancel_event is not None and cancel_event.is_set()
+
+
+class RacedCall:
+    """The LLM path of a raced phase, still running after the local answer won"""
+    
+    def __init__(self, future: Future, cancel_event: threading.Event):
+        self.future = future
+        self._cancel_event = cancel_event
+    
+    def cancel(self):
+        """Abandon it: its upstream call is closed and side effects are skipped"""
+        self._cancel_event.set()
+        self.future.cancel()
+
 
 class AgentResponse(BaseModel):
     """Standard response format for all agents"""
@@ -27,12 +67,39 @@ class BaseAgent(ABC):
     Provides common functionality like API access and logging
     """
     
-    def __init__(self, agent_name: str):
+    def __init__(self, agent_name: str, client=None):
         self.agent_name = agent_name
-        self.client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        self.model = "claude-sonnet-4-20250514"  # Worker agents use Sonnet for speed
+        self.logger = get_logger(f"agents.{agent_name}")
+        # One pooled client for every agent (injectable for tests),
+        # resolved on first call so importing the agents stays cheap
+        self._client = client
+        self.model = settings.tier_medium_model  # Worker agents use Sonnet for speed
+        # Tiers the router may pick from per call, preferred first
+        self.route = settings.route_worker
         self.max_tokens = 2000
         
+        # Opt-in hedging: duplicate a call still running at this agent's p95
+        self.hedge_enabled = agent_name in [a.strip() for a in settings.hedge_agents.split(",")]
+        self.latency = LatencyHistogram(min_samples=settings.hedge_min_samples)
+        # Time to first token of every call (streamed or not)
+        self.ttft = TimeToFirstToken(agent_name)
+        
+        # Agents with a fast local fallback can race it against the LLM
+        self.race_enabled = False
+        
+        # Token usage, including prompt-cache reads/writes
+        self.usage = TokenUsageStats()
+        
+        # Structured (tool-use) answers: validated as-is, repaired locally, unusable
+        self.output_stats = {"valid": 0, "repaired": 0, "failed": 0}
+        
+    @property
+    def client(self):
+        """Anthropic client, created on first use"""
+        if self._client is None:
+            self._client = clients.anthropic()
+        return self._client
+    
     @abstractmethod
     def process(self, context: Dict[str, Any]) -> AgentResponse:
         """
@@ -46,28 +113,340 @@ class BaseAgent(ABC):
         """
         pass
     
-    def _call_claude(self, system_prompt: str, user_message: str, temperature: float = 0.7) -> str:
+    @abstractmethod
+    def fallback(self, context: Dict[str, Any]) -> AgentResponse:
+        """
+        Fast deterministic answer without an LLM call
+        Used by the orchestrator when this agent's phase runs out of time
+        """
+        pass
+    
+    def process_with_race(self, context: Dict[str, Any], grace_seconds: float) -> Tuple[AgentResponse, Optional[RacedCall]]:
+        """
+        Race the LLM path against the local fallback
+        
+        The LLM answer is returned if it arrives within the grace window,
+        otherwise the local answer is returned immediately
+        
+        Returns:
+            (response, late) where late is set when the local answer won;
+            late.future resolves to the LLM's AgentResponse later, and
+            late.cancel() stops it if the caller no longer wants it
+        """
+        start = time.monotonic()
+        cancel_event = threading.Event()
+        
+        def run_llm():
+            _race_cancel.set(cancel_event)
+            return self.process(context)
+        
+        # Copy the context so the LLM path still sees the phase deadline
+        llm_future = _race_executor.submit(contextvars.copy_context().run, run_llm)
+        local_response = self.fallback(context)
+        
+        try:
+            llm_response = llm_future.result(timeout=max(grace_seconds - (time.monotonic() - start), 0))
+            return (llm_response if llm_response.success else local_response), None
+        except FutureTimeoutError:
+            self.log_activity(f"LLM missed the {grace_seconds * 1000:.0f}ms grace window, returning local answer")
+            self.record_fallback("race_lost")
+            return local_response, RacedCall(llm_future, cancel_event)
+    
+    def _call_claude(
+        self,
+        system_prompt: str,
+        user_message: str,
+        temperature: float = 0.7,
+        dynamic_system: str = "",
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
         """
         Shared method for calling Claude API
         All agents use this to maintain consistency
+        
+        Per-request instructions go in dynamic_system, which is sent after
+        the static system_prompt
+        
+        With on_text the answer is streamed and on_text receives each text
+        fragment as it arrives; the full text is still returned
         """
-        try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=self.max_tokens,
-                temperature=temperature,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": user_message}
-                ]
-            )
+        request_kwargs = self._build_request(system_prompt, user_message, temperature, dynamic_system)
+        
+        on_event = None
+        if on_text is not None:
+            def on_event(event):
+                if event.type == "text":
+                    on_text(event.text)
+        
+        response = self._send_request(request_kwargs, on_event)
+        return response.content[0].text
+    
+    def _call_claude_structured(
+        self,
+        system_prompt: str,
+        user_message: str,
+        schema: Type[BaseModel],
+        temperature: float = 0.7,
+        dynamic_system: str = "",
+        stream_key: Optional[str] = None,
+        on_item: Optional[Callable[[Any], None]] = None
+    ) -> BaseModel:
+        """
+        Claude call whose answer is forced through a tool with the schema as
+        its input, then validated (and repaired locally if partly invalid)
+        
+        With stream_key and on_item the answer is streamed and on_item is
+        called with each element of the stream_key array (raw JSON, not yet
+        validated) as soon as it closes. A retried call streams its items
+        again, so on_item must tolerate repeats.
+        
+        Raises:
+            StructuredOutputError: the answer was unusable even after repair
+        """
+        tool = tool_definition(schema)
+        request_kwargs = self._build_request(
+            system_prompt, user_message, temperature, dynamic_system,
+            tools=[tool],
+            tool_choice={"type": "tool", "name": tool["name"]}
+        )
+        
+        on_event = None
+        if stream_key and on_item is not None and settings.llm_streaming_enabled:
+            parser = None
             
-            return response.content[0].text
+            def on_event(event):
+                nonlocal parser
+                if event.type == "message_start":
+                    # Every attempt (first try or retry) starts a new answer
+                    parser = IncrementalArrayParser(stream_key)
+                elif event.type == "input_json" and parser is not None:
+                    for item in parser.feed(event.partial_json):
+                        on_item(item)
+        
+        response = self._send_request(request_kwargs, on_event)
+        
+        raw = next((block.input for block in response.content if getattr(block, "type", None) == "tool_use"), None)
+        if raw is None:
+            # No tool call: fall back to whatever JSON is in the text
+            raw = "".join(getattr(block, "text", "") for block in response.content)
+        
+        try:
+            result, repaired = parse_structured(schema, raw)
+        except StructuredOutputError as e:
+            self.output_stats["failed"] += 1
+            self.log_activity(f"Structured output unusable: {e}")
+            raise
+        
+        if repaired:
+            self.output_stats["repaired"] += 1
+            self.log_activity(f"Repaired partially invalid {schema.__name__} locally")
+        else:
+            self.output_stats["valid"] += 1
+        return result
+    
+    def _build_request(
+        self,
+        system_prompt: str,
+        user_message: str,
+        temperature: float,
+        dynamic_system: str = "",
+        **extra
+    ) -> Dict[str, Any]:
+        """messages.create arguments, with the call timeout taken from the phase deadline"""
+        request_kwargs = {}
+        
+        # Never outlive the phase deadline (if any) on the wire
+        timeout = remaining_call_time()
+        if timeout is not None:
+            if timeout <= 0:
+                raise PhaseTimeout(f"{self.agent_name} has no time left for an API call")
+            request_kwargs["timeout"] = timeout
+        
+        model = model_router.choose(self.agent_name, self.route)
+        request_kwargs.update(
+            model=model,
+            max_tokens=self.max_tokens,
+            temperature=temperature,
+            system=f"{system_prompt}\n\n{dynamic_system}" if dynamic_system else system_prompt,
+            messages=[
+                {"role": "user", "content": user_message}
+            ],
+            **extra
+        )
+        return request_kwargs
+    
+    def _send_request(self, request_kwargs: Dict[str, Any], on_event: Optional[Callable[[Any], None]] = None):
+        """
+        Send and return the raw response
+        Streamed calls (on_event set) are never hedged: a duplicate request
+        would deliver every streamed item twice
+        """
+        try:
+            race_cancel = _race_cancel.get()
+            if race_cancel is not None:
+                # Raced LLM path: streamed, so cancelling it closes the connection
+                return self._create_message(request_kwargs, race_cancel, on_event)
+            if on_event is not None:
+                return self._create_message(request_kwargs, on_event=on_event)
+            if self.hedge_enabled:
+                return self._hedged_create(request_kwargs)
+            return self._create_message(request_kwargs)
             
         except Exception as e:
-            print(f"{self.agent_name} API call failed: {str(e)}")
+            self.logger.warning(f"API call failed: {str(e)}")
             raise
     
+    def _hedged_create(self, request_kwargs: Dict[str, Any]):
+        """
+        messages.create with a hedge fired at this agent's observed p95
+        The first successful response wins; the other call is cancelled
+        """
+        hedge_budget.record_call()
+        hedge_after = self.latency.percentile(95)
+        if hedge_after is None:
+            # Not enough history yet to know what "slow" means
+            return self._create_message(request_kwargs)
+        
+        cancel_events = {}
+        primary_cancel = threading.Event()
+        primary_started = threading.Event()
+        primary = hedge_executor.submit(contextvars.copy_context().run, self._create_message, request_kwargs, primary_cancel, None, primary_started)
+        primary.add_done_callback(lambda _: primary_started.set())
+        cancel_events[primary] = primary_cancel
+        
+        # p95 is the upstream call's own latency: time queued in the shared
+        # limiter isn't slowness a duplicate request could beat
+        primary_started.wait()
+        done, _ = wait([primary], timeout=hedge_after)
+        if not done and hedge_budget.try_acquire():
+            self.log_activity(f"No response after p95 ({hedge_after * 1000:.0f}ms), sending hedge request")
+            hedge_cancel = threading.Event()
+            hedge = hedge_executor.submit(contextvars.copy_context().run, self._create_message, request_kwargs, hedge_cancel)
+            cancel_events[hedge] = hedge_cancel
+        
+        last_error = None
+        pending = set(cancel_events)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        cancel_events[loser].set()
+                    return future.result()
+                last_error = future.exception()
+        raise last_error
+    
+    def _create_message(
+        self,
+        request_kwargs: Dict[str, Any],
+        cancel_event: Optional[threading.Event] = None,
+        on_event: Optional[Callable[[Any], None]] = None,
+        started: Optional[threading.Event] = None
+    ):
+        """
+        Upstream messages call with retries on transient errors
+        Fails fast with CircuitOpenError while the Anthropic circuit is open
+        `started` is set once the limiter admits the call and it is sent
+        """
+        timeout = request_kwargs.get("timeout")
+        expires_at = time.monotonic() + timeout if timeout is not None else None
+        
+        return call_with_retry(
+            "anthropic",
+            lambda: self._send_message(request_kwargs, cancel_event, expires_at, on_event, started),
+            expires_at=expires_at
+        )
+    
+    def _send_message(
+        self,
+        request_kwargs: Dict[str, Any],
+        cancel_event: Optional[threading.Event],
+        expires_at: Optional[float],
+        on_event: Optional[Callable[[Any], None]] = None,
+        started: Optional[threading.Event] = None
+    ):
+        """
+        Single upstream messages call, admitted by the shared model limiter
+        Token usage is reserved up front (prompt estimate + max_tokens) and
+        settled with the real usage once the response arrives
+        """
+        limiter = anthropic_limiter(request_kwargs["model"])
+        estimate = estimate_tokens(str(request_kwargs["system"]), str(request_kwargs["messages"])) + request_kwargs["max_tokens"]
+        
+        def time_left():
+            return max(expires_at - time.monotonic(), 0.001) if expires_at is not None else None
+        
+        with span("llm.call", agent=self.agent_name, model=request_kwargs["model"]) as trace_span, \
+                limiter.limit(tokens=estimate, timeout=time_left()) as lease:
+            if expires_at is not None:
+                # Time spent queued or backing off comes out of the call's own timeout
+                request_kwargs = {**request_kwargs, "timeout": time_left()}
+            
+            model = request_kwargs["model"]
+            if cancel_event is not None and cancel_event.is_set():
+                # Lost its race while queued: don't spend the tokens
+                raise HedgeCancelled(f"{self.agent_name} call abandoned before it started")
+            if started is not None:
+                started.set()
+            start = time.monotonic()
+            try:
+                if cancel_event is None and on_event is None:
+                    response = self.client.messages.create(**request_kwargs)
+                else:
+                    response = self._streamed_create(request_kwargs, cancel_event, on_event)
+            except Exception:
+                llm_requests.inc(self.agent_name, model, "error")
+                raise
+            elapsed = time.monotonic() - start
+            if cancel_event is None and on_event is None:
+                self.ttft.record(elapsed, model, "full")
+            self.latency.record(elapsed)
+            model_router.record_latency(model, elapsed)
+            llm_requests.inc(self.agent_name, model, "ok")
+            llm_latency.observe(elapsed, self.agent_name, model)
+            
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                lease.settle(self.usage.record(usage))
+                record_call_metrics(self.agent_name, model, usage)
+                if trace_span is not None:
+                    trace_span.set(
+                        input_tokens=getattr(usage, "input_tokens", 0) or 0,
+                        output_tokens=getattr(usage, "output_tokens", 0) or 0,
+                        cache_read_input_tokens=getattr(usage, "cache_read_input_tokens", 0) or 0
+                    )
+        
+        return response
+    
+    def _streamed_create(
+        self,
+        request_kwargs: Dict[str, Any],
+        cancel_event: Optional[threading.Event] = None,
+        on_event: Optional[Callable[[Any], None]] = None
+    ):
+        """
+        Streamed messages.create, returning the final message
+        Events are passed to on_event as they arrive. Setting cancel_event
+        abandons the call: leaving the stream context closes the HTTP
+        connection, which stops generation of the losing request
+        """
+        start = time.monotonic()
+        first_token = True
+        with self.client.messages.stream(**request_kwargs) as stream:
+            for event in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise HedgeCancelled(f"{self.agent_name} hedge lost the race")
+                if first_token and event.type == "content_block_delta":
+                    self.ttft.record(time.monotonic() - start, request_kwargs["model"], "stream")
+                    first_token = False
+                if on_event is not None:
+                    on_event(event)
+            return stream.get_final_message()
+    
+    def record_fallback(self, reason: str):
+        """Count an answer served locally instead of by the LLM"""
+        agent_fallbacks.inc(self.agent_name, reason)
+    
     def log_activity(self, message: str):
-        """Log agent activity for debugging"""
-        print(f"[{self.agent_name}] {message}")
\ No newline at end of file
+        """Log agent activity for debugging (INFO, sampled by log_sample_rates)"""
+        self.logger.info(message)
\ No newline at end of file
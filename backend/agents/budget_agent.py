@@ -2,10 +2,11 @@
 Budget Management Agent - FIXED
 Ensures budget_max is included in output data
 """
-from typing import Dict, Any, List
-import json
+from typing import Dict, Any, List, Optional
 
 from agents.base_agent import BaseAgent, AgentResponse
+from agents.schemas import BudgetAnalysis, StructuredOutputError
+from services.resilience import CircuitOpenError
 
 
 class BudgetAgent(BaseAgent):
@@ -84,23 +85,13 @@ class BudgetAgent(BaseAgent):
             )
         
         # Calculate costs with tax and shipping
-        TAX_RATE = 0.0825  # 8.25%
-        subtotal = sum(p.get("base_price", 0) for p in selected_products)
-        tax = subtotal * TAX_RATE
-        shipping = 0 if subtotal >= 1000 else 150
-        total_cost = subtotal + tax + shipping
-        
-        # Determine budget status
-        if budget_max:
-            over_budget = total_cost > budget_max
-            budget_remaining = budget_max - total_cost
-            budget_utilization = (total_cost / budget_max) * 100
-            budget_status = "over_budget" if over_budget else "within_budget"
-        else:
-            over_budget = False
-            budget_remaining = None
-            budget_utilization = None
-            budget_status = "no_budget_set"
+        costs = self._calculate_costs(selected_products, budget_max)
+        subtotal = costs["subtotal"]
+        tax = costs["tax"]
+        shipping = costs["shipping"]
+        total_cost = costs["total"]
+        over_budget = costs["over_budget"]
+        budget_remaining = costs.get("budget_remaining")
         
         # Format products with costs
         products_breakdown = "\n".join([
@@ -118,25 +109,7 @@ Your task is to analyze spending and provide recommendations:
 4. Calculate value-for-money ratios
 5. Recommend budget allocation strategies
 
-Respond ONLY with valid JSON in this exact format:
-{
-    "cost_breakdown": {
-        "essential": 3000.00,
-        "recommended": 1500.00,
-        "optional": 500.50
-    },
-    "savings_opportunities": [
-        {
-            "item": "product name",
-            "current_cost": 1000.00,
-            "suggested_alternative": "alternative name",
-            "potential_savings": 200.00
-        }
-    ],
-    "recommendations": "Budget optimization advice",
-    "value_score": 0.85,
-    "savings_tips": ["tip 1", "tip 2"]
-}"""
+Record your analysis with the record_budget_analysis tool."""
 
         budget_context = f"Budget Limit: ${budget_max:.2f}" if budget_max else "Budget: Flexible"
         budget_alert = ""
@@ -158,32 +131,15 @@ Selected Products:
 Provide budget analysis and optimization recommendations."""
 
         try:
-            response_text = self._call_claude(system_prompt, user_message, temperature=0.3)
-            
-            # Parse JSON response
-            cleaned_response = response_text.strip()
-            if cleaned_response.startswith("```json"):
-                cleaned_response = cleaned_response.split("```json")[1].split("```")[0].strip()
-            elif cleaned_response.startswith("```"):
-                cleaned_response = cleaned_response.split("```")[1].split("```")[0].strip()
+            analysis = self._call_claude_structured(system_prompt, user_message, BudgetAnalysis, temperature=0.3)
+            budget_data = analysis.model_dump()
             
-            budget_data = json.loads(cleaned_response)
-            
-            # FIX: Always include these calculated fields
-            budget_data["subtotal"] = subtotal
-            budget_data["tax"] = tax
-            budget_data["shipping"] = shipping
-            budget_data["total"] = total_cost
-            budget_data["budget_max"] = budget_max  # ← CRITICAL: Include budget_max!
-            budget_data["budget_status"] = budget_status
-            budget_data["over_budget"] = over_budget
-            
-            if budget_max:
-                budget_data["budget_remaining"] = budget_remaining
-                budget_data["budget_utilization_percent"] = budget_utilization
+            # FIX: Always include these calculated fields (budget_max included!)
+            budget_data.update(costs)
             
             status = "OK" if not over_budget else "OVER BUDGET"
-            self.log_activity(f"{status} Budget analysis: ${total_cost:.2f} / ${budget_max:.2f if budget_max else 'unlimited'}")
+            budget_label = f"${budget_max:.2f}" if budget_max else "unlimited"
+            self.log_activity(f"{status} Budget analysis: ${total_cost:.2f} / {budget_label}")
             
             return AgentResponse(
                 agent_name=self.agent_name,
@@ -193,40 +149,24 @@ Provide budget analysis and optimization recommendations."""
                 confidence=budget_data.get("value_score", 0.85)
             )
             
-        except json.JSONDecodeError as e:
-            self.log_activity(f"JSON parsing failed, using basic budget summary")
+        except StructuredOutputError:
+            self.log_activity(f"Unusable budget answer, using basic budget summary")
+            self.record_fallback("invalid_output")
             # Fallback with all critical fields
-            budget_data = {
-                "subtotal": subtotal,
-                "tax": tax,
-                "shipping": shipping,
-                "total": total_cost,
-                "budget_max": budget_max,  # ← CRITICAL: Include in fallback too!
-                "budget_status": budget_status,
-                "over_budget": over_budget,
-                "cost_breakdown": {
-                    "essential": subtotal * 0.6,
-                    "recommended": subtotal * 0.3,
-                    "optional": subtotal * 0.1
-                },
-                "savings_opportunities": [],
-                "recommendations": "Budget tracking active. Consider prioritizing essential items if over budget.",
-                "value_score": 0.75,
-                "savings_tips": []
-            }
-            
-            if budget_max:
-                budget_data["budget_remaining"] = budget_remaining
-                budget_data["budget_utilization_percent"] = budget_utilization
-            
             return AgentResponse(
                 agent_name=self.agent_name,
                 success=True,
-                data=budget_data,
+                data=self._fallback_budget_data(costs),
                 reasoning="Basic budget analysis applied due to parsing error",
                 confidence=0.75
             )
         
+        except CircuitOpenError:
+            # Anthropic is known to be down - answer locally right away
+            self.log_activity("Anthropic circuit open, using local fallback")
+            self.record_fallback("circuit_open")
+            return self.fallback(context)
+        
         except Exception as e:
             self.log_activity(f"Budget analysis failed: {str(e)}")
             return AgentResponse(
@@ -236,6 +176,72 @@ Provide budget analysis and optimization recommendations."""
                 reasoning=f"Error: {str(e)}",
                 confidence=0.0
             )
+    
+    def _calculate_costs(self, selected_products: List[Dict], budget_max: Optional[float]) -> Dict[str, Any]:
+        """Subtotal, tax, shipping and budget status - pure arithmetic"""
+        TAX_RATE = 0.0825  # 8.25%
+        subtotal = sum(p.get("base_price", 0) for p in selected_products)
+        tax = subtotal * TAX_RATE
+        shipping = 0 if subtotal >= 1000 else 150
+        total_cost = subtotal + tax + shipping
+        
+        costs = {
+            "subtotal": subtotal,
+            "tax": tax,
+            "shipping": shipping,
+            "total": total_cost,
+            "budget_max": budget_max,  # ← CRITICAL: Include budget_max!
+        }
+        
+        # Determine budget status
+        if budget_max:
+            over_budget = total_cost > budget_max
+            costs["budget_status"] = "over_budget" if over_budget else "within_budget"
+            costs["over_budget"] = over_budget
+            costs["budget_remaining"] = budget_max - total_cost
+            costs["budget_utilization_percent"] = (total_cost / budget_max) * 100
+        else:
+            costs["budget_status"] = "no_budget_set"
+            costs["over_budget"] = False
+        
+        return costs
+    
+    def _fallback_budget_data(self, costs: Dict[str, Any]) -> Dict[str, Any]:
+        """Basic budget summary without LLM recommendations"""
+        subtotal = costs["subtotal"]
+        return {
+            **costs,  # ← CRITICAL: budget_max included in fallback too!
+            "cost_breakdown": {
+                "essential": subtotal * 0.6,
+                "recommended": subtotal * 0.3,
+                "optional": subtotal * 0.1
+            },
+            "savings_opportunities": [],
+            "recommendations": "Budget tracking active. Consider prioritizing essential items if over budget.",
+            "value_score": 0.75,
+            "savings_tips": []
+        }
+    
+    def fallback(self, context: Dict[str, Any]) -> AgentResponse:
+        """Arithmetic-only budget summary, no LLM call"""
+        selected_products = context.get("selected_products", [])
+        if not selected_products:
+            return AgentResponse(
+                agent_name=self.agent_name,
+                success=False,
+                data={},
+                reasoning="No products provided for budget analysis",
+                confidence=0.1
+            )
+        
+        costs = self._calculate_costs(selected_products, context.get("budget_max"))
+        return AgentResponse(
+            agent_name=self.agent_name,
+            success=True,
+            data=self._fallback_budget_data(costs),
+            reasoning="Basic budget analysis applied without an LLM call",
+            confidence=0.75
+        )
 
 
 # Create singleton
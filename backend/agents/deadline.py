@@ -0,0 +1,87 @@
+"""
+Request Deadlines
+Splits an overall latency budget across orchestration phases and tells
+LLM calls how much time they have left
+"""
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional
+
+
+# Share of the remaining budget each phase may use
+# Unused time from early phases rolls over to the later ones
+PHASE_BUDGET_SHARES: Dict[str, float] = {
+    "style": 0.15,
+    "product": 0.30,
+    "layout": 0.20,
+    "budget": 0.15,
+    "synthesis": 0.20
+}
+
+# Absolute (time.monotonic) expiry of the phase the current thread is working for
+_call_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("call_deadline", default=None)
+
+# Phase work runs here so the orchestrator can stop waiting on it
+_phase_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="phase")
+
+
+class PhaseTimeout(Exception):
+    """A phase did not finish inside its slice of the deadline"""
+
+
+class Deadline:
+    """Overall latency budget for one orchestration"""
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.expires_at = time.monotonic() + budget_ms / 1000.0
+
+    @classmethod
+    def from_ms(cls, budget_ms: Optional[float]) -> Optional["Deadline"]:
+        """None (no deadline) when budget_ms is not set"""
+        return cls(budget_ms) if budget_ms else None
+
+    def remaining(self) -> float:
+        """Seconds left, never negative"""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def phase_budget(self, phase: str, remaining_phases: List[str]) -> float:
+        """Seconds allotted to `phase` given the phases still to run (including it)"""
+        total_share = sum(PHASE_BUDGET_SHARES.get(p, 0.0) for p in remaining_phases) or 1.0
+        return self.remaining() * PHASE_BUDGET_SHARES.get(phase, 0.0) / total_share
+
+
+def remaining_call_time() -> Optional[float]:
+    """
+    Seconds left for an upstream call made from the current phase
+    None when no deadline applies
+    """
+    expires_at = _call_deadline.get()
+    if expires_at is None:
+        return None
+    return max(expires_at - time.monotonic(), 0.0)
+
+
+def _run_with_call_deadline(fn: Callable[[], Any], expires_at: float) -> Any:
+    token = _call_deadline.set(expires_at)
+    try:
+        return fn()
+    finally:
+        _call_deadline.reset(token)
+
+
+def run_with_timeout(fn: Callable[[], Any], timeout: float) -> Any:
+    """
+    Run fn in the phase pool and wait at most `timeout` seconds
+    Upstream calls inside fn see the same expiry through remaining_call_time(),
+    so an abandoned call is also cut off on the wire shortly after
+    """
+    expires_at = time.monotonic() + timeout
+    # Copy the context so tracing spans opened by fn join the caller's trace
+    future = _phase_executor.submit(contextvars.copy_context().run, _run_with_call_deadline, fn, expires_at)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        raise PhaseTimeout(f"Phase exceeded {timeout * 1000:.0f}ms")
@@ -0,0 +1,102 @@
+"""
+Hedged Requests
+Rolling latency histograms and a global cap on duplicate (hedge) calls
+
+A hedge fires when a call is still running at its agent's observed p95;
+the first response wins and the other one is cancelled
+"""
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from config import get_settings
+
+settings = get_settings()
+
+# Hedged calls and their duplicates run here
+hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+
+class HedgeCancelled(Exception):
+    """Raised inside a call that lost its race (a hedged pair or an abandoned raced phase)"""
+
+
+class LatencyHistogram:
+    """Latencies (seconds) of the most recent successful calls"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """None until enough samples exist to trust the estimate"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[index]
+
+    def get_stats(self) -> Dict[str, Any]:
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        with self._lock:
+            samples = len(self._samples)
+        return {
+            "samples": samples,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None
+        }
+
+
+class HedgeBudget:
+    """
+    Global hedge-rate cap shared by all agents
+    Every hedge-eligible call earns `max_ratio` credit and a hedge spends one,
+    so hedges can never exceed max_ratio of calls (plus a small burst)
+    """
+
+    def __init__(self, max_ratio: float, burst: float = 3.0):
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self._credits = 0.0
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.calls = 0
+        self.hedges = 0
+        self.denied = 0
+
+    def record_call(self):
+        with self._lock:
+            self.calls += 1
+            self._credits = min(self._credits + self.max_ratio, self.burst)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._credits >= 1.0:
+                self._credits -= 1.0
+                self.hedges += 1
+                return True
+            self.denied += 1
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_ratio": self.max_ratio,
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "denied": self.denied,
+                "hedge_rate": round(self.hedges / self.calls, 4) if self.calls else 0.0
+            }
+
+
+# Shared by every agent
+hedge_budget = HedgeBudget(settings.hedge_rate_cap)
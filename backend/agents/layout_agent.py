@@ -5,9 +5,10 @@ Provides spatial positioning data for placing products in the room
 Replace or enhance your existing layout_agent.py with this
 """
 from typing import Dict, Any, List
-import json
 
 from agents.base_agent import BaseAgent, AgentResponse
+from agents.schemas import LayoutPlan, StructuredOutputError
+from services.resilience import CircuitOpenError
 
 
 class LayoutAgent(BaseAgent):
@@ -18,6 +19,7 @@ class LayoutAgent(BaseAgent):
     
     def __init__(self):
         super().__init__(agent_name="LayoutOptimizer")
+        self.race_enabled = True  # fallback is cheap enough to race the LLM
     
     def process(self, context: Dict[str, Any]) -> AgentResponse:
         """
@@ -60,27 +62,7 @@ Your task is to determine the GEOMETRIC PLACEMENT of furniture in a room, provid
 3. Spatial relationships between items
 4. Traffic flow considerations
 
-Respond ONLY with valid JSON in this exact format:
-{
-    "product_placements": [
-        {
-            "product_index": 0,
-            "product_name": "name",
-            "position": {
-                "x_percent": 25,
-                "y_percent": 60,
-                "width_percent": 30,
-                "height_percent": 35
-            },
-            "placement_zone": "center-left|center|right|etc",
-            "reasoning": "why this position is optimal"
-        }
-    ],
-    "focal_point": "description of room's focal point",
-    "traffic_flow": "description of movement paths",
-    "spatial_balance": 0.88,
-    "layout_reasoning": "overall layout strategy"
-}
+Record the layout with the record_layout_plan tool, one placement per product.
 
 COORDINATE SYSTEM:
 - (0, 0) = top-left of room
@@ -110,16 +92,8 @@ Provide geometric coordinates (X, Y, Width, Height as percentages) for each prod
 that creates a balanced, functional, and aesthetically pleasing room layout."""
 
         try:
-            response_text = self._call_claude(system_prompt, user_message, temperature=0.3)
-            
-            # Parse JSON response
-            cleaned_response = response_text.strip()
-            if cleaned_response.startswith("```json"):
-                cleaned_response = cleaned_response.split("```json")[1].split("```")[0].strip()
-            elif cleaned_response.startswith("```"):
-                cleaned_response = cleaned_response.split("```")[1].split("```")[0].strip()
-            
-            layout_data = json.loads(cleaned_response)
+            plan = self._call_claude_structured(system_prompt, user_message, LayoutPlan, temperature=0.3)
+            layout_data = plan.model_dump()
             
             # Enrich placements with product details
             enriched_placements = []
@@ -144,19 +118,18 @@ that creates a balanced, functional, and aesthetically pleasing room layout."""
                 confidence=layout_data.get("spatial_balance", 0.85)
             )
             
-        except json.JSONDecodeError as e:
-            self.log_activity(f"JSON parsing failed, using default layout")
+        except StructuredOutputError:
+            self.log_activity(f"Unusable layout answer, using default layout")
+            self.record_fallback("invalid_output")
             
             # Fallback: Default geometric layout
-            default_layout = self._create_default_layout(products, room_type)
-            
-            return AgentResponse(
-                agent_name=self.agent_name,
-                success=True,
-                data=default_layout,
-                reasoning="Using default geometric layout template",
-                confidence=0.7
-            )
+            return self._default_layout_response(products, room_type)
+        
+        except CircuitOpenError:
+            # Anthropic is known to be down - answer locally right away
+            self.log_activity("Anthropic circuit open, using local fallback")
+            self.record_fallback("circuit_open")
+            return self.fallback(context)
         
         except Exception as e:
             self.log_activity(f"Layout planning failed: {str(e)}")
@@ -168,6 +141,23 @@ that creates a balanced, functional, and aesthetically pleasing room layout."""
                 confidence=0.0
             )
     
+    def fallback(self, context: Dict[str, Any]) -> AgentResponse:
+        """Category-based default layout, no LLM call"""
+        return self._default_layout_response(
+            context.get("selected_products", []),
+            context.get("room_type", "living_room")
+        )
+    
+    def _default_layout_response(self, products: List[Dict], room_type: str) -> AgentResponse:
+        """Wrap the default geometric layout as an agent response"""
+        return AgentResponse(
+            agent_name=self.agent_name,
+            success=True,
+            data=self._create_default_layout(products, room_type),
+            reasoning="Using default geometric layout template",
+            confidence=0.7
+        )
+    
     def _create_default_layout(self, products: List[Dict], room_type: str) -> Dict:
         """
         Fallback: Create sensible default layout based on product categories
@@ -0,0 +1,118 @@
+"""
+Model Routing
+Picks the model for each Claude call from the time left before the
+deadline, the queue in front of each model and its observed latency
+
+Every task has an ordered list of tiers it may use (config route_*),
+preferred first. The first tier that is neither backed up nor too slow
+for the remaining time wins, so Opus is only used with headroom to spare
+and busy or late requests step down to a faster model.
+"""
+import threading
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from config import get_settings
+from agents.deadline import remaining_call_time
+from agents.hedging import LatencyHistogram
+from services.rate_limiter import anthropic_limiter
+
+settings = get_settings()
+
+TIERS = ("small", "medium", "large")
+
+
+def parse_route(route: str) -> List[str]:
+    """'large,medium' -> ['large', 'medium'], ignoring unknown tiers"""
+    tiers = [tier.strip() for tier in route.split(",")]
+    return [tier for tier in tiers if tier in TIERS]
+
+
+class ModelRouter:
+    """Chooses a model per call and keeps per-model latency and decision counts"""
+
+    def __init__(self):
+        self.enabled = settings.routing_enabled
+        self.models = {
+            "small": settings.tier_small_model,
+            "medium": settings.tier_medium_model,
+            "large": settings.tier_large_model
+        }
+        self.max_queue_depth = settings.routing_max_queue_depth
+        self.headroom_factor = settings.routing_headroom_factor
+
+        self._lock = threading.Lock()
+        self._latency: Dict[str, LatencyHistogram] = {}
+
+        # Metrics: task -> model -> calls, and why preferred tiers were skipped
+        self.decisions: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.skipped: Dict[str, int] = defaultdict(int)
+
+    def latency(self, model: str) -> LatencyHistogram:
+        with self._lock:
+            if model not in self._latency:
+                self._latency[model] = LatencyHistogram(min_samples=settings.routing_min_samples)
+            return self._latency[model]
+
+    def record_latency(self, model: str, seconds: float):
+        """Feed back the duration of a finished call"""
+        self.latency(model).record(seconds)
+
+    def _skip_reason(self, model: str, remaining: Optional[float]) -> Optional[str]:
+        """Why this model shouldn't take the call right now, or None"""
+        if anthropic_limiter(model).queue_depth() >= self.max_queue_depth:
+            return "load"
+        if remaining is not None:
+            p95 = self.latency(model).percentile(95)
+            if p95 is not None and p95 * self.headroom_factor > remaining:
+                return "deadline"
+        return None
+
+    def choose(self, task: str, route: str) -> str:
+        """
+        Model for one call of `task`, given its route (e.g. "large,medium,small")
+        Falls back to the last (fastest) tier when every tier is constrained
+        """
+        tiers = parse_route(route) or ["medium"]
+        if not self.enabled:
+            model = self.models[tiers[0]]
+        else:
+            remaining = remaining_call_time()
+            model = None
+            for tier in tiers:
+                candidate = self.models[tier]
+                reason = self._skip_reason(candidate, remaining)
+                if reason is None:
+                    model = candidate
+                    break
+                with self._lock:
+                    self.skipped[f"{tier}:{reason}"] += 1
+            if model is None:
+                model = self.models[tiers[-1]]
+
+        with self._lock:
+            self.decisions[task][model] += 1
+        return model
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            decisions = {task: dict(models) for task, models in self.decisions.items()}
+            skipped = dict(self.skipped)
+            models = list(self._latency)
+        return {
+            "enabled": self.enabled,
+            "tiers": dict(self.models),
+            "decisions": decisions,
+            "skipped": skipped,
+            "models": {
+                model: {
+                    "queue_depth": anthropic_limiter(model).queue_depth(),
+                    **self.latency(model).get_stats()
+                }
+                for model in models
+            }
+        }
+
+
+# Create singleton
+model_router = ModelRouter()
@@ -3,15 +3,30 @@ Orchestrator Agent
 Lead coordinator that manages worker agents and synthesizes their outputs
 Uses Claude Opus 4 with extended thinking for complex multi-step reasoning
 """
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Callable
 import json
-from anthropic import Anthropic
+import threading
+import time
+import uuid
+from concurrent.futures import Future
 
 from agents.base_agent import BaseAgent, AgentResponse
 from agents.style_agent import style_agent
 from agents.product_agent import product_agent
 from agents.layout_agent import layout_agent
 from agents.budget_agent import budget_agent
+from agents.deadline import Deadline, PhaseTimeout, run_with_timeout, remaining_call_time, PHASE_BUDGET_SHARES
+from services.single_flight import SingleFlight, style_context_key
+from services.design_updates import design_updates
+from services.rate_limiter import anthropic_limiter, estimate_tokens
+from services.resilience import call_with_retry
+from services.http_clients import clients
+from services.prompt_cache import controlnet_prompt_cache, controlnet_scene_key
+from services.metrics import agent_fallbacks, llm_latency, llm_requests
+from services.tracing import span
+from services.structured_logging import get_logger
+from agents.usage import TimeToFirstToken, TokenUsageStats, record_call_metrics
+from agents.model_router import model_router
 
 from config import get_settings
 
@@ -25,10 +40,17 @@ class OrchestratorAgent:
     Uses Claude Opus 4 for deep reasoning
     """
     
-    def __init__(self):
+    def __init__(self, client=None):
         self.agent_name = "LeadOrchestrator"
-        self.client = Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-        self.model = "claude-opus-4-20250514"  # Opus for orchestrator's deep reasoning
+        self.logger = get_logger(f"agents.{self.agent_name}")
+        # Shares the workers' pooled client (injectable for tests),
+        # resolved on first call
+        self._client = client
+        self.model = settings.tier_large_model  # Opus for orchestrator's deep reasoning
+        # ControlNet prompts step down from Opus under load or near the deadline
+        self.controlnet_route = settings.route_controlnet_prompt
+        self.usage = TokenUsageStats()
+        self.ttft = TimeToFirstToken(self.agent_name)
         
         # Register worker agents
         self.workers = {
@@ -38,11 +60,21 @@ class OrchestratorAgent:
             "budget": budget_agent
         }
     
+    @property
+    def client(self):
+        """Anthropic client, created on first use"""
+        if self._client is None:
+            self._client = clients.anthropic()
+        return self._client
+    
     def orchestrate_design(
         self,
         user_request: Dict[str, Any],
         control_image_url: str,
-        available_products: List[Dict[str, Any]]
+        available_products: List[Dict[str, Any]],
+        style_memo: Optional[SingleFlight] = None,
+        deadline_ms: Optional[float] = None,
+        race_grace_ms: Optional[float] = None
     ) -> Dict[str, Any]:
         """
         Main orchestration method
@@ -52,6 +84,13 @@ class OrchestratorAgent:
             user_request: User's design requirements
             control_image_url: URL of the constraint sketch/image
             available_products: Furniture items from PKG
+            style_memo: Optional shared memo so identical style analyses
+                        (e.g. within a batch) are computed only once
+            deadline_ms: Optional overall latency budget; each phase gets a
+                         slice and falls back to its local answer when late
+            race_grace_ms: Optional grace window for agents that race their
+                           local answer against the LLM (product, layout);
+                           late LLM answers are published as design updates
         
         Returns:
             Complete design specification with agent outputs
@@ -68,6 +107,15 @@ class OrchestratorAgent:
         # Storage for agent results
         agent_results = {}
         
+        # Latency budget (None = unbounded) and phases that had to fall back
+        deadline = Deadline.from_ms(deadline_ms)
+        degraded_phases = []
+        
+        # Raced phases answered locally; their LLM results arrive as updates
+        design_id = str(uuid.uuid4())
+        raced_phases = []
+        race = {"grace_ms": race_grace_ms, "design_id": design_id, "raced_phases": raced_phases}
+        
         try:
             # ============================================
             # PHASE 1: Style Analysis
@@ -81,7 +129,19 @@ class OrchestratorAgent:
                 "style_preferences": style_preferences
             }
             
-            style_response = self.workers["style"].process(style_context)
+            if style_memo is not None:
+                run_style = lambda: style_memo.do(
+                    style_context_key(style_context),
+                    self.workers["style"].process,
+                    style_context
+                )
+            else:
+                run_style = lambda: self.workers["style"].process(style_context)
+            
+            style_response = self._run_phase(
+                "style", run_style, lambda: self.workers["style"].fallback(style_context),
+                deadline, degraded_phases
+            )
             agent_results["style"] = style_response
             
             if not style_response.success:
@@ -100,7 +160,7 @@ class OrchestratorAgent:
                 "budget_max": budget_max
             }
             
-            product_response = self.workers["product"].process(product_context)
+            product_response = self._run_worker_phase("product", product_context, deadline, degraded_phases, **race)
             agent_results["product"] = product_response
             
             if not product_response.success:
@@ -121,7 +181,7 @@ class OrchestratorAgent:
                 "style_data": style_response.data
             }
             
-            layout_response = self.workers["layout"].process(layout_context)
+            layout_response = self._run_worker_phase("layout", layout_context, deadline, degraded_phases, **race)
             agent_results["layout"] = layout_response
             
             # ============================================
@@ -135,7 +195,7 @@ class OrchestratorAgent:
                 "available_products": available_products
             }
             
-            budget_response = self.workers["budget"].process(budget_context)
+            budget_response = self._run_worker_phase("budget", budget_context, deadline, degraded_phases)
             agent_results["budget"] = budget_response
             
             # ============================================
@@ -146,9 +206,16 @@ class OrchestratorAgent:
             final_design = self._synthesize_outputs(
                 agent_results=agent_results,
                 control_image_url=control_image_url,
-                user_request=user_request
+                user_request=user_request,
+                deadline=deadline,
+                degraded_phases=degraded_phases
             )
+            final_design["degraded_phases"] = degraded_phases
+            final_design["design_id"] = design_id
+            final_design["raced_phases"] = list(raced_phases)
             
+            if degraded_phases:
+                self.log_activity(f"Degraded phases (deadline): {', '.join(degraded_phases)}")
             self.log_activity("Design orchestration complete!")
             
             return final_design
@@ -159,14 +226,157 @@ class OrchestratorAgent:
             return {
                 "success": False,
                 "error": str(e),
-                "partial_results": agent_results
+                "partial_results": agent_results,
+                "degraded_phases": degraded_phases
+            }
+    
+    def _run_phase(
+        self,
+        phase: str,
+        run: Callable[[], Any],
+        fallback: Callable[[], Any],
+        deadline: Optional[Deadline],
+        degraded_phases: List[str]
+    ) -> Any:
+        """
+        Run one phase inside its slice of the deadline
+        Without a deadline this is just run(); when the slice runs out the
+        phase's local fallback is used and the phase is marked degraded
+        """
+        with span(f"phase.{phase}") as phase_span:
+            result = self._run_phase_in_slice(phase, run, fallback, deadline, degraded_phases)
+            if phase_span is not None:
+                phase_span.set(degraded=phase in degraded_phases)
+            return result
+    
+    def _run_phase_in_slice(
+        self,
+        phase: str,
+        run: Callable[[], Any],
+        fallback: Callable[[], Any],
+        deadline: Optional[Deadline],
+        degraded_phases: List[str]
+    ) -> Any:
+        """_run_phase body: the phase's deadline slice and fallback handling"""
+        if deadline is None:
+            return run()
+        
+        remaining_phases = list(PHASE_BUDGET_SHARES)[list(PHASE_BUDGET_SHARES).index(phase):]
+        budget_s = deadline.phase_budget(phase, remaining_phases)
+        
+        phase_expires_at = time.monotonic() + budget_s
+        
+        try:
+            result = run_with_timeout(run, budget_s)
+        except PhaseTimeout:
+            self.log_activity(f"Phase '{phase}' exceeded its {budget_s * 1000:.0f}ms slice, using local fallback")
+            degraded_phases.append(phase)
+            self._record_phase_fallback(phase)
+            return fallback()
+        
+        # A call cut off on the wire surfaces as a failed response rather than a timeout
+        slice_used_up = time.monotonic() >= phase_expires_at - 0.05
+        if isinstance(result, AgentResponse) and not result.success and slice_used_up:
+            self.log_activity(f"Phase '{phase}' failed at the deadline, using local fallback")
+            degraded_phases.append(phase)
+            self._record_phase_fallback(phase)
+            return fallback()
+        
+        return result
+    
+    def _record_phase_fallback(self, phase: str):
+        """Count a phase answered locally because its deadline slice ran out"""
+        agent = self.workers[phase].agent_name if phase in self.workers else self.agent_name
+        agent_fallbacks.inc(agent, "deadline")
+    
+    def _run_worker_phase(
+        self,
+        phase: str,
+        context: Dict[str, Any],
+        deadline: Optional[Deadline],
+        degraded_phases: List[str],
+        grace_ms: Optional[float] = None,
+        design_id: Optional[str] = None,
+        raced_phases: Optional[List[str]] = None
+    ) -> AgentResponse:
+        """
+        _run_phase for a worker agent's process / fallback pair
+        With a grace window, race-capable agents return their local answer
+        if the LLM is late and publish the LLM answer once it lands
+        """
+        worker = self.workers[phase]
+        
+        if not (grace_ms and worker.race_enabled):
+            return self._run_phase(phase, lambda: worker.process(context), lambda: worker.fallback(context), deadline, degraded_phases)
+        
+        # run() may still be going in the phase pool after the deadline
+        # slice gave up on it, so it only hands its late LLM path over here;
+        # raced_phases is only ever touched by this (the orchestrating) thread
+        slot_lock = threading.Lock()
+        slot = {"late": None, "closed": False}
+        
+        def run():
+            response, late = worker.process_with_race(context, grace_ms / 1000.0)
+            if late is not None:
+                with slot_lock:
+                    if slot["closed"]:
+                        late.cancel()
+                    else:
+                        slot["late"] = late
+            return response
+        
+        response = self._run_phase(phase, run, lambda: worker.fallback(context), deadline, degraded_phases)
+        
+        with slot_lock:
+            slot["closed"] = True
+            late = slot["late"]
+        if late is not None:
+            if phase in degraded_phases:
+                # Answered by the deadline fallback; nobody will read the LLM result
+                late.cancel()
+            else:
+                raced_phases.append(phase)
+                design_updates.expect(design_id, phase)
+                late.future.add_done_callback(
+                    lambda future: self._publish_late_result(design_id, phase, future)
+                )
+        return response
+    
+    def get_usage_stats(self) -> Dict[str, Any]:
+        """Token and prompt-cache usage per agent, with structured-output outcomes and TTFT per call mode"""
+        stats = {
+            worker.agent_name: {
+                **worker.usage.get_stats(),
+                "structured_outputs": dict(worker.output_stats),
+                "ttft": worker.ttft.get_stats()
             }
+            for worker in self.workers.values()
+        }
+        stats[self.agent_name] = {**self.usage.get_stats(), "ttft": self.ttft.get_stats()}
+        return stats
+    
+    def _publish_late_result(self, design_id: str, phase: str, future: Future):
+        """Hand a raced phase's LLM answer to the design update channel"""
+        response = future.result() if future.exception() is None else None
+        if response is None or not response.success:
+            self.log_activity(f"Late '{phase}' LLM result failed, local answer stands")
+            design_updates.publish(design_id, phase, None)
+            return
+        
+        self.log_activity(f"Late '{phase}' LLM result published for design {design_id}")
+        design_updates.publish(design_id, phase, {
+            "data": response.data,
+            "reasoning": response.reasoning,
+            "confidence": response.confidence
+        })
     
     def _synthesize_outputs(
         self,
         agent_results: Dict[str, AgentResponse],
         control_image_url: str,
-        user_request: Dict[str, Any]
+        user_request: Dict[str, Any],
+        deadline: Optional[Deadline] = None,
+        degraded_phases: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """
         Synthesize all agent outputs into final design recommendation
@@ -193,12 +403,19 @@ class OrchestratorAgent:
         
         selected_products = product_data.get("selected_products", [])
         
-        # Generate ControlNet prompt using Opus
-        controlnet_prompt = self._generate_controlnet_prompt(
-            style_data=style_data,
-            selected_products=selected_products,
-            layout_data=layout_data,
-            user_request=user_request
+        # Generate ControlNet prompt using Opus (template if out of time)
+        prompt_inputs = {
+            "style_data": style_data,
+            "selected_products": selected_products,
+            "layout_data": layout_data,
+            "user_request": user_request
+        }
+        controlnet_prompt = self._run_phase(
+            "synthesis",
+            lambda: self._generate_controlnet_prompt(**prompt_inputs),
+            lambda: self._template_controlnet_prompt(**prompt_inputs),
+            deadline,
+            degraded_phases if degraded_phases is not None else []
         )
         
         # Assemble final response
@@ -257,6 +474,23 @@ class OrchestratorAgent:
         
         room_type = user_request.get("room_type", "living room")
         
+        # Reuse the description of a scene seen before: as-is for the same
+        # products, with the new product names spliced in otherwise
+        scene = controlnet_scene_key(
+            room_type, primary_style, mood,
+            style_data.get("color_palette", ["neutral tones"]),
+            style_data.get("materials", ["mixed materials"]),
+            focal_point
+        )
+        cached_prompt, outcome = controlnet_prompt_cache.lookup(scene, product_names)
+        if cached_prompt is not None:
+            self.log_activity(f"ControlNet prompt reused from cache ({outcome})")
+            return cached_prompt
+        if outcome == "near_miss":
+            # Known scene whose text can't take these products: not worth an Opus call
+            agent_fallbacks.inc(self.agent_name, "prompt_cache_near_miss")
+            return self._template_controlnet_prompt(style_data, selected_products, layout_data, user_request)
+        
         # Use Claude Opus to generate refined prompt
         system_prompt = """You are an expert at writing photorealistic scene descriptions for image generation models.
 
@@ -282,21 +516,73 @@ Featured Products: {', '.join(product_names)}
 
 Create a vivid, detailed scene description."""
 
+        request_kwargs = {}
+        timeout = remaining_call_time()
+        if timeout is not None:
+            request_kwargs["timeout"] = max(timeout, 0.001)
+        
+        model = model_router.choose("controlnet_prompt", self.controlnet_route)
+        
+        def send():
+            with span("llm.call", agent=self.agent_name, model=model) as trace_span, anthropic_limiter(model).limit(
+                tokens=estimate_tokens(system_prompt, user_message) + 500,
+                timeout=request_kwargs.get("timeout")
+            ) as lease:
+                start = time.monotonic()
+                try:
+                    response = self.client.messages.create(
+                        model=model,
+                        max_tokens=500,
+                        temperature=0.7,
+                        system=system_prompt,
+                        messages=[{"role": "user", "content": user_message}],
+                        **request_kwargs
+                    )
+                except Exception:
+                    llm_requests.inc(self.agent_name, model, "error")
+                    raise
+                elapsed = time.monotonic() - start
+                self.ttft.record(elapsed, model, "full")
+                model_router.record_latency(model, elapsed)
+                llm_requests.inc(self.agent_name, model, "ok")
+                llm_latency.observe(elapsed, self.agent_name, model)
+                lease.settle(self.usage.record(response.usage))
+                record_call_metrics(self.agent_name, model, response.usage)
+                if trace_span is not None:
+                    trace_span.set(input_tokens=response.usage.input_tokens, output_tokens=response.usage.output_tokens)
+            return response
+        
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=500,
-                temperature=0.7,
-                system=system_prompt,
-                messages=[{"role": "user", "content": user_message}]
-            )
+            expires_at = time.monotonic() + timeout if timeout is not None else None
+            response = call_with_retry("anthropic", send, expires_at=expires_at)
             
-            return response.content[0].text.strip()
+            prompt = response.content[0].text.strip()
+            controlnet_prompt_cache.put(scene, product_names, prompt)
+            return prompt
             
         except Exception as e:
-            self.log_activity(f"Opus prompt generation failed, using template")
+            self.log_activity(f"{model} prompt generation failed, using template")
+            agent_fallbacks.inc(self.agent_name, "error")
             # Fallback template
-            return f"A beautifully designed {primary_style} {room_type} with {mood} atmosphere, featuring {', '.join(product_names)}. The space is bathed in warm natural light with {colors} color palette. Materials include {materials}, creating elegant harmony. {focal_point} serves as the visual anchor. Professional interior photography, high-end residential design, architectural digest quality."
+            return self._template_controlnet_prompt(style_data, selected_products, layout_data, user_request)
+    
+    def _template_controlnet_prompt(
+        self,
+        style_data: Dict[str, Any],
+        selected_products: List[Dict[str, Any]],
+        layout_data: Dict[str, Any],
+        user_request: Dict[str, Any]
+    ) -> str:
+        """Local ControlNet prompt template (no API call)"""
+        primary_style = style_data.get("primary_style", "modern")
+        mood = style_data.get("mood", "comfortable")
+        colors = ", ".join(style_data.get("color_palette", ["neutral tones"]))
+        materials = ", ".join(style_data.get("materials", ["mixed materials"]))
+        product_names = [p.get("name", "furniture piece") for p in selected_products[:5]]
+        focal_point = layout_data.get("focal_point", "natural lighting")
+        room_type = user_request.get("room_type", "living room")
+        
+        return f"A beautifully designed {primary_style} {room_type} with {mood} atmosphere, featuring {', '.join(product_names)}. The space is bathed in warm natural light with {colors} color palette. Materials include {materials}, creating elegant harmony. {focal_point} serves as the visual anchor. Professional interior photography, high-end residential design, architectural digest quality."
     
     def _generate_negative_prompt(self, style_data: Dict[str, Any]) -> str:
         """Generate negative prompt for ControlNet"""
@@ -317,7 +603,7 @@ Create a vivid, detailed scene description."""
     
     def log_activity(self, message: str):
         """Log orchestrator activity"""
-        print(f"[{self.agent_name}] {message}")
+        self.logger.info(message)
 
 
 # Create singleton
@@ -7,13 +7,24 @@ Budget enforcement works
 
 Unique images (Replicate AI or Unsplash fallback)
 """
-from typing import Dict, Any, List
-import json
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+import contextvars
+import threading
 import urllib.parse
 import hashlib
 import os
 
-from agents.base_agent import BaseAgent, AgentResponse
+from agents.base_agent import BaseAgent, AgentResponse, race_cancelled
+from agents.schemas import ProductSelection, SelectedProduct, StructuredOutputError
+from services.resilience import CircuitOpenError, call_with_retry
+from services.rate_limiter import replicate_limiter
+from services.http_clients import clients
+from services.metrics import track_upstream
+
+# Product enrichment (AI image generation) starts here as soon as each
+# selected product is streamed, while Claude is still writing the rest
+_enrich_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="enrich")
 
 
 class ProductAgent(BaseAgent):
@@ -23,6 +34,7 @@ class ProductAgent(BaseAgent):
     
     def __init__(self):
         super().__init__(agent_name="ProductRecommender")
+        self.race_enabled = True  # fallback is cheap enough to race the LLM
     
     def _get_unique_image_url(self, product_name: str, category: str) -> str:
         """
@@ -64,6 +76,20 @@ class ProductAgent(BaseAgent):
         # CRITICAL: Use source.unsplash.com to bypass CORB
         return f"https://source.unsplash.com/800x600/?{encoded_query}&sig={product_hash}"
     
+    def _usable_budget(self, budget_max: Optional[float]) -> Optional[float]:
+        """Product subtotal allowed once tax & shipping are reserved"""
+        TAX_RATE = 0.0825
+        SHIPPING_THRESHOLD = 1000
+        
+        if not budget_max:
+            return None
+        
+        # Reserve budget for tax and potentially shipping
+        usable_budget = budget_max / (1 + TAX_RATE)
+        if usable_budget < SHIPPING_THRESHOLD:
+            usable_budget -= 150  # Reserve $150 for shipping
+        return usable_budget
+    
     def _get_purchase_url(self, product_name: str) -> str:
         """Generate purchase URL"""
         encoded_name = urllib.parse.quote(product_name)
@@ -76,24 +102,26 @@ class ProductAgent(BaseAgent):
         Properly handles FileOutput/generator objects
         """
         try:
-            import replicate
-            
             self.log_activity(f"Generating AI image for: {product_name}")
             
-            # Run Stable Diffusion XL
-            output = replicate.run(
-                "stability-ai/sdxl:39ed52f2a78e934b3ba6e2a89f5b1c712de7dfea535525255b1aa35c5565e08b",
-                input={
-                    "prompt": f"professional product photography of {prompt}, white background, studio lighting, high quality, 4k, sharp focus",
-                    "negative_prompt": "blurry, low quality, distorted, text, watermark, logo, hands, people",
-                    "width": 800,
-                    "height": 600,
-                    "num_outputs": 1,
-                    "scheduler": "K_EULER",
-                    "num_inference_steps": 30,
-                    "guidance_scale": 7.5
-                }
-            )
+            # Run Stable Diffusion XL (retried on transient errors, skipped while circuit is open)
+            def run_sdxl():
+                with replicate_limiter.limit(), track_upstream("replicate", "sdxl"):
+                    return clients.replicate().run(
+                        "stability-ai/sdxl:39ed52f2a78e934b3ba6e2a89f5b1c712de7dfea535525255b1aa35c5565e08b",
+                        input={
+                            "prompt": f"professional product photography of {prompt}, white background, studio lighting, high quality, 4k, sharp focus",
+                            "negative_prompt": "blurry, low quality, distorted, text, watermark, logo, hands, people",
+                            "width": 800,
+                            "height": 600,
+                            "num_outputs": 1,
+                            "scheduler": "K_EULER",
+                            "num_inference_steps": 30,
+                            "guidance_scale": 7.5
+                        }
+                    )
+            
+            output = call_with_retry("replicate", run_sdxl)
             
             # 
             # FIX: Handle Replicate's different output types
@@ -137,6 +165,40 @@ class ProductAgent(BaseAgent):
             self.log_activity(f"Image generation failed: {str(e)}")
             raise  # Re-raise to trigger fallback
         
+    def _enrich_product(self, product: Dict[str, Any], use_ai_images: bool) -> Dict[str, Any]:
+        """Copy of a PKG product with its image and purchase URLs"""
+        full_product = product.copy()
+        
+        # 
+        # Try AI image generation, fall back to Unsplash
+        # (not for a raced LLM path that was abandoned: nobody will see it)
+        if use_ai_images and not race_cancelled():
+            try:
+                product_prompt = f"{full_product.get('name', 'furniture')}, {full_product.get('material', '')}, {full_product.get('category', 'furniture')}"
+                ai_image_url = self._generate_ai_image(product_prompt, full_product.get('name', 'furniture'))
+                full_product["image_url"] = ai_image_url
+                full_product["image_source"] = "ai_generated"
+            except Exception as e:
+                # Fall back to Unsplash
+                self.log_activity(f"⚠️ AI image failed, using Unsplash fallback")
+                full_product["image_url"] = self._get_unique_image_url(
+                    full_product.get("name", "furniture"),
+                    full_product.get("category", "furniture")
+                )
+                full_product["image_source"] = "unsplash_fallback"
+        else:
+            # Use Unsplash directly
+            full_product["image_url"] = self._get_unique_image_url(
+                full_product.get("name", "furniture"),
+                full_product.get("category", "furniture")
+            )
+            full_product["image_source"] = "unsplash"
+        
+        full_product["purchase_url"] = self._get_purchase_url(
+            full_product.get("name", "furniture")
+        )
+        return full_product
+    
     def process(self, context: Dict[str, Any]) -> AgentResponse:
         """Select products with STRICT BUDGET ENFORCEMENT"""
         
@@ -162,18 +224,11 @@ class ProductAgent(BaseAgent):
         
         # 
         # FIX: Calculate usable budget (reserve for tax & shipping)
-        TAX_RATE = 0.0825
-        SHIPPING_THRESHOLD = 1000
+        usable_budget = self._usable_budget(budget_max)
         
         if budget_max:
-            # Reserve budget for tax and potentially shipping
-            usable_budget = budget_max / (1 + TAX_RATE)
-            if usable_budget < SHIPPING_THRESHOLD:
-                usable_budget -= 150  # Reserve $150 for shipping
-            
             self.log_activity(f"Budget: ${budget_max:.2f} total → ${usable_budget:.2f} for products")
         else:
-            usable_budget = None
             self.log_activity("No budget constraint")
         
         # 
@@ -188,11 +243,16 @@ class ProductAgent(BaseAgent):
             for i, p in enumerate(available_products)
         ])
         
-        # 
-        # FIX: Enhanced system prompt with BUDGET ENFORCEMENT
-        system_prompt = f"""You are an expert furniture curator with ABSOLUTE BUDGET DISCIPLINE.
+        # Static instructions: identical on every call
+        system_prompt = """You are an expert furniture curator with ABSOLUTE BUDGET DISCIPLINE.
 
-CRITICAL RULES:
+Refer to products by their index in the Available Products list.
+Record your selection with the record_product_selection tool."""
+
+        # 
+        # FIX: Enhanced budget rules with BUDGET ENFORCEMENT
+        # (request-specific, so sent after the static instructions)
+        budget_rules = f"""CRITICAL RULES:
 {"1. MAXIMUM PRODUCT SUBTOTAL: $" + f"{usable_budget:.2f}" if usable_budget else "1. No budget limit"}
 {"2. You MUST select products where SUM of base_price is UNDER this limit" if usable_budget else ""}
 {"3. Tax (8.25%) and shipping will be added later, so stay WELL UNDER!" if usable_budget else ""}
@@ -203,22 +263,7 @@ BUDGET STRATEGY:
 {"- COMFORTABLE BUDGET (>$2000): Select 5-7 items for complete design" if not usable_budget or usable_budget >= 1800 else ""}
 
 PRODUCT POOL SIZE: {len(available_products)} products available
-{"LIMITED OPTIONS: Work with what's available, prioritize essentials" if len(available_products) < 5 else ""}
-
-Respond ONLY with valid JSON:
-{{
-    "selected_products": [
-        {{
-            "product_index": 0,
-            "product_name": "name",
-            "selection_reason": "why chosen",
-            "priority": "essential|recommended|optional"
-        }}
-    ],
-    "total_estimated_cost": 350.00,
-    "style_coherence_score": 0.92,
-    "reasoning": "Overall selection strategy"
-}}"""
+{"LIMITED OPTIONS: Work with what's available, prioritize essentials" if len(available_products) < 5 else ""}"""
 
         style_summary = f"""Style Preferences:
 - Primary: {style_data.get('primary_style', 'modern')}
@@ -245,76 +290,78 @@ Available Products:
 
 {"SELECT ONLY PRODUCTS THAT FIT BUDGET!" if budget_max else "Select best products for coherent design."}"""
 
+        # Check if Replicate is configured
+        replicate_token = os.getenv("REPLICATE_API_TOKEN")
+        use_ai_images = replicate_token is not None and replicate_token.strip() != ""
+        
+        if use_ai_images:
+            self.log_activity("DEBUG: Replicate API token found: Yes")
+        else:
+            self.log_activity("DEBUG: No Replicate token, using Unsplash")
+        
+        # Enrichment per product index. Without a budget every selection is
+        # kept, so enrichment (paid AI images) starts as each one streams in;
+        # with a budget it waits for the budget-filtered final selection
+        enrichments: Dict[int, Future] = {}
+        enrich_lock = threading.Lock()
+        
+        def start_enrichment(selection: Dict[str, Any]):
+            idx = selection.get("product_index")
+            if not isinstance(idx, int) or not 0 <= idx < len(available_products):
+                return
+            with enrich_lock:
+                if idx in enrichments:
+                    return
+                enrichments[idx] = _enrich_executor.submit(
+                    contextvars.copy_context().run,
+                    self._enrich_product, available_products[idx], use_ai_images
+                )
+        
+        def on_selected(item: Any):
+            try:
+                start_enrichment(SelectedProduct.model_validate(item).model_dump())
+            except Exception:
+                pass  # left to the validated (and repaired) final answer
+        
         try:
-            response_text = self._call_claude(system_prompt, user_message, temperature=0.4)
-            
-            # Parse JSON
-            cleaned_response = response_text.strip()
-            if cleaned_response.startswith("```json"):
-                cleaned_response = cleaned_response.split("```json")[1].split("```")[0].strip()
-            elif cleaned_response.startswith("```"):
-                cleaned_response = cleaned_response.split("```")[1].split("```")[0].strip()
-            
-            product_data = json.loads(cleaned_response)
-            
-            # Check if Replicate is configured
-            replicate_token = os.getenv("REPLICATE_API_TOKEN")
-            use_ai_images = replicate_token is not None and replicate_token.strip() != ""
+            selection = self._call_claude_structured(
+                system_prompt, user_message, ProductSelection, temperature=0.4, dynamic_system=budget_rules,
+                stream_key="selected_products", on_item=on_selected if usable_budget is None else None
+            )
+            product_data = selection.model_dump()
             
-            if use_ai_images:
-                self.log_activity("DEBUG: Replicate API token found: Yes")
-            else:
-                self.log_activity("DEBUG: No Replicate token, using Unsplash")
-            
-            # Enrich products with full details + images
-            selected_products = []
-            actual_total = 0
+            if enrichments:
+                self.log_activity(f"{len(enrichments)} products were already being enriched while streaming")
             
+            # PKG products the LLM picked, with its reason and priority
+            chosen = []
             for selection in product_data.get("selected_products", []):
                 idx = selection.get("product_index", 0)
                 if 0 <= idx < len(available_products):
-                    full_product = available_products[idx].copy()
-                    
-                    # 
-                    # Try AI image generation, fall back to Unsplash
-                    if use_ai_images:
-                        try:
-                            product_prompt = f"{full_product.get('name', 'furniture')}, {full_product.get('material', '')}, {full_product.get('category', 'furniture')}"
-                            ai_image_url = self._generate_ai_image(product_prompt, full_product.get('name', 'furniture'))
-                            full_product["image_url"] = ai_image_url
-                            full_product["image_source"] = "ai_generated"
-                        except Exception as e:
-                            # Fall back to Unsplash
-                            self.log_activity(f"⚠️ AI image failed, using Unsplash fallback")
-                            full_product["image_url"] = self._get_unique_image_url(
-                                full_product.get("name", "furniture"),
-                                full_product.get("category", "furniture")
-                            )
-                            full_product["image_source"] = "unsplash_fallback"
-                    else:
-                        # Use Unsplash directly
-                        full_product["image_url"] = self._get_unique_image_url(
-                            full_product.get("name", "furniture"),
-                            full_product.get("category", "furniture")
-                        )
-                        full_product["image_source"] = "unsplash"
-                    
-                    full_product["purchase_url"] = self._get_purchase_url(
-                        full_product.get("name", "furniture")
-                    )
-                    
-                    full_product["selection_reason"] = selection.get("selection_reason", "")
-                    full_product["priority"] = selection.get("priority", "recommended")
-                    selected_products.append(full_product)
-                    actual_total += full_product.get("base_price", 0)
+                    chosen.append((selection, {
+                        **available_products[idx],
+                        "selection_reason": selection.get("selection_reason", ""),
+                        "priority": selection.get("priority", "recommended")
+                    }))
+            actual_total = sum(product.get("base_price", 0) for _, product in chosen)
             
             # 
-            # FIX: Validate budget constraint
+            # FIX: Validate budget constraint (before any image is generated)
             if usable_budget and actual_total > usable_budget:
                 self.log_activity(f"Budget exceeded! {actual_total:.2f} > {usable_budget:.2f}, enforcing constraint...")
                 # Remove optional items until within budget
-                selected_products = self._enforce_budget(selected_products, usable_budget)
-                actual_total = sum(p.get("base_price", 0) for p in selected_products)
+                kept = {id(product) for product in self._enforce_budget([product for _, product in chosen], usable_budget)}
+                chosen = [(selection, product) for selection, product in chosen if id(product) in kept]
+                actual_total = sum(product.get("base_price", 0) for _, product in chosen)
+            
+            # Enrich the final products with images + purchase URLs (any not streamed yet start now)
+            for selection, _ in chosen:
+                start_enrichment(selection)
+            
+            selected_products = []
+            for selection, product in chosen:
+                enriched = enrichments[selection["product_index"]].result()
+                selected_products.append({**enriched, "selection_reason": product["selection_reason"], "priority": product["priority"]})
             
             product_data["selected_products"] = selected_products
             product_data["total_estimated_cost"] = actual_total
@@ -329,11 +376,18 @@ Available Products:
                 confidence=product_data.get("style_coherence_score", 0.85)
             )
             
-        except json.JSONDecodeError as e:
-            self.log_activity(f"JSON parsing failed: {e}")
+        except StructuredOutputError as e:
+            self.log_activity(f"Unusable selection answer: {e}")
+            self.record_fallback("invalid_output")
             # Fallback: budget-aware selection
             return self._fallback_selection(available_products, usable_budget)
         
+        except CircuitOpenError:
+            # Anthropic is known to be down - answer locally right away
+            self.log_activity("Anthropic circuit open, using local fallback")
+            self.record_fallback("circuit_open")
+            return self.fallback(context)
+        
         except Exception as e:
             self.log_activity(f"Error: {str(e)}")
             return AgentResponse(
@@ -365,6 +419,19 @@ Available Products:
         
         return selected
     
+    def fallback(self, context: Dict[str, Any]) -> AgentResponse:
+        """Compatibility-ranked selection within budget, no LLM call"""
+        available_products = context.get("available_products", [])
+        if not available_products:
+            return AgentResponse(
+                agent_name=self.agent_name,
+                success=False,
+                data={"selected_products": []},
+                reasoning="No products available in PKG",
+                confidence=0.0
+            )
+        return self._fallback_selection(available_products, self._usable_budget(context.get("budget_max")))
+    
     def _fallback_selection(self, products: List[Dict], max_budget: float) -> AgentResponse:
         """Budget-aware fallback selection"""
         # Sort by compatibility score
@@ -381,6 +448,8 @@ Available Products:
         for product in sorted_products:
             price = product.get("base_price", 0)
             if max_budget is None or running_total + price <= max_budget:
+                # Copy so the caller's PKG product list is never mutated
+                product = product.copy()
                 # Add unique image (bypasses CORB)
                 product["image_url"] = self._get_unique_image_url(
                     product.get("name", "furniture"),
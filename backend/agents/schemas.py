@@ -0,0 +1,225 @@
+"""
+Agent Output Schemas
+Pydantic models for every worker's answer, requested from Claude as a forced tool call
+
+Tool-use input arrives as JSON the API already parsed, so markdown fences
+and malformed JSON are gone. Answers that are only partly valid are
+repaired here: out-of-range numbers are clamped, invalid list items are
+dropped and invalid fields fall back to their defaults.
+"""
+import json
+from typing import Any, ClassVar, Dict, List, Literal, Tuple, Type
+
+from pydantic import BaseModel, Field, ValidationError
+
+
+class StructuredOutputError(Exception):
+    """The model's answer could not be turned into the schema, even after repair"""
+
+
+# ============================================
+# Style
+# ============================================
+class StyleAnalysis(BaseModel):
+    """Record the style analysis of an interior design request"""
+    tool_name: ClassVar[str] = "record_style_analysis"
+
+    primary_style: str = Field("modern", description="Primary design style, e.g. modern, traditional, minimalist, bohemian, industrial")
+    secondary_styles: List[str] = Field(default_factory=list, description="Secondary influences, e.g. Scandinavian, mid-century, coastal")
+    color_palette: List[str] = Field(default_factory=list, description="Colors mentioned or implied")
+    mood: str = Field("comfortable", description="Mood/atmosphere, e.g. cozy, elegant, vibrant, serene")
+    materials: List[str] = Field(default_factory=list, description="Preferred materials, e.g. wood, metal, glass")
+    key_descriptors: List[str] = Field(default_factory=list)
+    confidence_score: float = Field(0.8, ge=0.0, le=1.0)
+
+
+# ============================================
+# Products
+# ============================================
+class SelectedProduct(BaseModel):
+    product_index: int = Field(ge=0, description="Index of the product in the available list")
+    product_name: str = ""
+    selection_reason: str = Field("", description="Why this product was chosen")
+    priority: Literal["essential", "recommended", "optional"] = "recommended"
+
+
+class ProductSelection(BaseModel):
+    """Record the products selected for the design"""
+    tool_name: ClassVar[str] = "record_product_selection"
+
+    selected_products: List[SelectedProduct] = Field(default_factory=list)
+    total_estimated_cost: float = Field(0.0, ge=0.0, description="Sum of base_price of the selected products")
+    style_coherence_score: float = Field(0.85, ge=0.0, le=1.0)
+    reasoning: str = Field("", description="Overall selection strategy")
+
+
+# ============================================
+# Layout
+# ============================================
+class Position(BaseModel):
+    x_percent: float = Field(50.0, ge=0.0, le=100.0, description="Left-to-right position, 0-100")
+    y_percent: float = Field(50.0, ge=0.0, le=100.0, description="Top-to-bottom position, 0-100")
+    width_percent: float = Field(20.0, ge=0.0, le=100.0, description="Horizontal space occupied, 0-100")
+    height_percent: float = Field(20.0, ge=0.0, le=100.0, description="Vertical space occupied, 0-100")
+
+
+class ProductPlacement(BaseModel):
+    product_index: int = Field(ge=0, description="Index of the product in the list to place")
+    product_name: str = ""
+    position: Position = Field(default_factory=Position)
+    placement_zone: str = Field("center", description="center-left|center|right|etc")
+    reasoning: str = Field("", description="Why this position is optimal")
+
+
+class LayoutPlan(BaseModel):
+    """Record the geometric layout of the room"""
+    tool_name: ClassVar[str] = "record_layout_plan"
+
+    product_placements: List[ProductPlacement] = Field(default_factory=list)
+    focal_point: str = Field("", description="The room's focal point")
+    traffic_flow: str = Field("", description="Movement paths through the room")
+    spatial_balance: float = Field(0.85, ge=0.0, le=1.0)
+    layout_reasoning: str = Field("", description="Overall layout strategy")
+
+
+# ============================================
+# Budget
+# ============================================
+class CostBreakdown(BaseModel):
+    essential: float = Field(0.0, ge=0.0)
+    recommended: float = Field(0.0, ge=0.0)
+    optional: float = Field(0.0, ge=0.0)
+
+
+class SavingsOpportunity(BaseModel):
+    item: str
+    current_cost: float = Field(0.0, ge=0.0)
+    suggested_alternative: str = ""
+    potential_savings: float = Field(0.0, ge=0.0)
+
+
+class BudgetAnalysis(BaseModel):
+    """Record the budget analysis and optimization advice"""
+    tool_name: ClassVar[str] = "record_budget_analysis"
+
+    cost_breakdown: CostBreakdown = Field(default_factory=CostBreakdown)
+    savings_opportunities: List[SavingsOpportunity] = Field(default_factory=list)
+    recommendations: str = Field("", description="Budget optimization advice")
+    value_score: float = Field(0.85, ge=0.0, le=1.0)
+    savings_tips: List[str] = Field(default_factory=list)
+
+
+# ============================================
+# Tool definitions and the shared parser
+# ============================================
+def tool_definition(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Anthropic tool whose input is the schema
+    Every field is marked required so the model fills them all; the
+    defaults are only used when repairing an answer locally
+    """
+    input_schema = schema.model_json_schema()
+
+    def require_all(node: Dict[str, Any]):
+        if "properties" in node:
+            node["required"] = list(node["properties"])
+        for child in node.get("$defs", {}).values():
+            require_all(child)
+
+    require_all(input_schema)
+    return {
+        "name": schema.tool_name,
+        "description": (schema.__doc__ or schema.tool_name).strip(),
+        "input_schema": input_schema
+    }
+
+
+def _loads_text(text: str) -> Any:
+    """JSON from a text answer (for models that answer in text despite the tool)"""
+    cleaned = (text or "").strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.split("```")[1]
+        if cleaned.startswith("json"):
+            cleaned = cleaned[4:]
+    start, end = cleaned.find("{"), cleaned.rfind("}")
+    if start == -1 or end <= start:
+        raise StructuredOutputError("No JSON object in the answer")
+    try:
+        return json.loads(cleaned[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise StructuredOutputError(f"Answer is not valid JSON: {e}")
+
+
+def _repair(data: Any, error: Dict[str, Any]) -> bool:
+    """
+    Fix the value one validation error points at, in place
+    Returns False when the error can't be addressed
+    """
+    loc = list(error["loc"])
+    if not loc:
+        return False
+
+    # Walk to the container holding the bad value
+    parent = data
+    for step in loc[:-1]:
+        try:
+            parent = parent[step]
+        except (KeyError, IndexError, TypeError):
+            return False
+    key = loc[-1]
+
+    # Out-of-range scores/percentages are clamped to the bound they crossed
+    # (integer bounds are indices, which are dropped rather than guessed)
+    ctx = error.get("ctx") or {}
+    if error["type"].startswith(("greater_than", "less_than")):
+        for bound in ("ge", "le", "gt", "lt"):
+            if isinstance(ctx.get(bound), float):
+                parent[key] = ctx[bound]
+                return True
+
+    # A bad field falls back to its default (a required one reports "missing" next)
+    if isinstance(parent, dict) and key in parent:
+        del parent[key]
+        return True
+
+    # A list item that can't be fixed is dropped: innermost list on the path
+    for depth in range(len(loc) - 1, -1, -1):
+        if isinstance(loc[depth], int):
+            container = data
+            for step in loc[:depth]:
+                container = container[step]
+            if isinstance(container, list) and loc[depth] < len(container):
+                del container[loc[depth]]
+                return True
+            return False
+    return False
+
+
+def parse_structured(schema: Type[BaseModel], raw: Any, max_repairs: int = 50) -> Tuple[BaseModel, bool]:
+    """
+    Validate a tool input (dict) or text answer against the schema,
+    repairing partly valid answers locally instead of re-calling the model
+
+    Returns:
+        (model, repaired)
+
+    Raises:
+        StructuredOutputError: nothing usable in the answer
+    """
+    data = _loads_text(raw) if isinstance(raw, str) else raw
+    if not isinstance(data, dict):
+        raise StructuredOutputError(f"Expected an object, got {type(data).__name__}")
+
+    data = json.loads(json.dumps(data))  # private copy to repair in place
+    repaired = False
+    for _ in range(max_repairs):
+        try:
+            return schema.model_validate(data), repaired
+        except ValidationError as e:
+            errors = e.errors()
+            # Deepest paths first so list indices stay valid while dropping
+            errors.sort(key=lambda err: len(err["loc"]), reverse=True)
+            if not _repair(data, errors[0]):
+                raise StructuredOutputError(f"Unrepairable answer: {errors[0]['msg']} at {errors[0]['loc']}")
+            repaired = True
+    raise StructuredOutputError("Answer still invalid after repairs")
@@ -0,0 +1,91 @@
+"""
+Incremental JSON Parsing
+Yields the elements of one top-level array as soon as each one closes
+
+Streamed tool-use input arrives as JSON fragments. Agents that can act on
+each list item (enrich a product, place a piece of furniture) feed the
+fragments in here and start that work while the model is still writing
+the rest of its answer.
+"""
+import json
+from typing import Any, List
+
+
+class IncrementalArrayParser:
+    """
+    Scans a growing JSON object and returns each completed element of
+    obj[key] (a top-level array) exactly once
+
+    Usage:
+        parser = IncrementalArrayParser("selected_products")
+        for fragment in fragments:
+            for item in parser.feed(fragment):
+                start_work(item)
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self._buffer = ""
+        self._pos = 0
+
+        self._depth = 0            # nesting depth of {} / []
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_key = None      # last string read at depth 1 (top-level key)
+        self._array_depth = None   # depth inside the target array, while in it
+        self._element_start = None
+        self.emitted = 0
+
+    def feed(self, fragment: str) -> List[Any]:
+        """Add text; returns the elements completed by it"""
+        self._buffer += fragment
+        completed = []
+
+        while self._pos < len(self._buffer):
+            i = self._pos
+            char = self._buffer[i]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = self._buffer[self._string_start:i]
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = i + 1
+                if self._array_depth is not None and self._depth == self._array_depth and self._element_start is None:
+                    self._element_start = i
+            elif char in "{[":
+                if self._array_depth is not None and self._depth == self._array_depth and self._element_start is None:
+                    self._element_start = i
+                self._depth += 1
+                if char == "[" and self._depth == 2 and self._last_key == self.key and self._array_depth is None:
+                    self._array_depth = 2
+            elif char in "}]":
+                self._depth -= 1
+                if self._array_depth is not None:
+                    if self._depth < self._array_depth:
+                        # Target array closed
+                        self._array_depth = None
+                        self._last_key = None
+                    elif self._depth == self._array_depth and self._element_start is not None:
+                        completed.append(self._buffer[self._element_start:i + 1])
+                        self._element_start = None
+
+        items = []
+        for text in completed:
+            try:
+                items.append(json.loads(text))
+            except json.JSONDecodeError:
+                # Malformed element: the final, repaired parse still covers it
+                continue
+        self.emitted += len(items)
+        return items
@@ -3,9 +3,14 @@ Style Analysis Agent
 Analyzes user input to extract style preferences, color palettes, and aesthetic requirements
 """
 from typing import Dict, Any, List
-import json
 
+from config import get_settings
 from agents.base_agent import BaseAgent, AgentResponse
+from agents.schemas import StyleAnalysis, StructuredOutputError
+from services.resilience import CircuitOpenError
+from services.style_cache import style_cache
+
+settings = get_settings()
 
 
 class StyleAgent(BaseAgent):
@@ -29,6 +34,11 @@ class StyleAgent(BaseAgent):
         """
         self.log_activity("Analyzing user style preferences...")
         
+        cached = style_cache.get(context) if settings.style_cache_enabled else None
+        if cached is not None:
+            self.log_activity("Using cached style analysis")
+            return AgentResponse(**cached)
+        
         user_prompt = context.get("user_prompt", "")
         room_type = context.get("room_type", "living_room")
         room_size = context.get("room_size", "medium")
@@ -43,16 +53,7 @@ Your task is to analyze user descriptions and extract:
 4. Mood/atmosphere (e.g., cozy, elegant, vibrant, serene)
 5. Material preferences (e.g., wood, metal, glass, natural textiles)
 
-Respond ONLY with valid JSON in this exact format:
-{
-    "primary_style": "style name",
-    "secondary_styles": ["style1", "style2"],
-    "color_palette": ["color1", "color2", "color3"],
-    "mood": "mood description",
-    "materials": ["material1", "material2"],
-    "key_descriptors": ["descriptor1", "descriptor2"],
-    "confidence_score": 0.85
-}"""
+Record your analysis with the record_style_analysis tool."""
 
         user_message = f"""Analyze this design request:
 
@@ -64,21 +65,12 @@ Explicitly Mentioned Styles: {', '.join(existing_styles) if existing_styles else
 Extract and structure the style preferences."""
 
         try:
-            response_text = self._call_claude(system_prompt, user_message, temperature=0.3)
-            
-            # Parse JSON response
-            # Claude sometimes wraps JSON in markdown, so clean it
-            cleaned_response = response_text.strip()
-            if cleaned_response.startswith("```json"):
-                cleaned_response = cleaned_response.split("```json")[1].split("```")[0].strip()
-            elif cleaned_response.startswith("```"):
-                cleaned_response = cleaned_response.split("```")[1].split("```")[0].strip()
-            
-            style_data = json.loads(cleaned_response)
+            analysis = self._call_claude_structured(system_prompt, user_message, StyleAnalysis, temperature=0.3)
+            style_data = analysis.model_dump()
             
             self.log_activity(f"Identified primary style: {style_data['primary_style']}")
             
-            return AgentResponse(
+            response = AgentResponse(
                 agent_name=self.agent_name,
                 success=True,
                 data=style_data,
@@ -86,26 +78,25 @@ Extract and structure the style preferences."""
                           f"with {style_data['mood']} mood and {len(style_data['color_palette'])} color preferences",
                 confidence=style_data.get("confidence_score", 0.8)
             )
+            # Only LLM analyses are cached, never fallbacks
+            if settings.style_cache_enabled:
+                style_cache.put(context, response.model_dump())
+            return response
             
-        except json.JSONDecodeError as e:
-            self.log_activity(f"JSON parsing failed, using fallback style analysis")
-            # Fallback with reasonable defaults
-            return AgentResponse(
-                agent_name=self.agent_name,
-                success=True,
-                data={
-                    "primary_style": existing_styles[0] if existing_styles else "modern",
-                    "secondary_styles": existing_styles[1:] if len(existing_styles) > 1 else [],
-                    "color_palette": ["neutral", "warm"],
-                    "mood": "comfortable",
-                    "materials": ["wood", "fabric"],
-                    "key_descriptors": ["clean", "functional"],
-                    "confidence_score": 0.6
-                },
-                reasoning="Fallback style analysis used due to parsing error",
-                confidence=0.6
+        except StructuredOutputError:
+            self.log_activity(f"Unusable style answer, using fallback style analysis")
+            self.record_fallback("invalid_output")
+            return self._fallback_analysis(
+                existing_styles,
+                reasoning="Fallback style analysis used due to parsing error"
             )
         
+        except CircuitOpenError:
+            # Anthropic is known to be down - answer locally right away
+            self.log_activity("Anthropic circuit open, using local fallback")
+            self.record_fallback("circuit_open")
+            return self.fallback(context)
+        
         except Exception as e:
             self.log_activity(f"Style analysis failed: {str(e)}")
             return AgentResponse(
@@ -115,6 +106,31 @@ Extract and structure the style preferences."""
                 reasoning=f"Error: {str(e)}",
                 confidence=0.0
             )
+    
+    def fallback(self, context: Dict[str, Any]) -> AgentResponse:
+        """Local style analysis from explicitly mentioned styles only"""
+        return self._fallback_analysis(
+            context.get("style_preferences", []),
+            reasoning="Fallback style analysis used without an LLM call"
+        )
+    
+    def _fallback_analysis(self, existing_styles: List[str], reasoning: str) -> AgentResponse:
+        """Fallback with reasonable defaults"""
+        return AgentResponse(
+            agent_name=self.agent_name,
+            success=True,
+            data={
+                "primary_style": existing_styles[0] if existing_styles else "modern",
+                "secondary_styles": existing_styles[1:] if len(existing_styles) > 1 else [],
+                "color_palette": ["neutral", "warm"],
+                "mood": "comfortable",
+                "materials": ["wood", "fabric"],
+                "key_descriptors": ["clean", "functional"],
+                "confidence_score": 0.6
+            },
+            reasoning=reasoning,
+            confidence=0.6
+        )
 
 
 # Create singleton
@@ -0,0 +1,116 @@
+"""
+Token Usage
+Per-agent token accounting, including Anthropic prompt-cache reads and writes
+
+No request sets a cache breakpoint today: every system prompt is well
+below the model's minimum cacheable prefix (1024 tokens for Sonnet/Opus).
+The cache counters stay so the hit ratio and input cost ratio show up as
+soon as a prompt is long enough to be worth caching.
+"""
+import threading
+from typing import Any, Dict
+
+from agents.hedging import LatencyHistogram
+from services.metrics import llm_cost, llm_tokens, llm_ttft
+from services.rate_limiter import model_family
+# Input price multipliers relative to uncached input tokens
+CACHE_WRITE_COST = 1.25
+CACHE_READ_COST = 0.1
+
+# List prices (USD per million input / output tokens) per model family
+MODEL_PRICES = {
+    "opus": (15.0, 75.0),
+    "sonnet": (3.0, 15.0),
+    "haiku": (0.8, 4.0)
+}
+
+
+class TokenUsageStats:
+    """Running totals of the usage block of every messages response"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.cache_creation_input_tokens = 0
+
+    def record(self, usage) -> int:
+        """
+        Add one response's usage
+        Returns the tokens that count against the rate limit (cache reads don't)
+        """
+        input_tokens = getattr(usage, "input_tokens", 0) or 0
+        output_tokens = getattr(usage, "output_tokens", 0) or 0
+        cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+        cache_creation = getattr(usage, "cache_creation_input_tokens", 0) or 0
+
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cache_read_input_tokens += cache_read
+            self.cache_creation_input_tokens += cache_creation
+
+        return input_tokens + cache_creation + output_tokens
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total_input = self.input_tokens + self.cache_read_input_tokens + self.cache_creation_input_tokens
+            billed_input = (
+                self.input_tokens
+                + self.cache_creation_input_tokens * CACHE_WRITE_COST
+                + self.cache_read_input_tokens * CACHE_READ_COST
+            )
+            return {
+                "calls": self.calls,
+                "input_tokens": self.input_tokens,
+                "output_tokens": self.output_tokens,
+                "cache_read_input_tokens": self.cache_read_input_tokens,
+                "cache_creation_input_tokens": self.cache_creation_input_tokens,
+                # Share of prompt tokens served from the cache
+                "cache_hit_ratio": round(self.cache_read_input_tokens / total_input, 4) if total_input else 0.0,
+                # Input cost relative to sending the same prompts uncached
+                "input_cost_ratio": round(billed_input / total_input, 4) if total_input else 1.0
+            }
+
+
+class TimeToFirstToken:
+    """
+    Time to first token of one agent's calls, per mode: "stream" is the
+    first streamed content delta; a non-streamed ("full") call gets its
+    first token together with the whole answer, so its TTFT is the call's
+    latency
+    """
+
+    MODES = ("stream", "full")
+
+    def __init__(self, agent: str):
+        self.agent = agent
+        self.histograms = {mode: LatencyHistogram(min_samples=1) for mode in self.MODES}
+
+    def record(self, seconds: float, model: str, mode: str):
+        self.histograms[mode].record(seconds)
+        llm_ttft.observe(seconds, self.agent, model, mode)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {mode: histogram.get_stats() for mode, histogram in self.histograms.items()}
+
+
+def record_call_metrics(agent: str, model: str, usage):
+    """Export one response's tokens and estimated cost, labelled by agent and model"""
+    input_tokens = getattr(usage, "input_tokens", 0) or 0
+    output_tokens = getattr(usage, "output_tokens", 0) or 0
+    cache_read = getattr(usage, "cache_read_input_tokens", 0) or 0
+    cache_creation = getattr(usage, "cache_creation_input_tokens", 0) or 0
+
+    llm_tokens.inc(agent, model, "input", amount=input_tokens)
+    llm_tokens.inc(agent, model, "output", amount=output_tokens)
+    llm_tokens.inc(agent, model, "cache_read", amount=cache_read)
+    llm_tokens.inc(agent, model, "cache_creation", amount=cache_creation)
+
+    input_price, output_price = MODEL_PRICES[model_family(model)]
+    billed_input = input_tokens + cache_creation * CACHE_WRITE_COST + cache_read * CACHE_READ_COST
+    llm_cost.inc(agent, model, amount=(billed_input * input_price + output_tokens * output_price) / 1_000_000)
+
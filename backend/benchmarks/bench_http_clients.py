@@ -0,0 +1,114 @@
+"""
+HTTP Client Benchmark
+Per-call overhead of fresh connections vs the shared pooled clients
+
+Runs a local keep-alive stub server and times N small POSTs with:
+  - a bare requests.post (new connection per call, the old ImgBB path)
+  - the shared requests session from services.http_clients
+  - a new httpx.Client per call
+  - the shared httpx pool
+The server counts accepted TCP connections so reuse is visible directly.
+The stub is plain HTTP; against real HTTPS upstreams the saved TLS
+handshake makes the gap considerably larger.
+
+Usage (from backend/):
+    python benchmarks/bench_http_clients.py [--calls 200]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+os.environ.setdefault("REPLICATE_API_TOKEN", "")
+os.environ.setdefault("IMGBB_API_KEY", "benchmark")
+
+from services.http_clients import clients  # noqa: E402
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers every POST with a tiny JSON body, keeping the connection open"""
+    protocol_version = "HTTP/1.1"
+    # Otherwise reused connections stall on Nagle + delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = b'{"success": true}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    connections = 0
+
+    def get_request(self):
+        request = super().get_request()
+        self.connections += 1
+        return request
+
+
+def run_case(name: str, call, calls: int, server: CountingServer) -> dict:
+    call()  # warm-up (and first connection for the pooled clients)
+    server.connections = 0
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    return {
+        "case": name,
+        "mean_ms": statistics.mean(timings) * 1000,
+        "p50_ms": statistics.median(timings) * 1000,
+        "p95_ms": sorted(timings)[int(0.95 * (len(timings) - 1))] * 1000,
+        "connections": server.connections
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    server = CountingServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/1/upload"
+    payload = {"key": "stub", "image": "x" * 2048, "name": "bench.jpg"}
+
+    def fresh_httpx():
+        with httpx.Client() as client:
+            client.post(url, data=payload)
+
+    cases = [
+        ("requests.post (no session)", lambda: requests.post(url, data=payload, timeout=10)),
+        ("shared requests session", lambda: clients.requests_session().post(url, data=payload, timeout=10)),
+        ("httpx.Client per call", fresh_httpx),
+        ("shared httpx pool", lambda: clients.httpx_client().post(url, data=payload))
+    ]
+
+    print(f"{args.calls} POSTs per case against {url}\n")
+    print(f"{'case':<30}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'conns':>8}")
+    for name, call in cases:
+        r = run_case(name, call, args.calls, server)
+        print(f"{r['case']:<30}{r['mean_ms']:>10.3f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['connections']:>8}")
+
+    clients.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Upload Memory Benchmark
+Peak memory of one /upload-image processing step, old pipeline vs new
+
+For each test image, two pipelines run in a fresh child process each so
+their peaks can't hide behind each other:
+  - legacy: the whole upload read into bytes, decoded at full size,
+    alpha flattened at full size, then thumbnailed (the code before the
+    streaming upload pipeline)
+  - streaming: ImageService.process_upload on the file itself (as the
+    endpoint does with the spooled temp file): header check, JPEG draft
+    decoding, EXIF transpose, thumbnail, then alpha flattening
+Peak RSS over the child's baseline (after imports), sampled every
+millisecond, is what one upload adds to a worker; pixel buffers live
+outside the Python heap, so RSS is measured rather than tracemalloc.
+
+Usage (from backend/):
+    python benchmarks/bench_upload_memory.py [--output upload_memory.json]
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# name -> (format, size, mode, EXIF orientation)
+CASES = {
+    "jpeg_24mp": ("JPEG", (6000, 4000), "RGB", None),
+    "jpeg_12mp_rotated": ("JPEG", (4000, 3000), "RGB", 6),
+    "png_rgba_16mp": ("PNG", (4000, 4000), "RGBA", None),
+    "png_1mp": ("PNG", (1280, 800), "RGB", None),
+}
+PIPELINES = ("legacy", "streaming")
+
+
+def make_image(path: str, fmt: str, size, mode: str, orientation):
+    """Noisy gradient, so encoders can't shrink the file to nothing"""
+    from PIL import Image
+
+    noise = Image.effect_noise(size, 48)
+    gradient = Image.linear_gradient("L").resize(size)
+    image = Image.merge("RGB", (noise, gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    if mode == "RGBA":
+        image.putalpha(gradient)
+    exif = image.getexif()
+    if orientation:
+        exif[0x0112] = orientation
+    options = {"quality": 90} if fmt == "JPEG" else {"compress_level": 1}
+    image.save(path, fmt, exif=exif.tobytes(), **options)
+
+
+def legacy_process(path: str, max_size: int = 1024) -> bytes:
+    """The pipeline before streaming uploads: read all, decode full size"""
+    from PIL import Image
+
+    with open(path, "rb") as f:
+        image_data = f.read()
+    img = Image.open(io.BytesIO(image_data))
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+        img = background
+    img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    output = io.BytesIO()
+    img.save(output, format='PNG', optimize=True)
+    return output.getvalue()
+
+
+def run_child(pipeline: str, path: str):
+    """Child process: process one image once, print one JSON line"""
+    from PIL import Image
+    from services.image_service import ImageService
+    from services.runtime_monitor import rss_bytes
+
+    # The process's lifetime peak (ru_maxrss) is set by the imports, so
+    # sample the current RSS while the pipeline runs
+    baseline = peak = rss_bytes()
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(0.001):
+            peak = max(peak, rss_bytes())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    if pipeline == "legacy":
+        output = legacy_process(path)
+    else:
+        with open(path, "rb") as f:
+            output = ImageService.process_upload(f)
+    seconds = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    print(json.dumps({
+        "peak_mb": round((max(peak, rss_bytes()) - baseline) / 1e6, 1),
+        "seconds": round(seconds, 3),
+        "output_size": list(Image.open(io.BytesIO(output)).size)
+    }), flush=True)
+
+
+def measure(pipeline: str, path: str) -> Dict[str, Any]:
+    env = dict(os.environ, ANTHROPIC_API_KEY=os.environ.get("ANTHROPIC_API_KEY", "benchmark"), IMAGE_MIRROR="off")
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", pipeline, path],
+        capture_output=True, text=True, cwd=BACKEND_DIR, env=env
+    )
+    lines = [line for line in completed.stdout.splitlines() if line.startswith('{"peak_mb"')]
+    if completed.returncode != 0 or not lines:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else f"exit {completed.returncode}"}
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak memory per upload, legacy vs streaming pipeline")
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.cases.split(","):
+            fmt, size, mode, orientation = CASES[name]
+            path = os.path.join(directory, f"{name}.{fmt.lower()}")
+            make_image(path, fmt, size, mode, orientation)
+            file_mb = os.path.getsize(path) / 1e6
+            print(f"{name:<20} {size[0]}x{size[1]} {fmt:<4} {file_mb:6.1f}MB")
+            for pipeline in PIPELINES:
+                result = measure(pipeline, path)
+                results.append({"case": name, "pipeline": pipeline, "file_mb": round(file_mb, 2), **result})
+                if "error" in result:
+                    print(f"    {pipeline:<10} failed: {result['error']}")
+                else:
+                    print(f"    {pipeline:<10} peak +{result['peak_mb']:7.1f}MB  {result['seconds']:6.3f}s  -> {result['output_size'][0]}x{result['output_size'][1]}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""
+API Load Test
+Drives the main endpoints at rising concurrency against the mock upstreams
+
+Starts mock_upstream.py and the API (uvicorn, --workers N) with every
+upstream base URL pointed at the mock, waits for /health, then runs each
+scenario as a closed loop: C concurrent clients send requests back to back
+for --duration seconds, for each C in --concurrency. Per stage it reports
+throughput, p50/p95/p99 latency and errors, plus the event-loop lag and
+memory of every API worker (from /stats/runtime).
+
+Scenarios:
+    design     POST /agent/design/multi (distinct prompts, so nothing is coalesced)
+    pkg        POST /pkg/query
+    upload     POST /upload-image (800x600 PNG)
+    transform  POST /transform-image
+
+Usage (from backend/):
+    python benchmarks/load_test.py --output results.json
+    python benchmarks/load_test.py --scenarios pkg,upload --concurrency 1,8,32 --workers 2
+    python benchmarks/load_test.py --baseline results.json --threshold 0.2   # exit 1 on regression
+    python benchmarks/load_test.py --url http://localhost:8000                # existing server
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The sample catalog only has products for these (others answer 404)
+ROOM_TYPES = ("living_room", "bedroom")
+STYLES = ("modern minimalist", "scandinavian", "industrial", "japandi", "mid-century")
+
+# Metrics compared against a baseline, and which direction is worse
+COMPARED = (
+    ("p95_ms", "higher"),
+    ("p99_ms", "higher"),
+    ("throughput_rps", "lower")
+)
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def _sample_png() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (800, 600), (180, 170, 160)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class Scenarios:
+    """One request per call; the counter keeps design prompts distinct"""
+
+    def __init__(self):
+        self._counter = itertools.count()
+        self._png = _sample_png()
+
+    def _design_body(self, n: int) -> Dict[str, Any]:
+        return {
+            "prompt": f"{STYLES[n % len(STYLES)]} room with warm light, variant {n}",
+            "room_type": ROOM_TYPES[n % len(ROOM_TYPES)],
+            "budget_max": 1500 + (n % 7) * 250
+        }
+
+    async def design(self, client: httpx.AsyncClient) -> httpx.Response:
+        return await client.post("/agent/design/multi", json=self._design_body(next(self._counter)))
+
+    async def pkg(self, client: httpx.AsyncClient) -> httpx.Response:
+        return await client.post("/pkg/query", json=self._design_body(next(self._counter)))
+
+    async def upload(self, client: httpx.AsyncClient) -> httpx.Response:
+        n = next(self._counter)
+        return await client.post("/upload-image", files={"file": (f"room-{n}.png", self._png, "image/png")})
+
+    async def transform(self, client: httpx.AsyncClient) -> httpx.Response:
+        n = next(self._counter)
+        return await client.post("/transform-image", params={
+            "image_url": f"http://localhost/room-{n}.png",
+            "style": STYLES[n % len(STYLES)],
+            "room_type": ROOM_TYPES[n % len(ROOM_TYPES)].replace("_", " ")
+        })
+
+
+async def _worker_stats(client: httpx.AsyncClient, since: float, workers: int) -> Dict[str, Any]:
+    """/stats/runtime from every worker (requests land on workers at random, so ask repeatedly)"""
+    stats: Dict[str, Any] = {}
+    for _ in range(max(workers * 6, 1)):
+        try:
+            response = await client.get("/stats/runtime", params={"since": since})
+            data = response.json()
+            stats[str(data["pid"])] = {k: v for k, v in data.items() if k != "pid"}
+        except (httpx.HTTPError, ValueError, KeyError):
+            continue
+        if len(stats) >= workers:
+            break
+    return stats
+
+
+async def run_stage(base_url: str, scenario, concurrency: int, duration: float, timeout: float, workers: int) -> Dict[str, Any]:
+    """Closed loop: `concurrency` clients, each sending its next request when the last returns"""
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    limits = httpx.Limits(max_connections=concurrency + 2, max_keepalive_connections=concurrency + 2)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        since = time.time()
+        deadline = time.perf_counter() + duration
+
+        async def loop():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await scenario(client)
+                    outcome = None if response.status_code < 400 else str(response.status_code)
+                except httpx.HTTPError as e:
+                    outcome = type(e).__name__
+                if outcome is None:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors[outcome] = errors.get(outcome, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        worker_stats = await _worker_stats(client, since, workers)
+
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 1) if value is not None else None
+    error_count = sum(errors.values())
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies) + error_count,
+        "errors": errors,
+        "error_rate": round(error_count / max(len(latencies) + error_count, 1), 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "workers": worker_stats
+    }
+
+
+# ============================================
+# Processes
+# ============================================
+def _wait_for(url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def start_servers(args) -> List[subprocess.Popen]:
+    """Mock upstreams, then the API pointed at them"""
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    mock = subprocess.Popen(
+        [sys.executable, "mock_upstream.py", "--port", str(args.mock_port),
+         "--latency", args.mock_latency, "--error-rate", args.mock_error_rate,
+         "--rate-limit-rate", args.mock_rate_limit_rate],
+        cwd=BACKEND_DIR
+    )
+    env = dict(
+        os.environ,
+        ANTHROPIC_API_KEY="load-test",
+        REPLICATE_API_TOKEN="load-test",
+        IMGBB_API_KEY="load-test",
+        ANTHROPIC_BASE_URL=mock_url,
+        REPLICATE_BASE_URL=mock_url,
+        IMGBB_BASE_URL=mock_url,
+        CASSETTE_MODE="off",
+        TRACE_EXPORTERS=""
+    )
+    api = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR,
+        env=env
+    )
+    processes = [mock, api]
+    try:
+        _wait_for(f"{mock_url}/_mock/config", 30)
+        _wait_for(f"http://127.0.0.1:{args.port}/health", 120)
+    except Exception:
+        stop_servers(processes)
+        raise
+    return processes
+
+
+def stop_servers(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+# ============================================
+# Baseline comparison
+# ============================================
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Regressions beyond `threshold` (relative) for every stage present in both runs"""
+    previous = {
+        (run["scenario"], stage["concurrency"]): stage
+        for run in baseline["scenarios"] for stage in run["stages"]
+    }
+    regressions = []
+    print(f"\n{'scenario':<10} {'conc':>5} {'metric':<15} {'baseline':>10} {'current':>10} {'change':>8}")
+    for run in results["scenarios"]:
+        for stage in run["stages"]:
+            old = previous.get((run["scenario"], stage["concurrency"]))
+            if old is None:
+                continue
+            for metric, worse in COMPARED:
+                before, after = old.get(metric), stage.get(metric)
+                if not before or after is None:
+                    continue
+                change = (after - before) / before
+                regressed = change > threshold if worse == "higher" else -change > threshold
+                flag = "  REGRESSION" if regressed else ""
+                print(f"{run['scenario']:<10} {stage['concurrency']:>5} {metric:<15} {before:>10} {after:>10} {change:>+8.1%}{flag}")
+                if regressed:
+                    regressions.append(f"{run['scenario']} c={stage['concurrency']} {metric}: {before} -> {after} ({change:+.1%})")
+            if stage["error_rate"] > old.get("error_rate", 0) + threshold:
+                regressions.append(f"{run['scenario']} c={stage['concurrency']} error_rate: {old.get('error_rate')} -> {stage['error_rate']}")
+    return regressions
+
+
+def _print_stage(scenario: str, stage: Dict[str, Any]):
+    lags = [w["loop_lag_ms"]["p99"] for w in stage["workers"].values() if w.get("loop_lag_ms")]
+    rss = [w["rss_mb"] for w in stage["workers"].values()]
+    print(
+        f"{scenario:<10} c={stage['concurrency']:<4} {stage['throughput_rps']:>8.2f} req/s  "
+        f"p50 {stage['p50_ms']} / p95 {stage['p95_ms']} / p99 {stage['p99_ms']} ms  "
+        f"errors {stage['error_rate']:.1%}  loop lag p99 {max(lags) if lags else '-'} ms  "
+        f"rss {'/'.join(str(r) for r in rss) or '-'} MB"
+    )
+
+
+async def run_all(args, base_url: str) -> Dict[str, Any]:
+    scenarios = Scenarios()
+    results = {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "workers": args.workers,
+            "duration_s": args.duration,
+            "mock_latency": args.mock_latency if not args.url else None
+        },
+        "scenarios": []
+    }
+    for name in args.scenarios.split(","):
+        scenario = getattr(scenarios, name.strip())
+        stages = []
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            stage = await run_stage(base_url, scenario, concurrency, args.duration, args.timeout, args.workers)
+            _print_stage(name, stage)
+            stages.append(stage)
+        results["scenarios"].append({"scenario": name.strip(), "stages": stages})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API against mock upstreams")
+    parser.add_argument("--scenarios", default="design,pkg,upload,transform")
+    parser.add_argument("--concurrency", default="1,4,16,32", help="comma-separated client counts")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds per stage")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout (s)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    parser.add_argument("--mock-port", type=int, default=8100)
+    parser.add_argument("--mock-latency", default="anthropic=lognormal:800:0.5,replicate=lognormal:3000:0.3,imgbb=fixed:150")
+    parser.add_argument("--mock-error-rate", default="0")
+    parser.add_argument("--mock-rate-limit-rate", default="0")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="tolerated relative regression")
+    args = parser.parse_args()
+
+    processes = [] if args.url else start_servers(args)
+    base_url = args.url or f"http://127.0.0.1:{args.port}"
+    try:
+        results = asyncio.run(run_all(args, base_url))
+    finally:
+        stop_servers(processes)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+PKG Benchmark
+Build and query cost of the Product Knowledge Graph at growing catalog sizes
+
+Each size runs in its own process on a seeded synthetic catalog
+(services.generate_products.generate_catalog), so the RSS numbers belong
+to that size alone. Per size it times:
+  - graph build (nodes + compatibility edges) and index build
+  - get_compatible_products, cold (first query per key) and cached
+  - get_product_set for random anchors
+  - get_graph_stats
+and records node/edge counts and RSS. A size that exceeds --time-cap is
+stopped and reported with the phase it was in; larger sizes are skipped,
+since that is where the implementation stops scaling.
+
+Usage (from backend/):
+    python benchmarks/pkg_bench.py [--sizes 100,1000,10000,100000,1000000] [--time-cap 120]
+    python benchmarks/pkg_bench.py --impl services.pkg_service:ProductKnowledgeGraph --output pkg.json
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+ROOM_SIZES = ("small", "medium", "large")
+
+
+def _emit(record: Dict[str, Any]):
+    print(json.dumps(record), flush=True)
+
+
+def _timings(samples: List[float]) -> Dict[str, float]:
+    """Mean and p95 in microseconds"""
+    samples = sorted(samples)
+    return {
+        "mean_us": round(statistics.fmean(samples) * 1e6, 1),
+        "p95_us": round(samples[min(int(len(samples) * 0.95), len(samples) - 1)] * 1e6, 1),
+        "calls": len(samples)
+    }
+
+
+def run_size(size: int, seed: int, queries: int, impl: str):
+    """Child process: benchmark one catalog size, one JSON line per phase"""
+    from services.generate_products import generate_catalog, STYLE_WEIGHTS, ROOM_WEIGHTS
+    from services.runtime_monitor import rss_bytes, peak_rss_bytes
+
+    module_name, class_name = impl.split(":")
+    graph_class = getattr(importlib.import_module(module_name), class_name)
+    rss_mb = lambda: round(rss_bytes() / 1e6, 1)
+    baseline_rss = rss_mb()
+
+    start = time.perf_counter()
+    catalog = generate_catalog(size, seed)
+    _emit({"phase": "generate", "seconds": round(time.perf_counter() - start, 4), "rss_mb": rss_mb()})
+
+    import networkx  # noqa: F401  (so its import isn't timed as graph build)
+
+    pkg = graph_class(products=catalog)
+    start = time.perf_counter()
+    graph = pkg.graph
+    _emit({
+        "phase": "graph_build",
+        "seconds": round(time.perf_counter() - start, 4),
+        "nodes": graph.number_of_nodes(),
+        "edges": graph.number_of_edges(),
+        "rss_mb": rss_mb()
+    })
+
+    start = time.perf_counter()
+    pkg.build_indexes()
+    _emit({"phase": "index_build", "seconds": round(time.perf_counter() - start, 4), "rss_mb": rss_mb()})
+
+    # Every distinct key once (cold), then the same keys again (cached)
+    keys = [(room, room_size, style) for room in ROOM_WEIGHTS for room_size in ROOM_SIZES for style in STYLE_WEIGHTS]
+    cold, warm, results = [], [], 0
+    for room, room_size, style in keys:
+        start = time.perf_counter()
+        results += len(pkg.get_compatible_products(room, room_size, style, max_results=10))
+        cold.append(time.perf_counter() - start)
+    for i in range(queries):
+        room, room_size, style = keys[i % len(keys)]
+        start = time.perf_counter()
+        pkg.get_compatible_products(room, room_size, style, max_results=10)
+        warm.append(time.perf_counter() - start)
+    _emit({"phase": "compatible_products", "cold": _timings(cold), "cached": _timings(warm), "avg_results": round(results / len(keys), 1)})
+
+    rng = random.Random(seed)
+    anchors = [catalog[rng.randrange(size)]["id"] for _ in range(queries)]
+    samples, neighbors = [], 0
+    for anchor in anchors:
+        start = time.perf_counter()
+        neighbors += len(pkg.get_product_set(anchor))
+        samples.append(time.perf_counter() - start)
+    _emit({"phase": "product_set", **_timings(samples), "avg_neighbors": round(neighbors / len(anchors), 1)})
+
+    start = time.perf_counter()
+    pkg.get_graph_stats()
+    _emit({"phase": "graph_stats", "seconds": round(time.perf_counter() - start, 4)})
+
+    _emit({"phase": "done", "rss_mb": rss_mb(), "peak_rss_mb": round(peak_rss_bytes() / 1e6, 1), "baseline_rss_mb": baseline_rss})
+
+
+def bench_size(size: int, args) -> Dict[str, Any]:
+    """Run one size in a child process, stopping it at the time cap"""
+    command = [sys.executable, os.path.abspath(__file__), "--child", str(size),
+               "--seed", str(args.seed), "--queries", str(args.queries), "--impl", args.impl]
+    env = dict(os.environ, ANTHROPIC_API_KEY=os.environ.get("ANTHROPIC_API_KEY", "benchmark"))
+    start = time.perf_counter()
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=args.time_cap, cwd=BACKEND_DIR, env=env)
+        output, status = completed.stdout, "ok" if completed.returncode == 0 else f"failed ({completed.returncode})"
+        if completed.returncode != 0:
+            print(completed.stderr[-2000:], file=sys.stderr)
+    except subprocess.TimeoutExpired as e:
+        output = e.stdout.decode() if isinstance(e.stdout, bytes) else (e.stdout or "")
+        status = "timeout"
+
+    phases = {}
+    for line in output.splitlines():
+        if line.startswith("{"):
+            record = json.loads(line)
+            phases[record.pop("phase")] = record
+    result = {"size": size, "status": status, "wall_seconds": round(time.perf_counter() - start, 2), "phases": phases}
+    if status == "timeout":
+        finished = [p for p in ("generate", "graph_build", "index_build", "compatible_products", "product_set", "graph_stats") if p in phases]
+        result["stopped_after"] = finished[-1] if finished else None
+    return result
+
+
+def _print_result(result: Dict[str, Any]):
+    phases = result["phases"]
+    if result["status"] != "ok":
+        print(f"{result['size']:>9,}  {result['status']} after {result['wall_seconds']}s (last finished phase: {result.get('stopped_after')})")
+        return
+    build = phases["graph_build"]
+    print(
+        f"{result['size']:>9,}  build {build['seconds']:>9.3f}s  edges {build['edges']:>12,}  "
+        f"index {phases['index_build']['seconds']:>7.3f}s  "
+        f"query cold {phases['compatible_products']['cold']['mean_us']:>9.1f}us  "
+        f"cached {phases['compatible_products']['cached']['mean_us']:>6.1f}us  "
+        f"set {phases['product_set']['mean_us']:>8.1f}us  "
+        f"stats {phases['graph_stats']['seconds']:>7.3f}s  "
+        f"rss {phases['done']['rss_mb']:>7.1f}MB"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PKG on synthetic catalogs")
+    parser.add_argument("--sizes", default="100,1000,10000,100000,1000000")
+    parser.add_argument("--time-cap", type=float, default=120.0, help="seconds allowed per size")
+    parser.add_argument("--queries", type=int, default=200, help="timed calls per query type")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--impl", default="services.pkg_service:ProductKnowledgeGraph", help="module:Class taking products=")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_size(args.child, args.seed, args.queries, args.impl)
+        return
+
+    print(f"PKG benchmark: {args.impl}, seed {args.seed}, cap {args.time_cap:.0f}s per size\n")
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        if results and results[-1]["status"] != "ok":
+            results.append({"size": size, "status": "skipped"})
+            print(f"{size:>9,}  skipped")
+            continue
+        result = bench_size(size, args)
+        results.append(result)
+        _print_result(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"impl": args.impl, "seed": args.seed, "time_cap_s": args.time_cap, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
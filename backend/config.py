@@ -1,13 +1,168 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 class Settings(BaseSettings):
-    ANTHROPIC_API_KEY: str
-    REPLICATE_API_TOKEN: str
-    IMGBB_API_KEY: str
+    # Optional so the app can import and start without them; the features
+    # that need a key check for it (or fail) when first used
+    ANTHROPIC_API_KEY: str = ""
+    REPLICATE_API_TOKEN: str = ""
+    IMGBB_API_KEY: str = ""
     upload_dir: str = "./uploads"
     base_url: str = "http://localhost:8000"
     
+    # Upstream API base URLs; point all three at mock_upstream.py to run
+    # without network (ANTHROPIC_BASE_URL also sets the first one)
+    anthropic_base_url: str = "https://api.anthropic.com"
+    replicate_base_url: str = "https://api.replicate.com"
+    imgbb_base_url: str = "https://api.imgbb.com"
+    
+    # Overall latency budget for a design request (None = unbounded)
+    # Overridden per request with the X-Deadline-Ms header
+    default_deadline_ms: Optional[int] = None
+    # Smallest X-Deadline-Ms accepted; shorter budgets can't fit a single LLM call
+    min_deadline_ms: int = 1000
+    
+    # Hedged LLM calls: comma-separated agent names that opt in
+    # (e.g. "StyleAnalyst,LayoutOptimizer") and the global hedge-rate cap
+    hedge_agents: str = ""
+    hedge_rate_cap: float = 0.05
+    hedge_min_samples: int = 20
+    
+    # Interactive requests: product/layout agents return their local answer
+    # if the LLM misses this window (None = always wait for the LLM)
+    race_grace_ms: Optional[int] = None
+    
+    # Stream structured answers so list items (e.g. selected products) are
+    # acted on while the model is still writing the rest of the answer
+    llm_streaming_enabled: bool = True
+    
+    # Shared upstream limits (per process)
+    anthropic_sonnet_rpm: float = 50.0
+    anthropic_sonnet_tpm: float = 40000.0
+    anthropic_opus_rpm: float = 50.0
+    anthropic_opus_tpm: float = 20000.0
+    anthropic_haiku_rpm: float = 50.0
+    anthropic_haiku_tpm: float = 50000.0
+    anthropic_max_concurrency: int = 16
+    replicate_rpm: float = 60.0
+    replicate_max_concurrency: int = 4
+    imgbb_rpm: float = 60.0
+    
+    # Model routing: the model tiers, and per task the tiers it may use,
+    # preferred first. A tier is skipped while its limiter queue is at least
+    # routing_max_queue_depth deep, or when its p95 latency times
+    # routing_headroom_factor exceeds the time left before the deadline.
+    # Off by default: every task then uses the first tier of its route
+    # (workers Sonnet, ControlNet prompt Opus, as before routing existed).
+    # Set ROUTING_ENABLED=true to let busy or late calls step down a tier
+    routing_enabled: bool = False
+    tier_small_model: str = "claude-3-5-haiku-20241022"
+    tier_medium_model: str = "claude-sonnet-4-20250514"
+    tier_large_model: str = "claude-opus-4-20250514"
+    route_worker: str = "medium,small"
+    route_controlnet_prompt: str = "large,medium,small"
+    routing_max_queue_depth: int = 4
+    routing_headroom_factor: float = 1.5
+    routing_min_samples: int = 5
+    
+    # Retries and circuit breakers for Anthropic / Replicate / ImgBB
+    retry_max_attempts: int = 3
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 8.0
+    circuit_failure_threshold: int = 5
+    circuit_reset_seconds: float = 30.0
+    
+    # Batch design generation
+    batch_max_concurrency: int = 4
+    batch_requests_per_minute: float = 60.0
+    
+    # Shared HTTP connection pools (HTTP/2 is used when the h2 package is installed)
+    http_max_connections: int = 100
+    http_max_keepalive: int = 20
+    http_keepalive_expiry: float = 30.0
+    http_http2: bool = True
+    
+    # Event-loop lag sampling for /stats/runtime (0 = off)
+    loop_monitor_interval_ms: int = 100
+    
+    # On-demand profiling: requests with X-Profile: 1 plus X-Admin-Token,
+    # and a sampled fraction of requests under profile_paths, run under a
+    # stack sampler and tracemalloc; results kept in profile_dir, listed on
+    # /admin/profiles (admin endpoints are disabled while admin_token is empty)
+    admin_token: str = ""
+    profile_sample_rate: float = 0.0
+    profile_paths: str = "/agent/design"
+    profile_dir: str = "./profiles"
+    profile_interval_ms: float = 5.0
+    profile_tracemalloc: bool = True
+    profile_tracemalloc_frames: int = 10
+    profile_max_files: int = 50
+    profile_max_age_hours: float = 72.0
+    
+    # Upload limits: bodies over upload_max_bytes are refused with 413 while
+    # they stream in; images over upload_max_pixels are refused from their
+    # header, before any pixels are decoded
+    upload_max_bytes: int = 20 * 1024 * 1024
+    upload_max_pixels: int = 64_000_000
+    
+    # Local image host: uploads are stored by content hash under upload_dir.
+    # image_mirror: "lazy" mirrors an upload to ImgBB only when the
+    # transformer needs a public URL, "eager" mirrors each new upload in the
+    # background, "off" never (base_url is public). Without IMGBB_API_KEY
+    # it is always off. image_mirror_timeout is how long the transformer
+    # waits for a mirror before passing the local URL
+    image_mirror: str = "lazy"
+    image_mirror_timeout: float = 15.0
+    
+    # Logging: JSON lines (or "text") written by a background thread.
+    # log_levels / log_sample_rates per logger below "arcana.", e.g.
+    # "agents=WARNING" or "agents=0.1" (keep 10% of agent INFO records);
+    # records are dropped, not waited on, when the queue is full
+    log_format: str = "json"
+    log_level: str = "INFO"
+    log_levels: str = ""
+    log_sample_rates: str = ""
+    log_queue_size: int = 10000
+    
+    # Startup warm-up (/health reports "warming" until it finishes)
+    warmup_enabled: bool = True
+    warmup_connect_timeout: float = 3.0
+    # Style analyses kept in memory, saved on shutdown; the top N are
+    # replayed into memory on startup (0 = no replay). Off by default:
+    # a cached analysis is reused for every later request with the same
+    # prompt, room and styles instead of a fresh LLM answer
+    style_cache_enabled: bool = False
+    style_cache_size: int = 256
+    style_cache_path: str = "./cache/style_analyses.json"
+    warmup_style_replay: int = 0
+    
+    # Generated ControlNet prompts reused per scene (style, mood, colors, ...)
+    controlnet_prompt_cache_size: int = 512
+    
+    # Request tracing: spans per design request, summarised in the
+    # Server-Timing header; exporters is a comma-separated list of
+    # "json" (append to trace_json_path) and "otlp" (POST to otlp_endpoint)
+    tracing_enabled: bool = True
+    trace_exporters: str = ""
+    trace_json_path: str = "./traces/traces.jsonl"
+    otlp_endpoint: str = "http://localhost:4318/v1/traces"
+    trace_service_name: str = "arcana-backend"
+    # The Server-Timing header and timings field of design responses name
+    # internal steps and their latencies: sent only when expose_timings is
+    # on, or to a request with X-Trace: 1 plus X-Admin-Token
+    expose_timings: bool = False
+    
+    # Upstream record/replay: "off", "record" (save responses under
+    # cassette_dir) or "replay" (answer from cassettes, no network).
+    # Latency specs: recorded | none | fixed:MS | uniform:MIN:MAX |
+    # lognormal:MEDIAN_MS:SIGMA; overrides e.g. "anthropic=fixed:800,replicate=none"
+    cassette_mode: str = "off"
+    cassette_dir: str = "./cassettes"
+    cassette_latency: str = "recorded"
+    cassette_latency_overrides: str = ""
+    cassette_seed: int = 0
+    
     class Config:
         env_file = ".env"
         env_file_encoding = 'utf-8'
@@ -2,37 +2,84 @@
 # Phase 2: Multi-Agent Architecture Integration
 # Updated API to use Orchestrator pattern
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, FileResponse
+from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel, Field
 from typing import Dict, Any, List, Optional
-
-from fastapi.staticfiles import StaticFiles
-from services.image_service import ImageService
-import uuid
-
-import uvicorn
 from pathlib import Path
-import uvicorn
+from contextlib import asynccontextmanager
 import uuid
+import asyncio
+import json
+import uvicorn
 
-from models import DesignRequest, DesignResponse
+from models import DesignRequest, DesignResponse, BatchDesignRequest
 from config import get_settings
+from services.image_service import ImageService, ImageTooLarge
+from services.image_transformation import image_transformer
 from services.pkg_service import pkg_service
+from services.single_flight import SingleFlight, design_flight, pkg_flight, design_request_key, pkg_query_key
+from services.rate_limiter import RateLimiter, get_limiter_stats
+from services.design_updates import design_updates
+from services.resilience import get_circuit_stats
+from services.http_clients import clients
+from services.style_cache import style_cache
+from services.warmup import startup_warmup
+from services.runtime_monitor import runtime_monitor
+from services.profiler import profiler, PROFILE_KINDS
+from services.image_store import image_store, ContentAddressedFiles
+from services.upload_limit import UploadLimitMiddleware
+from services.tracing import start_trace, span, server_timing_header
+from services.structured_logging import get_logger, set_request_id, reset_request_id, logging_system
+from services.metrics import registry
+from services.prompt_cache import controlnet_prompt_cache
+from services.cassettes import cassettes
 
 # Import the orchestrator
 from agents.orchestrator import orchestrator
+from agents.anthropic_agent import design_agent
+from agents.style_agent import style_agent
+from agents.product_agent import product_agent
+from agents.layout_agent import layout_agent
+from agents.budget_agent import budget_agent
+from agents.hedging import hedge_budget
+from agents.model_router import model_router
 
-from services.image_transformation import image_transformer
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Startup/shutdown hook
+    Heavy singletons (PKG graph, SDK clients) are built lazily; the warm-up
+    builds them in the background while /health reports "warming"
+    """
+    warmup_task = None
+    if settings.warmup_enabled:
+        warmup_task = asyncio.create_task(startup_warmup.run())
+    else:
+        startup_warmup.mark_ready()
+    monitor_task = asyncio.create_task(runtime_monitor.run())
+    
+    yield
+    
+    monitor_task.cancel()
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    # Keep the most-used style analyses for the next start
+    if settings.style_cache_enabled:
+        style_cache.save(settings.style_cache_path)
+    # Release the shared connection pools
+    await clients.aclose()
+
 
 app = FastAPI(
     title="Arcana: Multi-Agent Design Architect API",
     description="AI-Powered Interior Design using Multi-Agent Orchestration",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 
@@ -48,14 +95,71 @@ app.add_middleware(
 )
 
 settings = get_settings()
+logger = get_logger("api")
 
-app.mount("/uploads", StaticFiles(directory=settings.upload_dir), name="uploads")
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    """Profile requests sent with X-Profile (admin) or picked by profile_sample_rate"""
+    trigger = profiler.trigger_for(request.url.path, request.headers)
+    session = profiler.start(trigger, f"{request.method} {request.url.path}") if trigger else None
+    if session is None:
+        return await call_next(request)
+    
+    try:
+        response = await call_next(request)
+    except BaseException:
+        # Snapshot and file writes stay off the event loop
+        await asyncio.to_thread(profiler.finish, session)
+        raise
+    
+    # The body is produced after call_next returns (a StreamingResponse's
+    # generator runs only now), so the profile ends with the last chunk
+    body_iterator = response.body_iterator
+    
+    async def profiled_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            # Snapshot and file writes stay off the event loop; shielded so a
+            # disconnect that cancels the stream can't skip saving the profile
+            await asyncio.shield(asyncio.to_thread(profiler.finish, session))
+    
+    response.body_iterator = profiled_body()
+    response.headers["X-Profile-Id"] = session.profile_id
+    return response
+
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    """Tag every log record of the request with X-Request-ID (the caller's, or a new one)"""
+    request_id = request.headers.get("x-request-id", "")
+    if not request_id or len(request_id) > 64 or not request_id.isprintable():
+        request_id = uuid.uuid4().hex
+    token = set_request_id(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        reset_request_id(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+# Refuse oversized uploads before the multipart parser spools them
+app.add_middleware(UploadLimitMiddleware, paths=["/upload-image"], max_bytes=settings.upload_max_bytes)
+
+# Shared across all batch requests so concurrent batches can't multiply upstream load
+batch_rate_limiter = RateLimiter(
+    "design_batch",
+    settings.batch_requests_per_minute,
+    burst=settings.batch_max_concurrency
+)
 
 # Ensure upload directory exists
 Path(settings.upload_dir).mkdir(exist_ok=True)
 
-# Mount static files
-app.mount("/uploads", StaticFiles(directory=settings.upload_dir), name="uploads")
+# Mount static files (content-addressed uploads: strong ETag, immutable caching, Range)
+app.mount("/uploads", ContentAddressedFiles(directory=settings.upload_dir), name="uploads")
 
 @app.get("/")
 async def root():
@@ -68,40 +172,83 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    # 503 until warm-up finishes so load balancers hold traffic off cold pods
+    if not startup_warmup.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming", "multi_agent": True, "warmup": startup_warmup.get_stats()}
+        )
     return {"status": "healthy", "multi_agent": True}
 
+
+@app.get("/stats/warmup")
+async def get_warmup_stats():
+    """Warm-up steps, their timings, and style cache usage"""
+    return {**startup_warmup.get_stats(), "style_cache": style_cache.get_stats()}
+
 @app.post("/upload-image")
 async def upload_image(file: UploadFile = File(...)):
     """
-    Upload constraint image and return public URL
-    This URL will be used in ControlNet API call
+    Upload constraint image and return its URL
+    
+    Images are stored locally by content hash, so re-uploading the same
+    image returns the same URL (deduplicated: true). ControlNet needs a
+    public URL, so the image is mirrored to ImgBB when it is transformed
+    (or right away with image_mirror=eager); mirror_url is set once that
+    upload has finished
+    
+    Uploads over upload_max_bytes, or images over upload_max_pixels,
+    are refused with 413
     """
     try:
-        # Read uploaded file
-        contents = await file.read()
-        
-        # Validate and resize
-        processed_image = ImageService.validate_and_resize(contents)
-        
-        # Generate unique filename
-        file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'png'
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        
-        # Upload to ImgBB and get public URL
-        public_url = ImageService.upload_to_imgbb(processed_image, unique_filename)
+        # Decode straight from the spooled temp file the multipart parser
+        # streamed the upload into, rather than reading it into memory.
+        # Validate, resize (always PNG) and store, off the event loop
+        processed_image = await asyncio.to_thread(ImageService.process_upload, file.file)
+        stored = await asyncio.to_thread(ImageService.store_upload, processed_image, "png")
         
         return {
             "success": True,
-            "url": public_url,
-            "filename": unique_filename,
+            "url": stored.url,
+            "filename": stored.filename,
+            "sha256": stored.digest,
+            "deduplicated": stored.deduplicated,
+            "mirror_url": image_store.mirror_url(stored.digest),
             "message": "Image uploaded successfully"
         }
         
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+
+def _pkg_products(request: DesignRequest, max_results: int = 10, flight: SingleFlight = pkg_flight) -> list:
+    """PKG query shared by concurrent identical requests (blocking; for worker threads)"""
+    return flight.do(
+        pkg_query_key(request.room_type.value, request.room_size, "modern", max_results),
+        pkg_service.get_compatible_products,
+        room_type=request.room_type.value,
+        room_size=request.room_size,
+        style_preference="modern",
+        max_results=max_results
+    )
+
+
+async def _pkg_products_async(request: DesignRequest, max_results: int = 10) -> list:
+    """_pkg_products for async handlers: waiting on a shared query never blocks the event loop"""
+    return await pkg_flight.do_async(
+        pkg_query_key(request.room_type.value, request.room_size, "modern", max_results),
+        pkg_service.get_compatible_products,
+        room_type=request.room_type.value,
+        room_size=request.room_size,
+        style_preference="modern",
+        max_results=max_results
+    )
+
+
 @app.get("/pkg/stats")
 async def get_pkg_stats():
     """Get Product Knowledge Graph statistics"""
@@ -110,12 +257,7 @@ async def get_pkg_stats():
 @app.post("/pkg/query")
 async def query_products(request: DesignRequest):
     """Query compatible products from PKG"""
-    products = pkg_service.get_compatible_products(
-        room_type=request.room_type.value,
-        room_size=request.room_size,
-        style_preference="modern",
-        max_results=10  # Increased for more agent options
-    )
+    products = await _pkg_products_async(request, max_results=10)  # Increased for more agent options
     
     return {
         "query": {
@@ -137,6 +279,11 @@ class MultiAgentDesignResponse(BaseModel):
     product_justification: str
     agent_outputs: Dict[str, Any]
     confidence_scores: Dict[str, float]
+    degraded_phases: List[str] = Field(default_factory=list)
+    design_id: Optional[str] = None
+    raced_phases: List[str] = Field(default_factory=list)
+    # Trace summary (total, per-step and per-span ms) when tracing is enabled
+    timings: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
 
 
@@ -145,13 +292,131 @@ STEP 3: Enhanced /agent/design/multi endpoint
 ADD THIS to your existing main.py (replace the old endpoint)
 """
 
-from services.image_transformation import image_transformer
+def _run_multi_agent_design(
+    request: DesignRequest,
+    style_memo: Optional[SingleFlight] = None,
+    pkg_memo: Optional[SingleFlight] = None,
+    deadline_ms: Optional[int] = None,
+    race_grace_ms: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Full PKG query + orchestration + room transformation for one request
+    Runs in a worker thread; identical concurrent requests share one run
+    Batches pass their own memos so style analyses and PKG queries are shared
+    """
+    with start_trace("design.multi", room_type=request.room_type.value, room_size=request.room_size) as trace:
+        design_result = _traced_multi_agent_design(request, style_memo, pkg_memo, deadline_ms, race_grace_ms)
+    
+    if trace is not None:
+        design_result["timings"] = trace.summary()
+    return design_result
+
+
+def _traced_multi_agent_design(
+    request: DesignRequest,
+    style_memo: Optional[SingleFlight],
+    pkg_memo: Optional[SingleFlight],
+    deadline_ms: Optional[int],
+    race_grace_ms: Optional[int]
+) -> Dict[str, Any]:
+    """_run_multi_agent_design body, run inside the request's trace"""
+    # Step 1: Get products from PKG
+    with span("pkg.query"):
+        products = _pkg_products(request, max_results=10, flight=pkg_memo or pkg_flight)
+    
+    if not products:
+        raise HTTPException(status_code=404, detail="No compatible products found in PKG")
+    
+    # Step 2: Get control image URL (if user uploaded one)
+    # For demo, we'll use a placeholder
+    control_image_url = "https://i.ibb.co/placeholder.png"  # Replace with actual uploaded image
+    
+    # Step 3: Convert request to dict for orchestrator
+    user_request = {
+        "prompt": request.prompt,
+        "room_type": request.room_type.value,
+        "room_size": request.room_size,
+        "style_preferences": request.style_preferences or [],
+        "budget_max": request.budget_max
+    }
+    
+    # Step 4: Call the orchestrator to coordinate all agents
+    logger.info("Starting multi-agent orchestration", extra={"room_type": user_request["room_type"]})
+    
+    products_dict = [prod.model_dump() for prod in products]
+
+    design_result = orchestrator.orchestrate_design(
+        user_request=user_request,
+        control_image_url=control_image_url,
+        available_products=products_dict,
+        style_memo=style_memo,
+        deadline_ms=deadline_ms or settings.default_deadline_ms,
+        race_grace_ms=race_grace_ms
+    )
+    
+    if not design_result.get("success", False):
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Orchestration failed: {design_result.get('error', 'Unknown error')}"
+        )
+    
+    # Step 5: NEW - Transform the room image
+    style_data = design_result.get("agent_outputs", {}).get("style_analysis", {})
+    transformed_image_url = None
+    
+    if control_image_url and control_image_url != "https://i.ibb.co/placeholder.png":
+        logger.info("Transforming room image")
+        with span("room.transform"):
+            transformed_image_url = image_transformer.transform_room(
+                image_url=control_image_url,
+                style_prompt=style_data,
+                room_type=request.room_type.value
+            )
+    
+    #  Step 6: Add image URLs to response
+    design_result["room_images"] = {
+        "original": control_image_url,
+        "transformed": transformed_image_url
+    }
+    
+    logger.info("Orchestration complete", extra={
+        "products_with_images": len(design_result.get('agent_outputs', {}).get('product_recommendations', {}).get('selected_products', [])),
+        "room_transformed": bool(transformed_image_url)
+    })
+    
+    return design_result
+
+
+def _timings_requested(x_trace: Optional[str], x_admin_token: Optional[str]) -> bool:
+    """Whether a response may carry Server-Timing and timings"""
+    return settings.expose_timings or (x_trace == "1" and profiler.is_admin(x_admin_token))
+
 
 @app.post("/agent/design/multi", response_model=MultiAgentDesignResponse)
-async def generate_design_with_multi_agent(request: DesignRequest):
+async def generate_design_with_multi_agent(
+    request: DesignRequest,
+    response: Response,
+    x_deadline_ms: Optional[int] = Header(default=None, ge=settings.min_deadline_ms),
+    x_trace: Optional[str] = Header(default=None),
+    x_admin_token: Optional[str] = Header(default=None)
+):
     """
     Enhanced Multi-Agent Design with Image Transformation
     
+    Concurrent requests with an identical normalized DesignRequest and
+    the same deadline are coalesced into a single orchestration and all
+    receive its result
+    
+    X-Deadline-Ms sets an overall latency budget: phases that run out of
+    their slice use local fallbacks and are listed in degraded_phases
+    
+    With race_grace_ms configured, raced_phases lists phases answered
+    locally; poll /agent/design/{design_id}/updates for their LLM results
+    
+    The request is traced: Server-Timing summarises the top-level steps
+    and timings carries every span (PKG query, phases, LLM calls, images);
+    both are sent only with expose_timings, or X-Trace: 1 plus X-Admin-Token
+    
     Returns:
     - agent_outputs: All agent results
     - confidence_scores: Agent confidence levels
@@ -159,82 +424,202 @@ async def generate_design_with_multi_agent(request: DesignRequest):
     - visual_products: Products with image URLs  ← NEW
     """
     try:
-        # Step 1: Get products from PKG
-        products = pkg_service.get_compatible_products(
-            room_type=request.room_type.value,
-            room_size=request.room_size,
-            style_preference="modern",
-            max_results=10
-        )
-        
-        if not products:
-            raise HTTPException(status_code=404, detail="No compatible products found in PKG")
-        
-        # Step 2: Get control image URL (if user uploaded one)
-        # For demo, we'll use a placeholder
-        control_image_url = "https://i.ibb.co/placeholder.png"  # Replace with actual uploaded image
-        
-        # Step 3: Convert request to dict for orchestrator
-        user_request = {
-            "prompt": request.prompt,
-            "room_type": request.room_type.value,
-            "room_size": request.room_size,
-            "style_preferences": request.style_preferences or [],
-            "budget_max": request.budget_max
-        }
-        
-        # Step 4: Call the orchestrator to coordinate all agents
-        print("\n" + "="*60)
-        print("STARTING MULTI-AGENT ORCHESTRATION")
-        print("="*60 + "\n")
-        
-        products_dict = [prod.model_dump() for prod in products]
-
-        design_result = orchestrator.orchestrate_design(
-            user_request=user_request,
-            control_image_url=control_image_url,
-            available_products=products_dict
+        deadline_ms = x_deadline_ms or settings.default_deadline_ms
+        design_result = await design_flight.do_async(
+            design_request_key(request, deadline_ms),
+            _run_multi_agent_design,
+            request,
+            None,
+            None,
+            deadline_ms,
+            settings.race_grace_ms
         )
         
-        if not design_result.get("success", False):
-            raise HTTPException(
-                status_code=500, 
-                detail=f"Orchestration failed: {design_result.get('error', 'Unknown error')}"
-            )
-        
-        # Step 5: NEW - Transform the room image
-        style_data = design_result.get("agent_outputs", {}).get("style_analysis", {})
-        transformed_image_url = None
-        
-        if control_image_url and control_image_url != "https://i.ibb.co/placeholder.png":
-            print("\n Transforming room image...")
-            transformed_image_url = image_transformer.transform_room(
-                image_url=control_image_url,
-                style_prompt=style_data,
-                room_type=request.room_type.value
-            )
-        
-        #  Step 6: Add image URLs to response
-        design_result["room_images"] = {
-            "original": control_image_url,
-            "transformed": transformed_image_url
-        }
-        
-        print("\n" + "="*60)
-        print("ORCHESTRATION COMPLETE")
-        print(f"Products with images: {len(design_result.get('agent_outputs', {}).get('product_recommendations', {}).get('selected_products', []))}")
-        print(f"Room transformed: {'Yes' if transformed_image_url else 'No'}")
-        print("="*60 + "\n")
-        
+        # Shallow copy so per-caller changes never leak into a shared result
+        design_result = dict(design_result)
+        timings = design_result.pop("timings", None)
+        if timings and _timings_requested(x_trace, x_admin_token):
+            response.headers["Server-Timing"] = server_timing_header(timings)
+            design_result["timings"] = timings
         return design_result
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Design generation failed: {str(e)}")
+        logger.error(f"Design generation failed: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Design generation failed: {str(e)}")
 
 
+@app.post("/agent/design/batch")
+async def generate_design_batch(
+    batch: BatchDesignRequest,
+    x_trace: Optional[str] = Header(default=None),
+    x_admin_token: Optional[str] = Header(default=None)
+):
+    """
+    Generate many designs with bounded concurrency
+    
+    Requests share the server-wide batch rate limiter, and identical style
+    analyses / PKG queries are computed once per batch. Results stream back
+    as NDJSON in completion order, one line per request:
+    {"index": 3, "success": true, "result": {...}}
+    
+    Results include timings only with expose_timings, or X-Trace: 1 plus
+    X-Admin-Token
+    """
+    include_timings = _timings_requested(x_trace, x_admin_token)
+    max_concurrency = batch.max_concurrency or settings.batch_max_concurrency
+    semaphore = asyncio.Semaphore(max_concurrency)
+    style_memo = SingleFlight("batch_style", memoize=True)
+    pkg_memo = SingleFlight("batch_pkg", memoize=True)
+    
+    async def run_one(index: int, request: DesignRequest) -> Dict[str, Any]:
+        async with semaphore:
+            await batch_rate_limiter.acquire_async()
+            try:
+                result = await asyncio.to_thread(_run_multi_agent_design, request, style_memo, pkg_memo)
+                if not include_timings:
+                    result.pop("timings", None)
+                return {"index": index, "success": True, "result": result}
+            except HTTPException as e:
+                return {"index": index, "success": False, "error": e.detail}
+            except Exception as e:
+                logger.error(f"Batch item {index} failed: {str(e)}")
+                return {"index": index, "success": False, "error": str(e)}
+    
+    async def stream_results():
+        tasks = [asyncio.create_task(run_one(i, r)) for i, r in enumerate(batch.requests)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                item = await next_done
+                yield json.dumps(jsonable_encoder(item)) + "\n"
+        finally:
+            # Client went away - stop scheduling the rest of the batch
+            for task in tasks:
+                task.cancel()
+            logger.info("Batch finished", extra={"style_memo": style_memo.get_stats(), "pkg_memo": pkg_memo.get_stats()})
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@app.get("/agent/design/{design_id}/updates")
+async def get_design_updates(design_id: str):
+    """Late LLM results for phases that were answered locally"""
+    updates = design_updates.get(design_id)
+    if updates is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired design_id")
+    return updates
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint: per-agent tokens, cost, latency and TTFT, upstream timings, limiter and cache state"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/stats/coalescing")
+async def get_coalescing_stats():
+    """Request coalescing metrics for design orchestration and PKG queries"""
+    return {
+        "design": design_flight.get_stats(),
+        "pkg_query": pkg_flight.get_stats()
+    }
+
+
+@app.get("/stats/hedging")
+async def get_hedging_stats():
+    """Per-agent latency percentiles and global hedge usage"""
+    return {
+        "budget": hedge_budget.get_stats(),
+        "agents": {
+            worker.agent_name: {
+                "hedge_enabled": worker.hedge_enabled,
+                **worker.latency.get_stats()
+            }
+            for worker in orchestrator.workers.values()
+        }
+    }
+
+
+@app.get("/stats/routing")
+async def get_routing_stats():
+    """Model chosen per task, why preferred tiers were skipped, and per-model latency"""
+    return model_router.get_stats()
+
+
+@app.get("/stats/controlnet-prompts")
+async def get_controlnet_prompt_stats():
+    """ControlNet prompt cache: exact hits, spliced reuses and scenes that needed Opus"""
+    return controlnet_prompt_cache.get_stats()
+
+
+@app.get("/stats/cassettes")
+async def get_cassette_stats():
+    """Upstream record/replay: mode, recorded interactions, replays and misses"""
+    return cassettes.get_stats()
+
+
+@app.get("/stats/runtime")
+async def get_runtime_stats(since: Optional[float] = None):
+    """Event-loop lag (optionally only since a unix time) and memory of the answering worker"""
+    return runtime_monitor.get_stats(since)
+
+
+@app.get("/stats/images")
+async def get_image_stats():
+    """Local image store: writes, deduplicated uploads and ImgBB mirrors"""
+    return image_store.get_stats()
+
+
+@app.get("/stats/logging")
+async def get_logging_stats():
+    """Log records waiting to be written, dropped on a full queue, and sampled out"""
+    return logging_system.get_stats()
+
+
+def _require_admin(token: Optional[str]):
+    if not profiler.is_admin(token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@app.get("/admin/profiles")
+async def list_profiles(x_admin_token: Optional[str] = Header(default=None)):
+    """Saved request profiles, newest first"""
+    _require_admin(x_admin_token)
+    return {**profiler.get_stats(), "profiles": profiler.list_profiles()}
+
+
+@app.get("/admin/profiles/{profile_id}/{kind}")
+async def download_profile(profile_id: str, kind: str, x_admin_token: Optional[str] = Header(default=None)):
+    """One file of a profile: collapsed (folded stacks), tracemalloc (snapshot) or json"""
+    _require_admin(x_admin_token)
+    path = profiler.profile_path(profile_id, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type=PROFILE_KINDS[kind], filename=path.name)
+
+
+@app.get("/stats/limits")
+async def get_limiter_stats_endpoint():
+    """Queue depth, wait times and remaining capacity of shared upstream limiters"""
+    return {
+        "upstreams": get_limiter_stats(),
+        "design_batch": batch_rate_limiter.get_stats()
+    }
+
+
+@app.get("/stats/circuits")
+async def get_circuit_stats_endpoint():
+    """Circuit breaker state per upstream"""
+    return get_circuit_stats()
+
+
+@app.get("/stats/prompt-cache")
+async def get_prompt_cache_stats():
+    """Token usage per agent, with prompt-cache reads/writes and the resulting input cost ratio"""
+    return orchestrator.get_usage_stats()
+
+
 @app.post("/transform-image")
 async def transform_uploaded_image(
     image_url: str,
@@ -247,7 +632,8 @@ async def transform_uploaded_image(
     Use this endpoint to test image transformation separately
     """
     try:
-        transformed_url = image_transformer.transform_room(
+        transformed_url = await asyncio.to_thread(
+            image_transformer.transform_room,
             image_url=image_url,
             style_prompt=style,
             room_type=room_type
@@ -273,14 +659,7 @@ async def generate_design_single_agent(request: DesignRequest):
     Legacy single-agent endpoint (for comparison)
     Uses the original AnthropicDesignAgent
     """
-    from agents.anthropic_agent import design_agent
-    
-    products = pkg_service.get_compatible_products(
-        room_type=request.room_type.value,
-        room_size=request.room_size,
-        style_preference="modern",
-        max_results=5
-    )
+    products = await _pkg_products_async(request, max_results=5)
     
     if not products:
         raise HTTPException(status_code=404, detail="No compatible products found")
@@ -288,7 +667,9 @@ async def generate_design_single_agent(request: DesignRequest):
     mock_image_url = "https://i.ibb.co/placeholder.png"
     
     try:
-        design_response = design_agent.generate_design(
+        # Blocking LLM call: keep it off the event loop
+        design_response = await asyncio.to_thread(
+            design_agent.generate_design,
             user_request=request,
             control_image_url=mock_image_url,
             available_products=products
@@ -303,11 +684,6 @@ async def generate_design_single_agent(request: DesignRequest):
 @app.get("/agent/test")
 async def test_agent_connections():
     """Test if all agents are properly initialized"""
-    from agents.style_agent import style_agent
-    from agents.product_agent import product_agent
-    from agents.layout_agent import layout_agent
-    from agents.budget_agent import budget_agent
-    
     return {
         "orchestrator": "initialized",
         "workers": {
@@ -0,0 +1,480 @@
+"""
+Mock Upstream Server
+Local stand-in for the Anthropic Messages API, Replicate predictions and
+ImgBB upload, for running the whole stack offline or under load
+
+Speaks the subset of each API the backend uses: Anthropic messages
+(plain and SSE streaming, with tool_use answers generated from the forced
+tool's input schema), Replicate predictions (version and model refs, with
+generated output images) and ImgBB base64 upload. Latency, error rate and
+429 rate are configurable per upstream and can be changed while running
+through /_mock/config.
+
+Usage:
+    python mock_upstream.py --port 8100 \\
+        --latency "anthropic=lognormal:800:0.5,replicate=fixed:3000" \\
+        --error-rate 0.02 --rate-limit-rate "anthropic=0.05"
+
+    # then start the backend against it
+    ANTHROPIC_BASE_URL=http://localhost:8100 \\
+    REPLICATE_BASE_URL=http://localhost:8100 \\
+    IMGBB_BASE_URL=http://localhost:8100 uvicorn main:app
+"""
+import argparse
+import asyncio
+import base64
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from services.cassettes import LatencyModel
+
+UPSTREAMS = ("anthropic", "replicate", "imgbb")
+
+MOCK_TEXT = (
+    "A bright, well-composed interior with soft natural light, layered textures "
+    "and the selected furniture arranged around a clear focal point."
+)
+
+
+def _per_upstream(value: str, default: str) -> Dict[str, str]:
+    """'0.05' or 'anthropic=0.05,imgbb=0.1' -> value per upstream"""
+    values = {upstream: default for upstream in UPSTREAMS}
+    for part in filter(None, (p.strip() for p in (value or "").split(","))):
+        if "=" in part:
+            upstream, setting = part.split("=", 1)
+            values[upstream.strip()] = setting.strip()
+        else:
+            values = {upstream: part for upstream in UPSTREAMS}
+    return values
+
+
+class MockConfig:
+    """Latency, fault injection and counters, shared by all handlers"""
+
+    def __init__(self, latency: str = "", error_rate: str = "0", rate_limit_rate: str = "0", seed: int = 0):
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self.requests: Dict[str, int] = defaultdict(int)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.rate_limited: Dict[str, int] = defaultdict(int)
+        self.update(latency, error_rate, rate_limit_rate)
+
+    def update(self, latency: Optional[str] = None, error_rate: Optional[str] = None, rate_limit_rate: Optional[str] = None):
+        with self._lock:
+            if latency is not None:
+                specs = {"anthropic": "lognormal:800:0.5", "replicate": "lognormal:4000:0.3", "imgbb": "fixed:200"}
+                specs.update({k: v for k, v in _per_upstream(latency, "").items() if v})
+                self.latency_specs = specs
+                self.latency = {upstream: LatencyModel(spec) for upstream, spec in specs.items()}
+            if error_rate is not None:
+                self.error_rate = {k: float(v) for k, v in _per_upstream(error_rate, "0").items()}
+            if rate_limit_rate is not None:
+                self.rate_limit_rate = {k: float(v) for k, v in _per_upstream(rate_limit_rate, "0").items()}
+
+    def delay(self, upstream: str) -> float:
+        with self._lock:
+            return self.latency[upstream].sample(0.0, self._rng)
+
+    def fault(self, upstream: str) -> Optional[str]:
+        """'rate_limit', 'error' or None for this request"""
+        with self._lock:
+            self.requests[upstream] += 1
+            roll = self._rng.random()
+            if roll < self.rate_limit_rate[upstream]:
+                self.rate_limited[upstream] += 1
+                return "rate_limit"
+            if roll < self.rate_limit_rate[upstream] + self.error_rate[upstream]:
+                self.errors[upstream] += 1
+                return "error"
+            return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "latency": dict(self.latency_specs),
+                "error_rate": dict(self.error_rate),
+                "rate_limit_rate": dict(self.rate_limit_rate),
+                "requests": dict(self.requests),
+                "errors_injected": dict(self.errors),
+                "rate_limited": dict(self.rate_limited)
+            }
+
+
+class _Store:
+    """Small LRU for predictions and uploaded images"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, Any]" = OrderedDict()
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._items[key] = value
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            return self._items.get(key)
+
+
+config = MockConfig()
+predictions = _Store()
+uploads = _Store(256)
+
+app = FastAPI(title="Arcana Mock Upstreams")
+
+
+def _base(request: Request) -> str:
+    return str(request.base_url).rstrip("/")
+
+
+def _generated_png() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (512, 512), (214, 205, 190)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+_PNG = _generated_png()
+
+
+# ============================================
+# Tool input generated from the JSON schema
+# ============================================
+def _resolve(schema: Dict[str, Any], root: Dict[str, Any]) -> Dict[str, Any]:
+    ref = schema.get("$ref")
+    if ref and ref.startswith("#/"):
+        target = root
+        for part in ref[2:].split("/"):
+            target = target[part]
+        return _resolve(target, root)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if key in schema:
+            options = [s for s in schema[key] if s.get("type") != "null"]
+            if options:
+                return _resolve(options[0], root)
+    return schema
+
+
+def sample_from_schema(schema: Dict[str, Any], root: Optional[Dict[str, Any]] = None, name: str = "value", index: int = 0) -> Any:
+    """
+    Plausible value for a JSON schema: enums take their first option,
+    numbers the middle of their range, and integers inside arrays count up
+    (so product indexes in a selection differ)
+    """
+    root = root if root is not None else schema
+    schema = _resolve(schema, root)
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+
+    kind = schema.get("type", "object")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "string")
+
+    if kind == "object":
+        return {
+            key: sample_from_schema(sub, root, key, index)
+            for key, sub in schema.get("properties", {}).items()
+        }
+    if kind == "array":
+        count = max(schema.get("minItems", 2), 1)
+        count = min(count, schema.get("maxItems", count))
+        return [sample_from_schema(schema.get("items", {}), root, name, i) for i in range(count)]
+    if kind == "integer":
+        low = schema.get("minimum", 0)
+        high = schema.get("maximum", low + 100)
+        return int(min(max(low + index, low), high))
+    if kind == "number":
+        low = schema.get("minimum", 0.0)
+        high = schema.get("maximum", 1.0 if low <= 1.0 else low * 2)
+        return round((low + high) / 2, 2)
+    if kind == "boolean":
+        return True
+    if schema.get("format") == "uri":
+        return "https://example.com/mock"
+    return f"mock {name.replace('_', ' ')}"
+
+
+# ============================================
+# Anthropic
+# ============================================
+def _anthropic_error(status: int, error_type: str, message: str, headers: Optional[Dict[str, str]] = None):
+    return JSONResponse(
+        {"type": "error", "error": {"type": error_type, "message": message}},
+        status_code=status,
+        headers=headers
+    )
+
+
+def _anthropic_fault(fault: Optional[str]):
+    if fault == "rate_limit":
+        return _anthropic_error(429, "rate_limit_error", "Mock rate limit", {"retry-after": "1"})
+    if fault == "error":
+        return _anthropic_error(529, "overloaded_error", "Mock overload")
+    return None
+
+
+def _content_for(body: Dict[str, Any]) -> List[Dict[str, Any]]:
+    tool_choice = body.get("tool_choice") or {}
+    if tool_choice.get("type") == "tool":
+        tool = next((t for t in body.get("tools", []) if t.get("name") == tool_choice.get("name")), None)
+        if tool is not None:
+            return [{
+                "type": "tool_use",
+                "id": f"toolu_{uuid.uuid4().hex[:24]}",
+                "name": tool["name"],
+                "input": sample_from_schema(tool.get("input_schema", {}))
+            }]
+    return [{"type": "text", "text": MOCK_TEXT}]
+
+
+def _message(body: Dict[str, Any], content: List[Dict[str, Any]]) -> Dict[str, Any]:
+    prompt_size = len(json.dumps([body.get("system"), body.get("messages"), body.get("tools")], default=str))
+    output_size = len(json.dumps(content))
+    return {
+        "id": f"msg_{uuid.uuid4().hex[:24]}",
+        "type": "message",
+        "role": "assistant",
+        "model": body.get("model", "mock"),
+        "content": content,
+        "stop_reason": "tool_use" if content[0]["type"] == "tool_use" else "end_turn",
+        "stop_sequence": None,
+        "usage": {
+            "input_tokens": max(prompt_size // 4, 1),
+            "output_tokens": max(output_size // 4, 1),
+            "cache_creation_input_tokens": 0,
+            "cache_read_input_tokens": 0
+        }
+    }
+
+
+def _sse(event: str, data: Dict[str, Any]) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+async def _stream_message(message: Dict[str, Any], delay: float):
+    """SSE events of the Messages streaming API; ~30% of the delay before the first delta"""
+    chunks = []
+    for index, block in enumerate(message["content"]):
+        if block["type"] == "tool_use":
+            text = json.dumps(block["input"])
+            chunks.append((index, {"type": "tool_use", "id": block["id"], "name": block["name"], "input": {}},
+                           [{"type": "input_json_delta", "partial_json": text[i:i + 24]} for i in range(0, len(text), 24)]))
+        else:
+            text = block["text"]
+            chunks.append((index, {"type": "text", "text": ""},
+                           [{"type": "text_delta", "text": text[i:i + 24]} for i in range(0, len(text), 24)]))
+    deltas = sum(len(d) for _, _, d in chunks) or 1
+
+    start = dict(message, content=[], stop_reason=None, usage=dict(message["usage"], output_tokens=1))
+    await asyncio.sleep(delay * 0.3)
+    yield _sse("message_start", {"type": "message_start", "message": start})
+    for index, block, block_deltas in chunks:
+        yield _sse("content_block_start", {"type": "content_block_start", "index": index, "content_block": block})
+        for delta in block_deltas:
+            await asyncio.sleep(delay * 0.7 / deltas)
+            yield _sse("content_block_delta", {"type": "content_block_delta", "index": index, "delta": delta})
+        yield _sse("content_block_stop", {"type": "content_block_stop", "index": index})
+    yield _sse("message_delta", {
+        "type": "message_delta",
+        "delta": {"stop_reason": message["stop_reason"], "stop_sequence": None},
+        "usage": {"output_tokens": message["usage"]["output_tokens"]}
+    })
+    yield _sse("message_stop", {"type": "message_stop"})
+
+
+@app.post("/v1/messages")
+async def anthropic_messages(request: Request):
+    body = await request.json()
+    missing = [field for field in ("model", "max_tokens", "messages") if field not in body]
+    if missing:
+        return _anthropic_error(400, "invalid_request_error", f"Missing fields: {', '.join(missing)}")
+
+    fault = _anthropic_fault(config.fault("anthropic"))
+    if fault is not None:
+        return fault
+
+    message = _message(body, _content_for(body))
+    delay = config.delay("anthropic")
+    if body.get("stream"):
+        return StreamingResponse(_stream_message(message, delay), media_type="text/event-stream")
+    await asyncio.sleep(delay)
+    return message
+
+
+# ============================================
+# Replicate
+# ============================================
+def _replicate_fault(fault: Optional[str]):
+    if fault == "rate_limit":
+        return JSONResponse({"title": "Too Many Requests", "detail": "Mock rate limit", "status": 429}, status_code=429, headers={"retry-after": "1"})
+    if fault == "error":
+        return JSONResponse({"title": "Internal Server Error", "detail": "Mock failure", "status": 500}, status_code=500)
+    return None
+
+
+async def _create_prediction(request: Request, version: Optional[str], model: Optional[str]):
+    body = await request.json()
+    fault = _replicate_fault(config.fault("replicate"))
+    if fault is not None:
+        return fault
+
+    await asyncio.sleep(config.delay("replicate"))
+    prediction_id = uuid.uuid4().hex[:26]
+    base = _base(request)
+    count = max(int(body.get("input", {}).get("num_outputs", 1) or 1), 1)
+    prediction = {
+        "id": prediction_id,
+        "model": model or "mock/model",
+        "version": version or body.get("version", ""),
+        "status": "succeeded",
+        "input": body.get("input", {}),
+        "output": [f"{base}/files/{prediction_id}-{i}.png" for i in range(count)],
+        "logs": "",
+        "error": None,
+        "metrics": {"predict_time": 0.0},
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "urls": {
+            "get": f"{base}/v1/predictions/{prediction_id}",
+            "cancel": f"{base}/v1/predictions/{prediction_id}/cancel"
+        }
+    }
+    predictions.put(prediction_id, prediction)
+    return JSONResponse(prediction, status_code=201)
+
+
+@app.post("/v1/predictions")
+async def replicate_create_prediction(request: Request):
+    return await _create_prediction(request, None, None)
+
+
+@app.post("/v1/models/{owner}/{name}/predictions")
+async def replicate_create_model_prediction(owner: str, name: str, request: Request):
+    return await _create_prediction(request, None, f"{owner}/{name}")
+
+
+@app.get("/v1/predictions/{prediction_id}")
+async def replicate_get_prediction(prediction_id: str):
+    prediction = predictions.get(prediction_id)
+    if prediction is None:
+        return JSONResponse({"title": "Not found", "status": 404}, status_code=404)
+    return prediction
+
+
+@app.get("/v1/models/{owner}/{name}/versions/{version_id}")
+async def replicate_get_version(owner: str, name: str, version_id: str):
+    return {
+        "id": version_id,
+        "created_at": "2024-01-01T00:00:00Z",
+        "cog_version": "0.9.0",
+        "openapi_schema": {
+            "openapi": "3.0.2",
+            "components": {"schemas": {"Output": {"type": "array", "items": {"type": "string", "format": "uri"}}}}
+        }
+    }
+
+
+@app.get("/files/{filename}")
+async def generated_file(filename: str):
+    return Response(_PNG, media_type="image/png")
+
+
+# ============================================
+# ImgBB
+# ============================================
+@app.post("/1/upload")
+async def imgbb_upload(request: Request):
+    # Like ImgBB: "image" is a file part or a base64 string
+    form = await request.form()
+    key, image, name = form.get("key", ""), form.get("image"), form.get("name", "")
+    if not key:
+        return JSONResponse({"status_code": 400, "error": {"message": "Invalid API v1 key."}, "success": False}, status_code=400)
+
+    fault = config.fault("imgbb")
+    if fault == "rate_limit":
+        return JSONResponse({"status_code": 429, "error": {"message": "Rate limit"}, "success": False}, status_code=429, headers={"retry-after": "1"})
+    if fault == "error":
+        return JSONResponse({"status_code": 500, "error": {"message": "Mock failure"}, "success": False}, status_code=500)
+
+    if image is None:
+        return JSONResponse({"status_code": 400, "error": {"message": "Empty upload source."}, "success": False}, status_code=400)
+    try:
+        data = await image.read() if hasattr(image, "read") else base64.b64decode(image, validate=True)
+    except ValueError:
+        return JSONResponse({"status_code": 400, "error": {"message": "Invalid base64 image"}, "success": False}, status_code=400)
+
+    await asyncio.sleep(config.delay("imgbb"))
+    image_id = uuid.uuid4().hex[:12]
+    uploads.put(image_id, data)
+    url = f"{_base(request)}/i/{image_id}"
+    return {
+        "data": {"id": image_id, "title": name, "url": url, "display_url": url, "size": len(data)},
+        "success": True,
+        "status": 200
+    }
+
+
+@app.get("/i/{image_id}")
+async def uploaded_image(image_id: str):
+    data = uploads.get(image_id)
+    if data is None:
+        return Response(status_code=404)
+    return Response(data, media_type="application/octet-stream")
+
+
+# ============================================
+# Control
+# ============================================
+@app.get("/_mock/config")
+async def get_mock_config():
+    """Current latency / fault settings and per-upstream counters"""
+    return config.to_dict()
+
+
+@app.post("/_mock/config")
+async def update_mock_config(request: Request):
+    """Change settings while running, e.g. {"error_rate": "anthropic=0.2"}"""
+    body = await request.json()
+    try:
+        config.update(body.get("latency"), body.get("error_rate"), body.get("rate_limit_rate"))
+    except ValueError as e:
+        return JSONResponse({"detail": str(e)}, status_code=400)
+    return config.to_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Anthropic / Replicate / ImgBB upstreams")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", default="", help='e.g. "anthropic=lognormal:800:0.5,imgbb=none"')
+    parser.add_argument("--error-rate", default="0", help='fraction of 5xx answers, e.g. "0.02" or "replicate=0.1"')
+    parser.add_argument("--rate-limit-rate", default="0", help="fraction of 429 answers, same format")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    global config
+    config = MockConfig(args.latency, args.error_rate, args.rate_limit_rate, args.seed)
+
+    base = f"http://{args.host}:{args.port}"
+    print(f"Mock upstreams on {base} ({json.dumps(config.to_dict()['latency'])})")
+    print(f"  ANTHROPIC_BASE_URL={base} REPLICATE_BASE_URL={base} IMGBB_BASE_URL={base}")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
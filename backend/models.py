@@ -42,6 +42,11 @@ class DesignRequest(BaseModel):
     style_preferences: List[str] = Field(default_factory=list)
     budget_max: Optional[float] = Field(default=None, description="Maximum budget in USD")
 
+class BatchDesignRequest(BaseModel):
+    """Many design requests scheduled together"""
+    requests: List[DesignRequest] = Field(..., min_length=1, max_length=1000)
+    max_concurrency: Optional[int] = Field(default=None, ge=1, le=32, description="Defaults to server setting")
+
 class DesignResponse(BaseModel):
     """Final API response"""
     control_params: ControlNetParams
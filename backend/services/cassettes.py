@@ -0,0 +1,396 @@
+"""
+Record/Replay Cassettes
+Stores upstream responses (Anthropic, Replicate, ImgBB) in cassette files
+and replays them offline with synthetic latency
+
+With cassette_mode="record" the shared clients wrap the real SDK clients
+and save every response under a hash of its request. With "replay" no
+network is used at all: the same requests are answered from the cassettes
+after a delay drawn from the configured latency distribution, so whole
+design flows can be benchmarked deterministically.
+
+Latency specs (cassette_latency, per upstream in cassette_latency_overrides):
+    recorded                the duration measured while recording
+    none                    no delay
+    fixed:MS                always MS milliseconds
+    uniform:MIN_MS:MAX_MS   uniformly distributed
+    lognormal:MEDIAN_MS:SIGMA
+"""
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import types
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import get_settings
+
+settings = get_settings()
+
+# Request fields that must not change which recording is replayed
+_VOLATILE_FIELDS = {"timeout", "model"}
+
+
+class CassetteMiss(Exception):
+    """Replay mode found no recording for this request"""
+
+
+def request_key(upstream: str, request: Dict[str, Any]) -> str:
+    """Stable hash of the request (volatile fields and credentials excluded)"""
+    canonical = json.dumps(
+        {k: v for k, v in request.items() if k not in _VOLATILE_FIELDS},
+        sort_keys=True, default=str, separators=(",", ":")
+    )
+    return hashlib.sha256(f"{upstream}\n{canonical}".encode()).hexdigest()[:32]
+
+
+class LatencyModel:
+    """Synthetic latency from a spec string (see module docstring)"""
+
+    def __init__(self, spec: str):
+        parts = (spec or "recorded").strip().split(":")
+        self.kind = parts[0]
+        self.params = [float(p) for p in parts[1:]]
+        expected = {"recorded": 0, "none": 0, "fixed": 1, "uniform": 2, "lognormal": 2}
+        if self.kind not in expected or len(self.params) != expected[self.kind]:
+            raise ValueError(f"Invalid cassette latency spec: {spec!r}")
+
+    def sample(self, recorded_ms: float, rng: random.Random) -> float:
+        """Delay in seconds"""
+        if self.kind == "recorded":
+            ms = recorded_ms
+        elif self.kind == "none":
+            ms = 0.0
+        elif self.kind == "fixed":
+            ms = self.params[0]
+        elif self.kind == "uniform":
+            ms = rng.uniform(self.params[0], self.params[1])
+        else:
+            ms = rng.lognormvariate(math.log(self.params[0]), self.params[1])
+        return max(ms, 0.0) / 1000.0
+
+
+class CassetteStore:
+    """Cassette files on disk: {cassette_dir}/{upstream}/{key}.json"""
+
+    def __init__(self, directory: str, mode: str, default_latency: str, overrides: str, seed: int):
+        self.directory = Path(directory)
+        self.mode = mode
+        self.seed = seed
+        self._lock = threading.Lock()
+        self._loaded: Dict[str, Dict[str, Any]] = {}
+        self._replays: Dict[str, int] = {}
+
+        self._default_latency = LatencyModel(default_latency)
+        self._latency: Dict[str, LatencyModel] = {}
+        for override in filter(None, (o.strip() for o in overrides.split(","))):
+            upstream, spec = override.split("=", 1)
+            self._latency[upstream.strip()] = LatencyModel(spec)
+
+        # Metrics
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _path(self, upstream: str, key: str) -> Path:
+        return self.directory / upstream / f"{key}.json"
+
+    def _load(self, upstream: str, key: str) -> Optional[Dict[str, Any]]:
+        """Cassette contents (cached after the first read); call with the lock held"""
+        if key not in self._loaded:
+            path = self._path(upstream, key)
+            if not path.exists():
+                return None
+            self._loaded[key] = json.loads(path.read_text())
+        return self._loaded[key]
+
+    def record(self, upstream: str, request: Dict[str, Any], response: Any, duration_ms: float):
+        """Append one interaction to the request's cassette"""
+        key = request_key(upstream, request)
+        with self._lock:
+            cassette = self._load(upstream, key) or {"upstream": upstream, "request": request, "interactions": []}
+            cassette["interactions"].append({"response": response, "duration_ms": round(duration_ms, 1)})
+            self._loaded[key] = cassette
+
+            path = self._path(upstream, key)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".json.tmp")
+            tmp.write_text(json.dumps(cassette, default=str, indent=1))
+            tmp.replace(path)
+            self.recorded += 1
+
+    def replay(self, upstream: str, request: Dict[str, Any]) -> Tuple[Any, float]:
+        """
+        (response, delay_seconds) for the request; repeated calls cycle
+        through the recorded interactions in order
+
+        Raises:
+            CassetteMiss: nothing recorded for this request
+        """
+        key = request_key(upstream, request)
+        with self._lock:
+            cassette = self._load(upstream, key)
+            if not cassette or not cassette["interactions"]:
+                self.misses += 1
+                raise CassetteMiss(f"No {upstream} cassette for request {key}")
+            n = self._replays.get(key, 0)
+            self._replays[key] = n + 1
+            self.replayed += 1
+        interaction = cassette["interactions"][n % len(cassette["interactions"])]
+
+        # Seeded per request and call number, so a replayed run is repeatable
+        rng = random.Random(f"{self.seed}:{key}:{n}")
+        latency = self._latency.get(upstream, self._default_latency)
+        return interaction["response"], latency.sample(interaction["duration_ms"], rng)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "directory": str(self.directory),
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "misses": self.misses
+            }
+
+
+# Create singleton
+cassettes = CassetteStore(
+    settings.cassette_dir,
+    settings.cassette_mode,
+    settings.cassette_latency,
+    settings.cassette_latency_overrides,
+    settings.cassette_seed
+)
+
+
+# ============================================
+# Anthropic
+# ============================================
+def _anthropic_request(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in kwargs.items() if k != "timeout"}
+
+
+def _message_events(message) -> List[Any]:
+    """Stream events equivalent to a finished message (the subset the agents read)"""
+    event = types.SimpleNamespace
+    events = [event(type="message_start", message=message)]
+    for index, block in enumerate(message.content):
+        events.append(event(type="content_block_start", index=index, content_block=block))
+        if block.type == "text":
+            text = block.text
+            for i in range(0, len(text), 32):
+                chunk = text[i:i + 32]
+                events.append(event(type="content_block_delta", index=index, delta=event(type="text_delta", text=chunk)))
+                events.append(event(type="text", text=chunk, snapshot=text[:i + 32]))
+        elif block.type == "tool_use":
+            text = json.dumps(block.input)
+            for i in range(0, len(text), 32):
+                chunk = text[i:i + 32]
+                events.append(event(type="content_block_delta", index=index, delta=event(type="input_json_delta", partial_json=chunk)))
+                events.append(event(type="input_json", partial_json=chunk, snapshot=None))
+        events.append(event(type="content_block_stop", index=index))
+    events.append(event(type="message_stop"))
+    return events
+
+
+class _ReplayStream:
+    """messages.stream() stand-in that plays a recorded message back over `delay` seconds"""
+
+    def __init__(self, message, delay: float):
+        self._message = message
+        self._delay = delay
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __iter__(self):
+        events = _message_events(self._message)
+        deltas = sum(1 for e in events if e.type == "content_block_delta") or 1
+        # About a third of the time passes before the first token
+        time.sleep(self._delay * 0.3)
+        per_delta = self._delay * 0.7 / deltas
+        for event in events:
+            if event.type == "content_block_delta":
+                time.sleep(per_delta)
+            yield event
+
+    def get_final_message(self):
+        return self._message
+
+
+class _RecordStream:
+    """Passes a real stream through and records its final message"""
+
+    def __init__(self, manager, on_final: Callable[[Any, float], None]):
+        self._manager = manager
+        self._on_final = on_final
+
+    def __enter__(self):
+        self._start = time.monotonic()
+        self._stream = self._manager.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        return self._manager.__exit__(*exc_info)
+
+    def __iter__(self):
+        return iter(self._stream)
+
+    def get_final_message(self):
+        message = self._stream.get_final_message()
+        self._on_final(message, (time.monotonic() - self._start) * 1000)
+        return message
+
+
+class _CassetteMessages:
+    def __init__(self, inner, store: CassetteStore):
+        self._inner = inner
+        self._store = store
+
+    def _replayed_message(self, kwargs: Dict[str, Any]):
+        from anthropic.types import Message  # deferred: only needed when replaying
+
+        data, delay = self._store.replay("anthropic", _anthropic_request(kwargs))
+        return Message.model_validate(data), delay
+
+    def create(self, **kwargs):
+        if self._store.replaying:
+            message, delay = self._replayed_message(kwargs)
+            time.sleep(delay)
+            return message
+
+        start = time.monotonic()
+        message = self._inner.messages.create(**kwargs)
+        self._store.record("anthropic", _anthropic_request(kwargs), message.model_dump(mode="json"), (time.monotonic() - start) * 1000)
+        return message
+
+    def stream(self, **kwargs):
+        if self._store.replaying:
+            return _ReplayStream(*self._replayed_message(kwargs))
+
+        def on_final(message, duration_ms):
+            self._store.record("anthropic", _anthropic_request(kwargs), message.model_dump(mode="json"), duration_ms)
+
+        return _RecordStream(self._inner.messages.stream(**kwargs), on_final)
+
+
+class CassetteAnthropic:
+    """Anthropic client stand-in: records through `inner`, or replays without it"""
+
+    def __init__(self, inner, store: CassetteStore):
+        self._inner = inner
+        self.messages = _CassetteMessages(inner, store)
+
+    def __getattr__(self, name):
+        if self._inner is None:
+            raise AttributeError(f"{name} is not available while replaying cassettes")
+        return getattr(self._inner, name)
+
+
+# ============================================
+# Replicate
+# ============================================
+def _plain_output(output: Any) -> Any:
+    """JSON-safe Replicate output: file outputs become their URLs"""
+    if isinstance(output, (str, int, float, bool)) or output is None:
+        return output
+    if isinstance(output, dict):
+        return {k: _plain_output(v) for k, v in output.items()}
+    if hasattr(output, "url"):
+        return str(output.url)
+    if hasattr(output, "__iter__") and not isinstance(output, bytes):
+        return [_plain_output(item) for item in output]
+    return str(output)
+
+
+class CassetteReplicate:
+    """replicate.Client stand-in for run()"""
+
+    def __init__(self, inner, store: CassetteStore):
+        self._inner = inner
+        self._store = store
+
+    def run(self, ref: str, input: Optional[Dict[str, Any]] = None, **kwargs):
+        request = {"ref": ref, "input": input or {}}
+        if self._store.replaying:
+            output, delay = self._store.replay("replicate", request)
+            time.sleep(delay)
+            return output
+
+        start = time.monotonic()
+        output = _plain_output(self._inner.run(ref, input=input, **kwargs))
+        self._store.record("replicate", request, output, (time.monotonic() - start) * 1000)
+        return output
+
+    def __getattr__(self, name):
+        if self._inner is None:
+            raise AttributeError(f"{name} is not available while replaying cassettes")
+        return getattr(self._inner, name)
+
+
+# ============================================
+# ImgBB (requests session)
+# ============================================
+class _ReplayResponse:
+    """The part of requests.Response the upload path reads"""
+
+    def __init__(self, status_code: int, body: Any):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            from requests import HTTPError  # deferred: keeps cold start cheap
+            raise HTTPError(f"{self.status_code} replayed error", response=self)
+
+
+class CassetteSession:
+    """requests.Session stand-in for post(); the API key never reaches the cassette"""
+
+    def __init__(self, inner, store: CassetteStore):
+        self._inner = inner
+        self._store = store
+
+    def post(self, url: str, data: Optional[Dict[str, Any]] = None, **kwargs):
+        request = {"url": url, "data": {k: v for k, v in (data or {}).items() if k != "key"}}
+        if self._store.replaying:
+            response, delay = self._store.replay("imgbb", request)
+            time.sleep(delay)
+            return _ReplayResponse(response["status_code"], response["body"])
+
+        start = time.monotonic()
+        response = self._inner.post(url, data=data, **kwargs)
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        self._store.record("imgbb", request, {"status_code": response.status_code, "body": body}, (time.monotonic() - start) * 1000)
+        return response
+
+    def close(self):
+        """Close the real session (there is none while replaying)"""
+        if self._inner is not None:
+            self._inner.close()
+
+    def __getattr__(self, name):
+        if self._inner is None:
+            raise AttributeError(f"{name} is not available while replaying cassettes")
+        return getattr(self._inner, name)
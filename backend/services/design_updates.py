@@ -0,0 +1,67 @@
+"""
+Design Update Channel
+Holds results that arrive after a design response was already returned
+
+When a phase is raced (local answer returned first), the late LLM answer
+is published here and clients poll GET /agent/design/{design_id}/updates
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class DesignUpdateChannel:
+    """In-memory, TTL-bounded store of late phase results per design"""
+
+    def __init__(self, ttl_seconds: float = 900.0):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._designs: Dict[str, Dict[str, Any]] = {}
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [d for d, entry in self._designs.items() if entry["created_at"] < cutoff]
+        for design_id in expired:
+            del self._designs[design_id]
+
+    def expect(self, design_id: str, phase: str):
+        """Register that a late result for `phase` may still arrive"""
+        with self._lock:
+            self._evict_expired()
+            entry = self._designs.setdefault(design_id, {
+                "created_at": time.time(),
+                "pending_phases": [],
+                "updates": []
+            })
+            if phase not in entry["pending_phases"]:
+                entry["pending_phases"].append(phase)
+
+    def publish(self, design_id: str, phase: str, update: Optional[Dict[str, Any]]):
+        """
+        Deliver the late result for `phase`
+        update=None means the LLM path failed and the local answer stands
+        """
+        with self._lock:
+            entry = self._designs.get(design_id)
+            if entry is None:
+                return
+            if phase in entry["pending_phases"]:
+                entry["pending_phases"].remove(phase)
+            if update is not None:
+                entry["updates"].append({"phase": phase, "published_at": time.time(), **update})
+
+    def get(self, design_id: str) -> Optional[Dict[str, Any]]:
+        """Pending phases and published updates, or None for unknown designs"""
+        with self._lock:
+            entry = self._designs.get(design_id)
+            if entry is None:
+                return None
+            return {
+                "design_id": design_id,
+                "pending_phases": list(entry["pending_phases"]),
+                "updates": list(entry["updates"])
+            }
+
+
+# Create singleton
+design_updates = DesignUpdateChannel()
@@ -6,7 +6,106 @@ Usage:
     python generate_products.py
 
 This will print Python code you can paste into pkg_service.py
+
+Synthetic catalogs (seeded, for benchmarks and load tests):
+    python generate_products.py --synthetic 10000 --seed 1 --output catalog.json
+
+generate_catalog(n, seed) returns the same n products for the same seed,
+in the format ProductKnowledgeGraph(products=...) takes.
 """
+import argparse
+import json
+import math
+import random
+from typing import Any, Dict, List
+
+# ==========================================
+# SYNTHETIC CATALOG
+# ==========================================
+
+# (weight, median price, price spread (lognormal sigma), (width, depth, height) inches, materials, nouns)
+CATEGORY_PROFILES = {
+    "decor": (0.28, 45, 0.6, (18, 6, 18), ["ceramic", "glass", "textile", "metal", "natural", "canvas"], ["Vase", "Wall Art", "Mirror", "Throw Pillow", "Planter", "Candle Holder", "Rug"]),
+    "storage": (0.22, 90, 0.8, (30, 15, 36), ["wood", "metal", "natural", "plastic"], ["Bookshelf", "Basket", "Cabinet", "Wall Shelf", "Storage Bench", "Organizer"]),
+    "seating": (0.16, 390, 0.8, (32, 32, 32), ["fabric", "leather", "wood", "metal"], ["Accent Chair", "Loveseat", "Sofa", "Ottoman", "Lounge Chair", "Stool"]),
+    "lighting": (0.12, 105, 0.7, (10, 10, 30), ["metal", "glass", "ceramic", "natural"], ["Table Lamp", "Floor Lamp", "Pendant Light", "Sconce", "Desk Lamp"]),
+    "table": (0.10, 380, 0.6, (40, 24, 24), ["wood", "marble", "glass", "metal"], ["Coffee Table", "Side Table", "Console Table", "Dining Table", "Nightstand"]),
+    "desk": (0.06, 600, 0.5, (55, 28, 30), ["wood", "metal", "glass"], ["Writing Desk", "Standing Desk", "Corner Desk", "Executive Desk"]),
+    "bed": (0.06, 950, 0.5, (64, 84, 40), ["wood", "fabric", "metal"], ["Platform Bed", "Canopy Bed", "Daybed", "Upholstered Bed"]),
+}
+
+# Weighted like the built-in catalog, with the less common styles filled out
+STYLE_WEIGHTS = {"modern": 0.40, "scandinavian": 0.14, "industrial": 0.11, "bohemian": 0.10, "mid-century": 0.10, "traditional": 0.08, "minimalist": 0.07}
+
+ROOM_WEIGHTS = {"living_room": 0.36, "bedroom": 0.28, "office": 0.20, "kitchen": 0.16}
+
+# Share of products sold for more than one room (most go in 2, some in 3)
+MULTI_ROOM_SHARE = 0.15
+
+# Categories that only make sense in some rooms
+CATEGORY_ROOMS = {"bed": ["bedroom"], "desk": ["office", "bedroom"]}
+
+ADJECTIVES = ["Classic", "Curved", "Slim", "Oversized", "Compact", "Woven", "Tufted", "Arched", "Low-Profile", "Sculpted", "Rustic", "Sleek"]
+
+
+def _weighted(rng: random.Random, weights: Dict[str, float]) -> str:
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _size_fit(footprint: float) -> List[str]:
+    """Rooms a product fits by floor area (square inches), as in the built-in catalog"""
+    if footprint > 3500:
+        return ["large"]
+    if footprint > 1200:
+        return ["medium", "large"]
+    return ["small", "medium", "large"]
+
+
+def generate_product(rng: random.Random, index: int) -> Dict[str, Any]:
+    """One synthetic product"""
+    categories = {name: profile[0] for name, profile in CATEGORY_PROFILES.items()}
+    category = _weighted(rng, categories)
+    _, median_price, spread, (width, depth, height), materials, nouns = CATEGORY_PROFILES[category]
+
+    rooms = CATEGORY_ROOMS.get(category)
+    if rooms:
+        room_type = [rng.choice(rooms)]
+    else:
+        room_type = [_weighted(rng, ROOM_WEIGHTS)]
+        if rng.random() < MULTI_ROOM_SHARE:
+            extra = rng.randint(1, 2)
+            room_type += [room for room in rng.sample(list(ROOM_WEIGHTS), 3) if room not in room_type][:extra]
+
+    # Dimensions vary around the category's typical size
+    scale = rng.lognormvariate(0, 0.25)
+    dimensions = {
+        "width": max(int(round(width * scale * rng.uniform(0.85, 1.15))), 1),
+        "depth": max(int(round(depth * scale * rng.uniform(0.85, 1.15))), 1),
+        "height": max(int(round(height * scale * rng.uniform(0.85, 1.15))), 0)
+    }
+    # Bigger pieces cost more; prices end in 5 or 0 like the built-in list
+    price = median_price * rng.lognormvariate(0, spread) * math.sqrt(scale)
+    price = max(round(price / 5) * 5, 10)
+
+    material = rng.choice(materials)
+    return {
+        "id": f"SYN-{index:07d}",
+        "name": f"{rng.choice(ADJECTIVES)} {material.title()} {rng.choice(nouns)}",
+        "category": category,
+        "base_price": float(price),
+        "material": material,
+        "style": _weighted(rng, STYLE_WEIGHTS),
+        "room_type": room_type,
+        "dimensions": dimensions,
+        "size_fit": _size_fit(dimensions["width"] * dimensions["depth"])
+    }
+
+
+def generate_catalog(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """n synthetic products; the same seed always gives the same catalog"""
+    rng = random.Random(seed)
+    return [generate_product(rng, i) for i in range(n)]
+
 
 # TEMPLATES FOR EASY PRODUCT CREATION
 
@@ -183,6 +282,22 @@ def generate_kitchen_items():
     return "\n".join(products)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print product templates, or write a synthetic catalog")
+    parser.add_argument("--synthetic", type=int, help="number of synthetic products to generate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON file for the synthetic catalog (default: stdout)")
+    args = parser.parse_args()
+    
+    if args.synthetic is not None:
+        catalog = generate_catalog(args.synthetic, args.seed)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(catalog, f)
+            print(f"Wrote {len(catalog)} products to {args.output}")
+        else:
+            print(json.dumps(catalog, indent=2))
+        raise SystemExit(0)
+    
     print("=" * 60)
     print("PRODUCT GENERATOR - Copy & Paste into pkg_service.py")
     print("=" * 60)
@@ -0,0 +1,200 @@
+"""
+HTTP Client Registry
+One set of pooled, keep-alive clients shared by every agent and service
+
+Agents and services used to build their own Anthropic clients and call bare
+requests.post, so each process held several idle pools and every ImgBB
+upload paid a fresh TCP + TLS handshake. Everything now comes from here.
+
+Client libraries are imported inside the getters so that importing this
+module (and everything that depends on it) stays cheap at cold start.
+"""
+import threading
+from typing import Any, Dict
+
+from config import get_settings
+
+settings = get_settings()
+
+
+def _http2_available() -> bool:
+    """httpx only speaks HTTP/2 when the optional h2 package is installed"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ClientRegistry:
+    """
+    Lazily built, process-wide HTTP clients
+    All getters are thread-safe and return the same instance every time
+    """
+
+    def __init__(self):
+        # Reentrant: building the Anthropic client builds the httpx pool
+        self._lock = threading.RLock()
+        self._clients: Dict[str, Any] = {}
+        self.http2 = settings.http_http2 and _http2_available()
+
+    def _get(self, name: str, build):
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = build()
+                    self._clients[name] = client
+        return client
+
+    def _with_cassettes(self, name: str, build):
+        """
+        Wrap a client for record/replay (services.cassettes)
+        Replay never builds the real client, so no network or credentials are needed
+        """
+        if settings.cassette_mode not in ("record", "replay"):
+            return build()
+        from services.cassettes import cassettes, CassetteAnthropic, CassetteReplicate, CassetteSession
+
+        wrapper = {"anthropic": CassetteAnthropic, "replicate": CassetteReplicate, "requests": CassetteSession}[name]
+        return wrapper(build() if cassettes.recording else None, cassettes)
+
+    def _limits(self):
+        import httpx
+        return httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive,
+            keepalive_expiry=settings.http_keepalive_expiry
+        )
+
+    def httpx_client(self):
+        """Shared sync pool (used underneath the Anthropic clients)"""
+        def build():
+            import httpx
+            return httpx.Client(
+                limits=self._limits(),
+                http2=self.http2,
+                timeout=httpx.Timeout(600.0, connect=5.0),
+                follow_redirects=True
+            )
+        return self._get("httpx", build)
+
+    def async_httpx_client(self):
+        """Shared async pool - must be used from one event loop (the server's)"""
+        def build():
+            import httpx
+            return httpx.AsyncClient(
+                limits=self._limits(),
+                http2=self.http2,
+                timeout=httpx.Timeout(600.0, connect=5.0),
+                follow_redirects=True
+            )
+        return self._get("async_httpx", build)
+
+    def anthropic(self):
+        """Shared Anthropic client; retries are left to services.resilience"""
+        def build():
+            from anthropic import Anthropic
+            return Anthropic(
+                api_key=settings.ANTHROPIC_API_KEY,
+                base_url=settings.anthropic_base_url,
+                http_client=self.httpx_client(),
+                max_retries=0
+            )
+        return self._get("anthropic", lambda: self._with_cassettes("anthropic", build))
+
+    def async_anthropic(self):
+        """Shared AsyncAnthropic client on the async pool"""
+        def build():
+            from anthropic import AsyncAnthropic
+            return AsyncAnthropic(
+                api_key=settings.ANTHROPIC_API_KEY,
+                base_url=settings.anthropic_base_url,
+                http_client=self.async_httpx_client(),
+                max_retries=0
+            )
+        return self._get("async_anthropic", build)
+
+    def replicate(self):
+        """
+        Shared Replicate client
+        Replicate owns its httpx pool (it sets its own base URL and auth
+        headers), so it gets the same pool limits rather than the same pool
+        """
+        def build():
+            import replicate
+            return replicate.Client(
+                api_token=settings.REPLICATE_API_TOKEN,
+                base_url=settings.replicate_base_url,
+                limits=self._limits(),
+                http2=self.http2
+            )
+        return self._get("replicate", lambda: self._with_cassettes("replicate", build))
+
+    def requests_session(self):
+        """Keep-alive requests session for plain HTTP calls (ImgBB)"""
+        def build():
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=settings.http_max_keepalive,
+                pool_maxsize=settings.http_max_keepalive
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            return session
+        return self._get("requests", lambda: self._with_cassettes("requests", build))
+
+    def warm_up(self, timeout: float) -> Dict[str, str]:
+        """
+        Open a pooled connection (TCP + TLS) to every configured upstream so
+        the first real call skips the handshake. Any HTTP answer counts;
+        upstreams without credentials are skipped.
+        """
+        if settings.cassette_mode == "replay":
+            return {}
+
+        targets = []
+        if settings.ANTHROPIC_API_KEY:
+            targets.append(("anthropic", lambda: self.httpx_client().head(str(self.anthropic().base_url), timeout=timeout)))
+        if settings.REPLICATE_API_TOKEN:
+            # Replicate's own pool (the SDK exposes no public handle for it)
+            targets.append(("replicate", lambda: self.replicate()._client.head("/", timeout=timeout)))
+        if settings.IMGBB_API_KEY:
+            targets.append(("imgbb", lambda: self.requests_session().head(f"{settings.imgbb_base_url}/", timeout=timeout)))
+
+        results = {}
+        for name, connect in targets:
+            try:
+                connect()
+                results[name] = "connected"
+            except Exception as e:
+                results[name] = f"failed: {type(e).__name__}"
+        return results
+
+    def close(self):
+        """Close sync pools (async pools are closed by aclose)"""
+        with self._lock:
+            clients, self._clients = self._clients, {}
+        for name, client in clients.items():
+            if name in ("httpx", "requests"):
+                client.close()
+
+    async def aclose(self):
+        """Close every pool, including the async ones"""
+        with self._lock:
+            async_client = self._clients.get("async_httpx")
+        if async_client is not None:
+            await async_client.aclose()
+        self.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            created = sorted(self._clients)
+        return {"http2": self.http2, "created": created}
+
+
+# Create singleton
+clients = ClientRegistry()
@@ -1,64 +1,83 @@
-import base64
-import requests
 from pathlib import Path
-from typing import Optional
-import uuid
-from PIL import Image
+from typing import BinaryIO
+from PIL import Image, ImageOps
 import io
+import math
 
 from config import get_settings
+from services.rate_limiter import imgbb_limiter
+from services.resilience import call_with_retry, CircuitOpenError
+from services.http_clients import clients
+from services.metrics import track_upstream
+from services.image_store import image_store, StoredImage
+from services.structured_logging import get_logger
 
 settings = get_settings()
+logger = get_logger("image_service")
+
+class ImageTooLarge(ValueError):
+    """Upload dimensions exceed upload_max_pixels"""
+
 
 class ImageService:
     """Handles image upload and URL generation"""
     
     @staticmethod
-    def upload_to_imgbb(image_data: bytes, filename: str) -> str:
+    def store_upload(image_data: bytes, extension: str = "png") -> StoredImage:
         """
-        Upload image to ImgBB and return public URL
-        This is the CRITICAL function for ControlNet compatibility
+        Store an upload in the local content-addressed image host
+        Identical images share one file and URL; see services.image_store
+        """
+        return image_store.put(image_data, extension)
+    
+    @staticmethod
+    def post_to_imgbb(image_data: bytes, filename: str) -> str:
+        """
+        Upload image to ImgBB and return its public URL (raises on failure)
+        Used to mirror local uploads for Replicate, which needs a public URL
         """
-        # Convert bytes to base64 (ImgBB requirement)
-        base64_image = base64.b64encode(image_data).decode('utf-8')
-        
         # ImgBB API endpoint
-        url = "https://api.imgbb.com/1/upload"
+        url = f"{settings.imgbb_base_url}/1/upload"
         
-        payload = {
-            'key': settings.IMGBB_API_KEY,
-            'image': base64_image,
-            'name': filename
-        }
+        def post():
+            with imgbb_limiter.limit(), track_upstream("imgbb", "upload"):
+                # Binary multipart upload (no base64 inflation) over the
+                # pooled keep-alive session
+                response = clients.requests_session().post(
+                    url,
+                    data={'key': settings.IMGBB_API_KEY, 'name': filename},
+                    files={'image': (filename, image_data)},
+                    timeout=10
+                )
+                response.raise_for_status()
+            return response
         
-        try:
-            response = requests.post(url, data=payload, timeout=10)
-            response.raise_for_status()
-            
-            result = response.json()
-            
-            if result.get('success'):
-                public_url = result['data']['url']
-                print(f"Image uploaded successfully: {public_url}")
-                return public_url
-            else:
-                raise Exception(f"ImgBB upload failed: {result}")
-                
-        except requests.exceptions.RequestException as e:
-            print(f"ImgBB upload error: {str(e)}")
-            # FALLBACK: Save locally and return localhost URL (won't work with Replicate but good for testing)
-            return ImageService._save_local_fallback(image_data, filename)
+        # Retried on transient errors; fails fast while the circuit is open
+        response = call_with_retry("imgbb", post)
+        result = response.json()
+        if not result.get('success'):
+            raise Exception(f"ImgBB upload failed: {result}")
+        
+        public_url = result['data']['url']
+        logger.info(f"Image uploaded successfully: {public_url}")
+        return public_url
     
     @staticmethod
-    def _save_local_fallback(image_data: bytes, filename: str) -> str:
-        """Fallback: Save to local uploads folder"""
-        upload_path = Path(settings.upload_dir) / filename
-        with open(upload_path, 'wb') as f:
-            f.write(image_data)
+    def upload_to_imgbb(image_data: bytes, filename: str) -> str:
+        """
+        Upload image to ImgBB and return public URL
+        Falls back to the local image store when ImgBB is unavailable
+        """
+        from requests.exceptions import RequestException  # deferred: keeps cold start cheap
         
-        local_url = f"{settings.base_url}/uploads/{filename}"
-        print(f"⚠️ Using local fallback URL: {local_url}")
-        return local_url
+        try:
+            return ImageService.post_to_imgbb(image_data, filename)
+        except (RequestException, CircuitOpenError) as e:
+            logger.warning(f"ImgBB upload error: {str(e)}")
+            # FALLBACK: local URL (won't work with Replicate but good for testing)
+            local_url = image_store.put(image_data, Path(filename).suffix.lstrip('.') or 'png').url
+            logger.warning(f"Using local fallback URL: {local_url}")
+            return local_url
     
     @staticmethod
     def validate_and_resize(image_data: bytes, max_size: int = 1024) -> bytes:
@@ -66,25 +85,64 @@ class ImageService:
         Validate image and resize if needed
         ControlNet works best with 512x512 or 1024x1024
         """
+        return ImageService.process_upload(io.BytesIO(image_data), max_size)
+    
+    @staticmethod
+    def process_upload(source: BinaryIO, max_size: int = 1024) -> bytes:
+        """
+        Validate, orient and downscale an uploaded image to a PNG of at most
+        max_size on the longest side
+        
+        `source` is read as a file (e.g. the upload's spooled temp file), so
+        the encoded upload is never held in memory as a whole. Dimensions are
+        checked from the header before anything is decoded, and JPEGs are
+        decoded at a reduced scale when only a smaller image is needed
+        """
         try:
-            img = Image.open(io.BytesIO(image_data))
+            # Only parses the header; pixels are decoded on load()
+            try:
+                img = Image.open(source)
+            except Image.DecompressionBombError as e:
+                # PIL's own guard, for dimensions far beyond ours
+                raise ImageTooLarge(str(e))
+            width, height = img.size
+            if width <= 0 or height <= 0:
+                raise ValueError("Image has no pixels")
+            if width * height > settings.upload_max_pixels:
+                raise ImageTooLarge(f"Image is {width}x{height}; at most {settings.upload_max_pixels} pixels are accepted")
             
-            # Convert to RGB if needed (remove alpha channel)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                img = background
+            if img.format == "JPEG":
+                # libjpeg decodes at 1/2, 1/4 or 1/8 scale while the result
+                # still covers max_size on the longest side
+                scale = max_size / max(width, height)
+                img.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+            
+            # Apply the EXIF orientation (phone photos are often stored sideways)
+            ImageOps.exif_transpose(img, in_place=True)
+            
+            # Palette images can't be resampled; give them real colours first
+            if img.mode == 'P':
+                img = img.convert('RGBA')
             
             # Resize maintaining aspect ratio
             img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
             
+            # Convert to RGB if needed (remove alpha channel), now on the small image
+            if img.mode in ('RGBA', 'LA'):
+                img = img.convert('RGBA')
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[-1])
+                img = background
+            elif img.mode not in ('RGB', 'L'):
+                img = img.convert('RGB')
+            
             # Convert back to bytes
             output = io.BytesIO()
             img.save(output, format='PNG', optimize=True)
             return output.getvalue()
             
+        except ImageTooLarge:
+            raise
         except Exception as e:
-            print(f"Image validation failed: {str(e)}")
-            raise ValueError(f"Invalid image data: {str(e)}")
\ No newline at end of file
+            logger.warning(f"Image validation failed: {str(e)}")
+            raise ValueError(f"Invalid image data: {str(e)}")
@@ -0,0 +1,215 @@
+"""
+Local Image Store
+Content-addressed image host behind the /uploads mount
+
+Uploads are stored as {sha256}.{ext} in upload_dir, so an identical upload
+is stored once and always gets the same URL. Because a file's name is its
+content hash, it never changes: it is served with the hash as a strong
+ETag and a one-year immutable Cache-Control, and Range requests work as
+for any static file.
+
+Replicate needs a publicly reachable URL, which a localhost upload is
+not. With image_mirror="lazy" (the default) an image is uploaded to ImgBB
+only when the transformer asks for a public URL; "eager" mirrors each new
+image in the background right away; "off" uses the local URL as is (when
+base_url is public). Without an IMGBB_API_KEY mirroring is always off.
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from config import get_settings
+from services.metrics import registry
+from services.structured_logging import get_logger
+
+settings = get_settings()
+logger = get_logger("image_store")
+
+_CONTENT_NAME = re.compile(r"^([0-9a-f]{64})\.[a-z0-9]{1,5}$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class StoredImage:
+    """Result of ImageStore.put"""
+
+    def __init__(self, digest: str, filename: str, size: int, deduplicated: bool):
+        self.digest = digest
+        self.filename = filename
+        self.size = size
+        self.deduplicated = deduplicated
+
+    @property
+    def url(self) -> str:
+        return f"{settings.base_url}/uploads/{self.filename}"
+
+
+class ImageStore:
+    """Stores images by content hash and mirrors them to ImgBB when asked"""
+
+    def __init__(self, directory: str, mirror: str = "lazy"):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.mirror = mirror
+        self._lock = threading.Lock()
+        # digest -> public URL, or the Future of an upload in progress
+        self._mirrors: Dict[str, Any] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        # Metrics
+        self.stored = 0
+        self.deduplicated = 0
+        self.bytes_saved = 0
+        self.mirrored = 0
+        self.mirror_failures = 0
+
+    def put(self, data: bytes, extension: str = "png") -> StoredImage:
+        """Store the image (once per content) and start its mirror if image_mirror=eager"""
+        digest = hashlib.sha256(data).hexdigest()
+        filename = f"{digest}.{extension.lower()}"
+        path = self.directory / filename
+
+        if path.exists():
+            with self._lock:
+                self.deduplicated += 1
+                self.bytes_saved += len(data)
+            return StoredImage(digest, filename, len(data), True)
+
+        # Write under a temporary name and rename, so a concurrent reader
+        # (or an identical upload racing this one) never sees half a file
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".upload-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+        with self._lock:
+            self.stored += 1
+
+        if self.mirror == "eager":
+            self._start_mirror(digest, filename)
+        return StoredImage(digest, filename, len(data), False)
+
+    def digest_for_url(self, url: str) -> Optional[str]:
+        """Content hash of one of our /uploads URLs, or None for any other URL"""
+        prefix = f"{settings.base_url}/uploads/"
+        if not url.startswith(prefix):
+            return None
+        match = _CONTENT_NAME.match(url[len(prefix):])
+        return match.group(1) if match else None
+
+    def mirror_url(self, digest: str) -> Optional[str]:
+        """ImgBB URL of an image if its mirror has finished"""
+        with self._lock:
+            mirror = self._mirrors.get(digest)
+        return mirror if isinstance(mirror, str) else None
+
+    def public_url(self, url: str, timeout: Optional[float] = None) -> str:
+        """
+        A URL Replicate can fetch: the ImgBB mirror of a local upload
+        (waiting up to `timeout` for one in progress, or starting it),
+        otherwise `url` unchanged
+        """
+        digest = self.digest_for_url(url)
+        if digest is None or self.mirror == "off":
+            return url
+
+        with self._lock:
+            mirror = self._mirrors.get(digest)
+        if isinstance(mirror, str):
+            return mirror
+        if mirror is None:
+            filename = url.rsplit("/", 1)[-1]
+            if not (self.directory / filename).exists():
+                return url
+            mirror = self._start_mirror(digest, filename)
+
+        try:
+            result = mirror.result(timeout=settings.image_mirror_timeout if timeout is None else timeout)
+        except FutureTimeout:
+            logger.warning(f"Mirror of {digest[:12]} not ready, using local URL")
+            return url
+        return result or url
+
+    def _start_mirror(self, digest: str, filename: str) -> Future:
+        with self._lock:
+            existing = self._mirrors.get(digest)
+            if isinstance(existing, Future):
+                return existing
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-mirror")
+            future = self._executor.submit(self._upload_mirror, digest, filename)
+            self._mirrors[digest] = future
+            return future
+
+    def _upload_mirror(self, digest: str, filename: str) -> Optional[str]:
+        from services.image_service import ImageService  # deferred: image_service stores through this module
+
+        try:
+            public_url = ImageService.post_to_imgbb((self.directory / filename).read_bytes(), filename)
+        except Exception as e:
+            logger.warning(f"ImgBB mirror of {digest[:12]} failed: {str(e)}")
+            with self._lock:
+                # Forget the failure so the next public_url() retries
+                self._mirrors.pop(digest, None)
+                self.mirror_failures += 1
+            return None
+
+        with self._lock:
+            self._mirrors[digest] = public_url
+            self.mirrored += 1
+        return public_url
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mirror": self.mirror,
+                "stored": self.stored,
+                "deduplicated": self.deduplicated,
+                "bytes_saved": self.bytes_saved,
+                "mirrored": self.mirrored,
+                "mirrors_pending": sum(1 for m in self._mirrors.values() if isinstance(m, Future)),
+                "mirror_failures": self.mirror_failures
+            }
+
+
+class ContentAddressedFiles(StaticFiles):
+    """
+    StaticFiles for the upload directory: content-addressed files get their
+    hash as a strong ETag and an immutable Cache-Control (other files, e.g.
+    from before the store existed, are served as usual)
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        match = _CONTENT_NAME.match(os.path.basename(full_path))
+        if match:
+            response.headers["etag"] = f'"{match.group(1)}"'
+            response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+# Create singleton (an upload without a key could only fail)
+image_store = ImageStore(settings.upload_dir, settings.image_mirror if settings.IMGBB_API_KEY else "off")
+
+
+def _image_store_metrics():
+    stats = image_store.get_stats()
+    yield ("image_store_writes_total", "counter", "Images written to the local store", [({}, stats["stored"])])
+    yield ("image_store_deduplicated_total", "counter", "Uploads that matched an image already stored", [({}, stats["deduplicated"])])
+    yield ("image_mirror_uploads_total", "counter", "Images mirrored to ImgBB", [({"outcome": "ok"}, stats["mirrored"]), ({"outcome": "failed"}, stats["mirror_failures"])])
+
+
+registry.register_collector(_image_store_metrics)
@@ -2,10 +2,18 @@
 This uses Replicate's Interior Design ControlNet model
 """
 import os
-import replicate
 import base64
 from typing import Optional, Dict, Any
 
+from services.rate_limiter import replicate_limiter
+from services.resilience import call_with_retry
+from services.http_clients import clients
+from services.metrics import track_upstream
+from services.image_store import image_store
+from services.structured_logging import get_logger
+
+logger = get_logger("image_transformation")
+
 class ImageTransformationService:
     """
     Transforms room images using AI (Replicate ControlNet)
@@ -29,7 +37,7 @@ class ImageTransformationService:
         Transform a room image with new interior design
         
         Args:
-            image_url: Public URL of the room image (from ImgBB)
+            image_url: URL of the room image (a local upload or any public URL)
             style_prompt: Design transformation prompt (from StyleAgent)
             room_type: Type of room
             
@@ -37,30 +45,38 @@ class ImageTransformationService:
             URL of transformed image
         """
         try:
+            # Local uploads are swapped for their ImgBB mirror; Replicate can't reach them
+            image_url = image_store.public_url(image_url)
+            
             # Interior Design ControlNet Model
             # This model preserves room structure while changing style
-            output = replicate.run(
-                "jagilley/controlnet-interior-design:5207b74e91c9da0ac1aaecb7b06dc677c41c3a62ec3c14bb0bb35477a2ccc68f",
-                input={
-                    "image": image_url,
-                    "prompt": self._create_transformation_prompt(style_prompt, room_type),
-                    "structure": "depth",  # Preserves room layout
-                    "num_inference_steps": 30,
-                    "guidance_scale": 7.5,
-                    "seed": 42  # For reproducibility in demos
-                }
-            )
+            def run_controlnet():
+                with replicate_limiter.limit(), track_upstream("replicate", "controlnet"):
+                    return clients.replicate().run(
+                        "jagilley/controlnet-interior-design:5207b74e91c9da0ac1aaecb7b06dc677c41c3a62ec3c14bb0bb35477a2ccc68f",
+                        input={
+                            "image": image_url,
+                            "prompt": self._create_transformation_prompt(style_prompt, room_type),
+                            "structure": "depth",  # Preserves room layout
+                            "num_inference_steps": 30,
+                            "guidance_scale": 7.5,
+                            "seed": 42  # For reproducibility in demos
+                        }
+                    )
+            
+            # Retried on transient errors; fails fast (-> None) while the circuit is open
+            output = call_with_retry("replicate", run_controlnet)
             
             # Output is a list with image URL
             if isinstance(output, list) and len(output) > 0:
                 transformed_url = output[0]
-                print(f"Room transformed successfully: {transformed_url}")
+                logger.info(f"Room transformed successfully: {transformed_url}")
                 return transformed_url
             
             return None
             
         except Exception as e:
-            print(f"Image transformation failed: {str(e)}")
+            logger.error(f"Image transformation failed: {str(e)}")
             return None
     
     def _create_transformation_prompt(self, style_data: str, room_type: str) -> str:
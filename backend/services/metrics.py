@@ -0,0 +1,215 @@
+"""
+Metrics
+Counters and histograms rendered in the Prometheus text format on /metrics
+
+Recording is a dict update under a per-metric lock, cheap enough for the
+LLM and upstream call paths. Components with existing stats (limiters,
+circuits, caches) register a collector that is only read at scrape time.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from services.tracing import span
+from services.structured_logging import get_logger
+
+logger = get_logger("metrics")
+
+# Seconds; LLM and image calls range from ~100ms to over a minute
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+# (metric name, type, help, [(labels, value)])
+Family = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic counter per label combination"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in values:
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, labels)))} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label combination"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, counts, total in series:
+            base = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**base, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(base)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(base)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """All metrics of the process, plus scrape-time collectors"""
+
+    def __init__(self, prefix: str = "arcana_"):
+        self.prefix = prefix
+        self._metrics: List = []
+        self._collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(self.prefix + name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        metric = Histogram(self.prefix + name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], Iterable[Family]]):
+        """collector() yields (name, type, help, samples) families at scrape time"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for collector in self._collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+                continue
+            for name, kind, documentation, samples in families:
+                name = self.prefix + name
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Create singleton
+registry = MetricsRegistry()
+
+# ============================================
+# LLM calls (labelled by agent and model)
+# ============================================
+llm_requests = registry.counter(
+    "llm_requests_total", "Anthropic messages calls by outcome (ok/error)", ("agent", "model", "outcome")
+)
+llm_latency = registry.histogram(
+    "llm_request_duration_seconds", "Wall time of one Anthropic messages call", ("agent", "model")
+)
+llm_ttft = registry.histogram(
+    "llm_time_to_first_token_seconds",
+    "Time to the first content delta (mode=stream), or the whole call when the answer is not streamed (mode=full)",
+    ("agent", "model", "mode")
+)
+llm_tokens = registry.counter(
+    "llm_tokens_total", "Tokens by type (input/output/cache_read/cache_creation)", ("agent", "model", "type")
+)
+llm_cost = registry.counter(
+    "llm_cost_usd_total", "Estimated spend at list prices", ("agent", "model")
+)
+agent_fallbacks = registry.counter(
+    "agent_fallbacks_total", "Answers served by a local fallback instead of the LLM", ("agent", "reason")
+)
+
+# ============================================
+# Upstream calls (Anthropic, Replicate, ImgBB)
+# ============================================
+upstream_retries = registry.counter(
+    "upstream_retries_total", "Transient upstream errors that were retried", ("upstream",)
+)
+upstream_requests = registry.counter(
+    "upstream_requests_total", "Replicate / ImgBB calls by outcome (ok/error)", ("upstream", "operation", "outcome")
+)
+upstream_latency = registry.histogram(
+    "upstream_request_duration_seconds", "Wall time of one Replicate / ImgBB call", ("upstream", "operation")
+)
+
+
+@contextmanager
+def track_upstream(upstream: str, operation: str):
+    """
+    Time one upstream call, count its outcome and trace it as a span
+
+    Usage:
+        with track_upstream("replicate", "sdxl"):
+            output = client.run(...)
+    """
+    start = time.monotonic()
+    outcome = "error"
+    try:
+        with span(f"{upstream}.{operation}"):
+            yield
+        outcome = "ok"
+    finally:
+        upstream_latency.observe(time.monotonic() - start, upstream, operation)
+        upstream_requests.inc(upstream, operation, outcome)
@@ -2,19 +2,100 @@
 MASSIVE Product Knowledge Graph - 100+ Products
 Multiple styles, all price ranges, all room types
 """
-import networkx as nx
-from typing import List, Dict, Any, Optional
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 from models import ProductSuggestion, RoomType
 
 class ProductKnowledgeGraph:
     """Enhanced PKG with 100+ diverse products"""
     
-    def __init__(self):
-        self.graph = nx.Graph()
-        self._initialize_graph()
+    def __init__(self, products: Optional[List[Dict[str, Any]]] = None):
+        # Catalog to load instead of the built-in one (e.g. a synthetic
+        # catalog from generate_products.generate_catalog)
+        self._products = products
+        
+        # Built on first use (or by the startup hook) so importing is cheap
+        self._graph = None
+        self._lock = threading.Lock()
+        
+        # (room_type, room_size, style) -> product ids, best compatibility first
+        self._index: Optional[Dict[Tuple[str, str, str], List[str]]] = None
+        self._avg_compatibility: Dict[str, float] = {}
+        
+        # Small LRU of finished query results
+        self._query_cache: "OrderedDict[Tuple, List[ProductSuggestion]]" = OrderedDict()
+        self._query_cache_size = 1024
+        self.cache_hits = 0
+        self.cache_misses = 0
+    
+    @property
+    def graph(self):
+        """The product graph, built once on first access"""
+        if self._graph is None:
+            with self._lock:
+                if self._graph is None:
+                    # NetworkX is only imported when the graph is needed
+                    import networkx as nx
+                    graph = nx.Graph()
+                    self._initialize_graph(graph)
+                    self._graph = graph
+        return self._graph
+    
+    @property
+    def is_built(self) -> bool:
+        return self._index is not None
+    
+    def build_indexes(self):
+        """
+        Precompute each product's average edge score and a lookup of
+        products by (room_type, room_size, style), so queries skip the
+        full graph scan
+        """
+        if self._index is not None:
+            return
+        graph = self.graph
+        with self._lock:
+            if self._index is not None:
+                return
+            
+            avg_compatibility = {}
+            index: Dict[Tuple[str, str, str], List[str]] = {}
+            for node_id, node_data in graph.nodes(data=True):
+                scores = [graph[node_id][neighbor].get("score", 0.5) for neighbor in graph.neighbors(node_id)]
+                avg_compatibility[node_id] = round(sum(scores) / len(scores), 2) if scores else 0.7
+                
+                for room_type in node_data.get("room_type", []):
+                    for room_size in node_data.get("size_fit", []):
+                        index.setdefault((room_type, room_size, node_data.get("style")), []).append(node_id)
+            
+            # Same order as the original scan: stable sort on the rounded score
+            for node_ids in index.values():
+                node_ids.sort(key=lambda n: avg_compatibility[n], reverse=True)
+            
+            self._avg_compatibility = avg_compatibility
+            self._index = index
+    
+    def room_sizes(self) -> List[str]:
+        """Every room size some product fits"""
+        sizes = set()
+        for _, data in self.graph.nodes(data=True):
+            sizes.update(data.get("size_fit", []))
+        return sorted(sizes)
+    
+    def _initialize_graph(self, graph):
+        """Populate with the given catalog, or the built-in products"""
+        products = self._products if self._products is not None else self._builtin_products()
+        
+        # Add all products to graph
+        for product in products:
+            graph.add_node(product["id"], **product)
+        
+        # Add comprehensive compatibility relationships
+        self._add_compatibility_edges(graph)
     
-    def _initialize_graph(self):
-        """Populate with 100+ products across all categories"""
+    def _builtin_products(self) -> List[Dict[str, Any]]:
+        """100+ products across all categories"""
         
         products = [
             # ==========================================
@@ -138,25 +219,19 @@ class ProductKnowledgeGraph:
             {"id": "MULTI-009", "name": "Clock Wall Large", "category": "decor", "base_price": 65.0, "material": "metal", "style": "modern", "room_type": ["living_room", "bedroom", "office"], "dimensions": {"width": 20, "depth": 2, "height": 20}, "size_fit": ["small", "medium", "large"]},
             {"id": "MULTI-010", "name": "Coat Rack Standing", "category": "storage", "base_price": 75.0, "material": "wood", "style": "modern", "room_type": ["living_room", "bedroom", "office"], "dimensions": {"width": 18, "depth": 18, "height": 72}, "size_fit": ["small", "medium", "large"]},
         ]
-        
-        # Add all products to graph
-        for product in products:
-            self.graph.add_node(product["id"], **product)
-        
-        # Add comprehensive compatibility relationships
-        self._add_compatibility_edges()
+        return products
     
-    def _add_compatibility_edges(self):
+    def _add_compatibility_edges(self, graph):
         """Add smart compatibility relationships"""
         
         # Get all nodes
-        nodes = list(self.graph.nodes())
+        nodes = list(graph.nodes())
         
         # Add compatibility between products in same room and price tier
         for i, node1 in enumerate(nodes):
-            data1 = self.graph.nodes[node1]
+            data1 = graph.nodes[node1]
             for node2 in nodes[i+1:]:
-                data2 = self.graph.nodes[node2]
+                data2 = graph.nodes[node2]
                 
                 # Check if compatible
                 room_overlap = bool(set(data1["room_type"]) & set(data2["room_type"]))
@@ -174,7 +249,7 @@ class ProductKnowledgeGraph:
                     else:
                         score = 0.70
                     
-                    self.graph.add_edge(node1, node2, relationship="COMPATIBLE_WITH", score=score)
+                    graph.add_edge(node1, node2, relationship="COMPATIBLE_WITH", score=score)
     
     def get_compatible_products(
         self,
@@ -183,40 +258,38 @@ class ProductKnowledgeGraph:
         style_preference: str = "modern",
         max_results: int = 20
     ) -> List[ProductSuggestion]:
-        """Query with 100+ products"""
+        """Query with 100+ products (served from the index and a result cache)"""
+        key = (room_type, room_size, style_preference, max_results)
+        with self._lock:
+            cached = self._query_cache.get(key)
+            if cached is not None:
+                self._query_cache.move_to_end(key)
+                self.cache_hits += 1
+                return list(cached)
+            self.cache_misses += 1
         
-        compatible_products = []
+        self.build_indexes()
+        graph = self.graph
         
-        for node_id in self.graph.nodes():
-            node_data = self.graph.nodes[node_id]
-            
-            if (room_type in node_data.get("room_type", []) and
-                room_size in node_data.get("size_fit", []) and
-                node_data.get("style") == style_preference):
-                
-                neighbors = list(self.graph.neighbors(node_id))
-                avg_compatibility = 0.7
-                
-                if neighbors:
-                    scores = [
-                        self.graph[node_id][neighbor].get("score", 0.5)
-                        for neighbor in neighbors
-                    ]
-                    avg_compatibility = sum(scores) / len(scores)
-                
-                compatible_products.append(
-                    ProductSuggestion(
-                        sku=node_data["id"],
-                        name=node_data["name"],
-                        base_price=node_data["base_price"],
-                        material=node_data["material"],
-                        category=node_data["category"],
-                        compatibility_score=round(avg_compatibility, 2)
-                    )
+        compatible_products = []
+        for node_id in self._index.get((room_type, room_size, style_preference), [])[:max_results]:
+            node_data = graph.nodes[node_id]
+            compatible_products.append(
+                ProductSuggestion(
+                    sku=node_data["id"],
+                    name=node_data["name"],
+                    base_price=node_data["base_price"],
+                    material=node_data["material"],
+                    category=node_data["category"],
+                    compatibility_score=self._avg_compatibility[node_id]
                 )
+            )
         
-        compatible_products.sort(key=lambda x: x.compatibility_score, reverse=True)
-        return compatible_products[:max_results]
+        with self._lock:
+            self._query_cache[key] = compatible_products
+            if len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
+        return list(compatible_products)
     
     def get_product_set(self, anchor_product_id: str) -> List[str]:
         """Get compatible products"""
@@ -226,6 +299,7 @@ class ProductKnowledgeGraph:
     
     def get_graph_stats(self) -> Dict[str, Any]:
         """Graph statistics"""
+        import networkx as nx
         return {
             "total_products": self.graph.number_of_nodes(),
             "total_relationships": self.graph.number_of_edges(),
@@ -238,6 +312,11 @@ class ProductKnowledgeGraph:
             "price_range": {
                 "min": min([data.get('base_price', 0) for _, data in self.graph.nodes(data=True)]),
                 "max": max([data.get('base_price', 0) for _, data in self.graph.nodes(data=True)])
+            },
+            "query_cache": {
+                "entries": len(self._query_cache),
+                "hits": self.cache_hits,
+                "misses": self.cache_misses
             }
         }
 
@@ -0,0 +1,246 @@
+"""
+Request Profiler
+Opt-in CPU and memory profiles of individual requests
+
+A request is profiled when it carries X-Profile: 1 together with the admin
+token, or when it falls in profile_sample_rate. The profile lasts until
+the last body chunk is sent, so a StreamingResponse (e.g. an NDJSON batch,
+whose work happens while it streams) is covered too. While it runs, a
+sampling thread records the stack of every busy thread (idle pool workers and the
+event loop's select are dropped), and tracemalloc traces allocations.
+Samples are process-wide, so concurrent requests show up too; only one
+profile runs at a time.
+
+Each profile is saved under profile_dir as:
+    {id}.collapsed    folded stacks ("a;b;c 42"), for flamegraph.pl or speedscope
+    {id}.tracemalloc  tracemalloc.Snapshot.dump() output
+    {id}.json         request, duration, sample count and top allocations
+Older profiles are pruned by count and age after every save.
+"""
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import get_settings
+from services.structured_logging import get_logger
+
+settings = get_settings()
+logger = get_logger("profiler")
+
+PROFILE_KINDS = {"collapsed": "text/plain", "tracemalloc": "application/octet-stream", "json": "application/json"}
+_PROFILE_ID = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$")
+
+# Leaf frames of threads that are waiting for work rather than doing any
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("queue.py", "get"),
+}
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename.replace("\\", "/").split("/")
+    return f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Counts the folded stacks of all threads every `interval` seconds"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+class ProfileSession:
+    """One profiled request"""
+
+    def __init__(self, profile_id: str, trigger: str, request: str):
+        self.profile_id = profile_id
+        self.trigger = trigger
+        self.request = request
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.sampler = StackSampler(settings.profile_interval_ms / 1000.0)
+        self.traced = False
+
+
+class RequestProfiler:
+    """Decides which requests to profile, runs the profile and keeps the results"""
+
+    def __init__(self):
+        self.directory = Path(settings.profile_dir)
+        self.paths = [p.strip() for p in settings.profile_paths.split(",") if p.strip()]
+        self._lock = threading.Lock()
+        self._active: Optional[ProfileSession] = None
+
+        # Metrics
+        self.profiled = 0
+        self.skipped_busy = 0
+
+    def is_admin(self, token: Optional[str]) -> bool:
+        return bool(settings.admin_token) and token is not None and hmac.compare_digest(token, settings.admin_token)
+
+    def trigger_for(self, path: str, headers) -> Optional[str]:
+        """'header', 'sampled' or None (not profiled)"""
+        if path.startswith("/admin"):
+            return None
+        if headers.get("x-profile") == "1" and self.is_admin(headers.get("x-admin-token")):
+            return "header"
+        if settings.profile_sample_rate > 0 and any(path.startswith(p) for p in self.paths):
+            if random.random() < settings.profile_sample_rate:
+                return "sampled"
+        return None
+
+    def start(self, trigger: str, request: str) -> Optional[ProfileSession]:
+        """Begin profiling, or None while another profile is running"""
+        with self._lock:
+            if self._active is not None:
+                self.skipped_busy += 1
+                return None
+            profile_id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+            session = self._active = ProfileSession(profile_id, trigger, request)
+
+        if settings.profile_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start(settings.profile_tracemalloc_frames)
+            session.traced = True
+        session.sampler.start()
+        return session
+
+    def finish(self, session: ProfileSession) -> str:
+        """Stop profiling and save the results; returns the profile id"""
+        duration = time.perf_counter() - session._start
+        stacks = session.sampler.stop()
+        snapshot = None
+        if session.traced:
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            tracemalloc.stop()
+        with self._lock:
+            self._active = None
+            self.profiled += 1
+
+        try:
+            self._save(session, duration, stacks, snapshot)
+            self._prune()
+        except OSError as e:
+            logger.error(f"Saving profile {session.profile_id} failed: {str(e)}")
+        return session.profile_id
+
+    def _save(self, session: ProfileSession, duration: float, stacks: Counter, snapshot):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        base = self.directory / session.profile_id
+
+        with open(f"{base}.collapsed", "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        top_allocations = []
+        if snapshot is not None:
+            snapshot.dump(f"{base}.tracemalloc")
+            for stat in snapshot.statistics("lineno")[:25]:
+                frame = stat.traceback[0]
+                top_allocations.append({"location": f"{frame.filename}:{frame.lineno}", "size_kb": round(stat.size / 1024, 1), "count": stat.count})
+
+        metadata = {
+            "id": session.profile_id,
+            "request": session.request,
+            "trigger": session.trigger,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(session.started_at)),
+            "duration_ms": round(duration * 1000, 1),
+            "samples": session.sampler.samples,
+            "interval_ms": settings.profile_interval_ms,
+            "distinct_stacks": len(stacks),
+            "top_allocations": top_allocations
+        }
+        with open(f"{base}.json", "w") as f:
+            json.dump(metadata, f, indent=2)
+
+    def _prune(self):
+        """Keep at most profile_max_files profiles, none older than profile_max_age_hours"""
+        profiles = sorted(self.directory.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        cutoff = time.time() - settings.profile_max_age_hours * 3600
+        for index, path in enumerate(profiles):
+            if index >= settings.profile_max_files or path.stat().st_mtime < cutoff:
+                for kind in PROFILE_KINDS:
+                    self.directory.joinpath(f"{path.stem}.{kind}").unlink(missing_ok=True)
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Saved profiles, newest first"""
+        if not self.directory.exists():
+            return []
+        profiles = []
+        for path in sorted(self.directory.glob("*.json"), reverse=True):
+            try:
+                metadata = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            metadata.pop("top_allocations", None)
+            metadata["files"] = [kind for kind in PROFILE_KINDS if self.directory.joinpath(f"{path.stem}.{kind}").exists()]
+            profiles.append(metadata)
+        return profiles
+
+    def profile_path(self, profile_id: str, kind: str) -> Optional[Path]:
+        """File of a saved profile, or None (ids are validated, so no path escapes the directory)"""
+        if kind not in PROFILE_KINDS or not _PROFILE_ID.match(profile_id):
+            return None
+        path = self.directory / f"{profile_id}.{kind}"
+        return path if path.exists() else None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sample_rate": settings.profile_sample_rate,
+                "header_trigger": bool(settings.admin_token),
+                "active": self._active.profile_id if self._active else None,
+                "profiled": self.profiled,
+                "skipped_busy": self.skipped_busy
+            }
+
+
+# Create singleton
+profiler = RequestProfiler()
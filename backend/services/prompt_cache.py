@@ -0,0 +1,148 @@
+"""
+ControlNet Prompt Cache
+Reuses generated ControlNet scene descriptions instead of calling Opus again
+
+A prompt is determined by a small tuple: room type, style, mood, colors,
+materials, focal point and up to 5 product names. An exact repeat is
+served as-is. When only the product names differ, the new names are
+spliced into the cached scene description where the old ones appeared.
+Opus is only needed for a scene that hasn't been described before.
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import get_settings
+from services.metrics import registry
+
+settings = get_settings()
+
+# Stands in for the i-th product name inside a stored scene description
+_SLOT = "\x00{}\x00"
+_SLOT_PATTERN = re.compile("\x00(\\d+)\x00")
+
+
+def _normalize(value: str) -> str:
+    return " ".join(str(value).lower().replace("_", " ").split())
+
+
+def controlnet_scene_key(
+    room_type: str,
+    primary_style: str,
+    mood: str,
+    colors: List[str],
+    materials: List[str],
+    focal_point: str
+) -> Tuple:
+    """Everything that shapes the prompt except the product names"""
+    return (
+        _normalize(room_type),
+        _normalize(primary_style),
+        _normalize(mood),
+        tuple(sorted({_normalize(c) for c in colors})),
+        tuple(sorted({_normalize(m) for m in materials})),
+        _normalize(focal_point)
+    )
+
+
+def _with_slots(prompt: str, product_names: List[str]) -> Optional[str]:
+    """
+    Scene description with each product name replaced by its slot
+    None when any name doesn't appear verbatim (nothing safe to splice)
+    """
+    text = prompt
+    # Longest names first so "Oak Table" isn't cut out of "Oak Table Lamp"
+    for i in sorted(range(len(product_names)), key=lambda i: len(product_names[i]), reverse=True):
+        name = product_names[i]
+        pattern = re.compile(re.escape(name), re.IGNORECASE)
+        if not name or not pattern.search(text):
+            return None
+        text = pattern.sub(_SLOT.format(i), text)
+    return text
+
+
+class ControlNetPromptCache:
+    """LRU of generated scene descriptions, one per scene key"""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # scene key -> the generated prompt, its product names and its slotted form
+        self._scenes: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+
+        # Metrics
+        self.hits = 0
+        self.spliced = 0
+        self.near_misses = 0
+        self.misses = 0
+
+    def lookup(self, scene: Tuple, product_names: List[str]) -> Tuple[Optional[str], str]:
+        """
+        Returns (prompt, outcome), outcome being:
+            "hit"        exact repeat
+            "spliced"    same scene, new product names spliced in
+            "near_miss"  same scene, but the cached text can't take these names
+            "miss"       scene never described
+        """
+        names_key = tuple(_normalize(n) for n in product_names)
+        with self._lock:
+            entry = self._scenes.get(scene)
+            if entry is None:
+                self.misses += 1
+                return None, "miss"
+            self._scenes.move_to_end(scene)
+
+            if entry["names"] == names_key:
+                self.hits += 1
+                return entry["prompt"], "hit"
+
+            template = entry["template"]
+            if template is not None and entry["slots"] == len(product_names):
+                self.spliced += 1
+                return _SLOT_PATTERN.sub(lambda m: product_names[int(m.group(1))], template), "spliced"
+
+            self.near_misses += 1
+            return None, "near_miss"
+
+    def put(self, scene: Tuple, product_names: List[str], prompt: str):
+        """Store a freshly generated prompt for exact and spliced reuse"""
+        names_key = tuple(_normalize(n) for n in product_names)
+        template = _with_slots(prompt, product_names)
+        with self._lock:
+            self._scenes.pop(scene, None)
+            self._scenes[scene] = {
+                "names": names_key,
+                "prompt": prompt,
+                "template": template,
+                "slots": len(product_names)
+            }
+            while len(self._scenes) > self.max_entries:
+                self._scenes.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.spliced + self.near_misses + self.misses
+            return {
+                "scenes": len(self._scenes),
+                "hits": self.hits,
+                "spliced": self.spliced,
+                "near_misses": self.near_misses,
+                "misses": self.misses,
+                "reuse_ratio": round((self.hits + self.spliced) / lookups, 4) if lookups else 0.0
+            }
+
+
+# Create singleton
+controlnet_prompt_cache = ControlNetPromptCache(settings.controlnet_prompt_cache_size)
+
+
+def _prompt_cache_metrics():
+    stats = controlnet_prompt_cache.get_stats()
+    yield ("controlnet_prompt_cache_lookups_total", "counter", "ControlNet prompt cache lookups by result", [
+        ({"result": result}, stats[key])
+        for result, key in (("hit", "hits"), ("spliced", "spliced"), ("near_miss", "near_misses"), ("miss", "misses"))
+    ])
+
+
+registry.register_collector(_prompt_cache_metrics)
@@ -0,0 +1,401 @@
+"""
+Rate Limiter
+Thread-safe token buckets and concurrency limits with fair FIFO ordering
+
+Shared upstream limiters (Anthropic per model family, Replicate, ImgBB) keep
+every agent and service inside one requests/tokens-per-minute budget so
+bursts queue locally instead of turning into 429s and retries
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from config import get_settings
+from services.metrics import registry
+
+settings = get_settings()
+
+# How often an async waiter that isn't at the head of the queue rechecks
+_ASYNC_POLL_INTERVAL = 0.01
+
+
+class RateLimitTimeout(Exception):
+    """Gave up waiting for a limiter within the caller's timeout"""
+
+
+class _FifoQueue:
+    """
+    Waiter bookkeeping shared by the limiters below
+    Only the waiter at the head of the queue may take capacity
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._waiters = deque()
+
+        # Metrics
+        self.acquired = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _wait_turn(self, ready, take, timeout: Optional[float], wake_after) -> float:
+        """
+        Block until it is this caller's turn and ready() holds, then take()
+        wake_after() gives how long the head should sleep before rechecking
+        """
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        me = object()
+
+        with self._cond:
+            self._waiters.append(me)
+            try:
+                while True:
+                    if self._waiters[0] is me and ready():
+                        take()
+                        return self._record_acquired(start)
+
+                    sleep_for = wake_after() if self._waiters[0] is me else None
+                    if deadline is not None:
+                        left = deadline - time.monotonic()
+                        if left <= 0:
+                            self.timeouts += 1
+                            raise RateLimitTimeout("Timed out waiting for upstream capacity")
+                        sleep_for = left if sleep_for is None else min(sleep_for, left)
+                    self._cond.wait(sleep_for)
+            finally:
+                self._waiters.remove(me)
+                self._cond.notify_all()
+
+    async def _wait_turn_async(self, ready, take, timeout: Optional[float], wake_after) -> float:
+        """
+        _wait_turn for the event loop: holds a place in the same FIFO queue
+        but sleeps with asyncio.sleep instead of blocking a worker thread,
+        so a cancelled waiter simply leaves the queue
+        """
+        start = time.monotonic()
+        deadline = start + timeout if timeout is not None else None
+        me = object()
+
+        with self._cond:
+            self._waiters.append(me)
+        try:
+            while True:
+                with self._cond:
+                    if self._waiters[0] is me and ready():
+                        take()
+                        return self._record_acquired(start)
+                    sleep_for = wake_after() if self._waiters[0] is me else None
+
+                if sleep_for is None:
+                    sleep_for = _ASYNC_POLL_INTERVAL
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        with self._cond:
+                            self.timeouts += 1
+                        raise RateLimitTimeout("Timed out waiting for upstream capacity")
+                    sleep_for = min(sleep_for, left)
+                await asyncio.sleep(sleep_for)
+        finally:
+            with self._cond:
+                self._waiters.remove(me)
+                self._cond.notify_all()
+
+    def _record_acquired(self, start: float) -> float:
+        """Count one acquisition; call with the lock held"""
+        waited = time.monotonic() - start
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return waited
+
+    def queue_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "queue_depth": len(self._waiters),
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "avg_wait_ms": round(self.total_wait / self.acquired * 1000, 2) if self.acquired else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "total_wait_ms": round(self.total_wait * 1000, 2)
+            }
+
+
+class RateLimiter(_FifoQueue):
+    """
+    Token bucket refilled continuously at rate_per_minute
+    Waiters are served strictly in arrival order so a burst of callers
+    cannot starve an earlier one
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, burst: Optional[float] = None):
+        super().__init__()
+        self.name = name
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = burst if burst is not None else max(rate_per_minute / 60.0, 1.0)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate_per_second)
+        self._last_refill = now
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> float:
+        """
+        Block until `tokens` are available and it is this caller's turn
+        Requests larger than the bucket are clamped to its capacity
+        Returns the time spent waiting in seconds
+        """
+        ready, take, wake_after = self._bucket_callbacks(tokens)
+        return self._wait_turn(ready, take, timeout, wake_after)
+
+    async def acquire_async(self, tokens: float = 1.0, timeout: Optional[float] = None) -> float:
+        """acquire() for the event loop; waits without holding a thread, and cancelling it gives up the place in the queue"""
+        ready, take, wake_after = self._bucket_callbacks(tokens)
+        return await self._wait_turn_async(ready, take, timeout, wake_after)
+
+    def _bucket_callbacks(self, tokens: float):
+        """(ready, take, wake_after) for a request of `tokens`, clamped to the capacity"""
+        tokens = min(tokens, self.capacity)
+
+        def ready():
+            self._refill()
+            return self._tokens >= tokens
+
+        def take():
+            self._tokens -= tokens
+
+        def wake_after():
+            if self.rate_per_second <= 0:
+                return None
+            # Head of the queue: sleep exactly until enough tokens accrue
+            return max((tokens - self._tokens) / self.rate_per_second, 0.001)
+
+        return ready, take, wake_after
+
+    def adjust(self, tokens: float):
+        """
+        Return (positive) or charge (negative) tokens after the fact,
+        e.g. once actual token usage is known. The bucket may go negative.
+        """
+        with self._cond:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + tokens)
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            self._refill()
+            available = self._tokens
+        return {
+            "rate_per_minute": round(self.rate_per_second * 60, 2),
+            "available": round(available, 2),
+            **self.queue_stats()
+        }
+
+
+class ConcurrencyLimiter(_FifoQueue):
+    """FIFO semaphore capping calls in flight"""
+
+    def __init__(self, name: str, max_concurrency: int):
+        super().__init__()
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+
+    def acquire(self, timeout: Optional[float] = None) -> float:
+        def ready():
+            return self.in_flight < self.max_concurrency
+
+        def take():
+            self.in_flight += 1
+
+        return self._wait_turn(ready, take, timeout, lambda: None)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            in_flight = self.in_flight
+        return {"max_concurrency": self.max_concurrency, "in_flight": in_flight, **self.queue_stats()}
+
+
+class _Lease:
+    """Handle for one admitted upstream call"""
+
+    def __init__(self, limiter: "UpstreamLimiter", reserved_tokens: float):
+        self._limiter = limiter
+        self._reserved_tokens = reserved_tokens
+
+    def settle(self, actual_tokens: float):
+        """Correct the token reservation once real usage is known"""
+        if self._limiter.tokens is not None:
+            self._limiter.tokens.adjust(self._reserved_tokens - actual_tokens)
+            self._reserved_tokens = actual_tokens
+
+
+class UpstreamLimiter:
+    """
+    Requests-per-minute, tokens-per-minute and concurrency budget for one upstream
+    Each dimension is optional
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: Optional[int] = None
+    ):
+        self.name = name
+        # Burst of a few seconds' worth keeps short spikes smooth without bunching
+        self.requests = RateLimiter(f"{name}:rpm", requests_per_minute, burst=max(requests_per_minute / 12, 1)) if requests_per_minute else None
+        self.tokens = RateLimiter(f"{name}:tpm", tokens_per_minute, burst=tokens_per_minute / 6) if tokens_per_minute else None
+        self.concurrency = ConcurrencyLimiter(f"{name}:concurrency", max_concurrency) if max_concurrency else None
+
+    @contextmanager
+    def limit(self, tokens: float = 0, timeout: Optional[float] = None):
+        """
+        Admit one call (blocking, FIFO); yields a lease for settling token usage
+
+        Usage:
+            with limiter.limit(tokens=estimate) as lease:
+                response = call()
+                lease.settle(actual_tokens)
+        """
+        start = time.monotonic()
+
+        def left():
+            return None if timeout is None else timeout - (time.monotonic() - start)
+
+        requested = 0
+        reserved = 0
+        try:
+            if self.requests is not None:
+                self.requests.acquire(1, timeout=left())
+                requested = 1
+            if self.tokens is not None and tokens:
+                self.tokens.acquire(tokens, timeout=left())
+                reserved = min(tokens, self.tokens.capacity)
+            if self.concurrency is not None:
+                self.concurrency.acquire(timeout=left())
+        except RateLimitTimeout:
+            # The call never happens: give back what was already taken
+            if requested:
+                self.requests.adjust(requested)
+            if reserved:
+                self.tokens.adjust(reserved)
+            raise
+
+        try:
+            yield _Lease(self, reserved)
+        finally:
+            if self.concurrency is not None:
+                self.concurrency.release()
+
+    def queue_depth(self) -> int:
+        """Callers currently waiting on any dimension of this limiter"""
+        return sum(
+            len(limiter._waiters)
+            for limiter in (self.requests, self.tokens, self.concurrency)
+            if limiter is not None
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {}
+        if self.requests is not None:
+            stats["requests"] = self.requests.get_stats()
+        if self.tokens is not None:
+            stats["tokens"] = self.tokens.get_stats()
+        if self.concurrency is not None:
+            stats["concurrency"] = self.concurrency.get_stats()
+        return stats
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough token count (~4 characters per token) for budgeting before a call"""
+    return sum(len(t) for t in texts if t) // 4 + 1
+
+
+def model_family(model: str) -> str:
+    """Limits are shared per model family, not per dated model id"""
+    if "opus" in model:
+        return "opus"
+    if "haiku" in model:
+        return "haiku"
+    return "sonnet"
+
+
+# ============================================
+# Shared upstream limiters
+# ============================================
+anthropic_limiters = {
+    "sonnet": UpstreamLimiter(
+        "anthropic:sonnet",
+        requests_per_minute=settings.anthropic_sonnet_rpm,
+        tokens_per_minute=settings.anthropic_sonnet_tpm,
+        max_concurrency=settings.anthropic_max_concurrency
+    ),
+    "opus": UpstreamLimiter(
+        "anthropic:opus",
+        requests_per_minute=settings.anthropic_opus_rpm,
+        tokens_per_minute=settings.anthropic_opus_tpm,
+        max_concurrency=settings.anthropic_max_concurrency
+    ),
+    "haiku": UpstreamLimiter(
+        "anthropic:haiku",
+        requests_per_minute=settings.anthropic_haiku_rpm,
+        tokens_per_minute=settings.anthropic_haiku_tpm,
+        max_concurrency=settings.anthropic_max_concurrency
+    )
+}
+
+replicate_limiter = UpstreamLimiter(
+    "replicate",
+    requests_per_minute=settings.replicate_rpm,
+    max_concurrency=settings.replicate_max_concurrency
+)
+
+imgbb_limiter = UpstreamLimiter("imgbb", requests_per_minute=settings.imgbb_rpm)
+
+
+def anthropic_limiter(model: str) -> UpstreamLimiter:
+    """Shared limiter for the model's family"""
+    return anthropic_limiters[model_family(model)]
+
+
+def get_limiter_stats() -> Dict[str, Any]:
+    """Queue depth, wait times and capacity for every shared limiter"""
+    limiters = list(anthropic_limiters.values()) + [replicate_limiter, imgbb_limiter]
+    return {limiter.name: limiter.get_stats() for limiter in limiters}
+
+
+def _limiter_metrics():
+    """Scrape-time queue depth and wait totals of the shared limiters"""
+    limiters = list(anthropic_limiters.values()) + [replicate_limiter, imgbb_limiter]
+    depth, waited, in_flight = [], [], []
+    for limiter in limiters:
+        for dimension, queue in (("requests", limiter.requests), ("tokens", limiter.tokens), ("concurrency", limiter.concurrency)):
+            if queue is None:
+                continue
+            labels = {"limiter": limiter.name, "dimension": dimension}
+            stats = queue.queue_stats()
+            depth.append((labels, stats["queue_depth"]))
+            waited.append((labels, stats["total_wait_ms"] / 1000.0))
+        if limiter.concurrency is not None:
+            in_flight.append(({"limiter": limiter.name}, limiter.concurrency.in_flight))
+    yield ("limiter_queue_depth", "gauge", "Callers waiting on a shared upstream limiter", depth)
+    yield ("limiter_wait_seconds_total", "counter", "Time callers spent queued on a shared upstream limiter", waited)
+    yield ("limiter_in_flight", "gauge", "Upstream calls currently admitted", in_flight)
+
+
+registry.register_collector(_limiter_metrics)
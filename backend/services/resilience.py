@@ -0,0 +1,237 @@
+"""
+Resilience Layer
+Retry with jittered exponential backoff and per-upstream circuit breakers
+
+Transient upstream errors (connection resets, timeouts, 429, 5xx, overloaded)
+are retried; while an upstream keeps failing its circuit opens and calls fail
+immediately with CircuitOpenError so callers go straight to their fallbacks
+"""
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from config import get_settings
+from services.metrics import registry, upstream_retries
+from services.structured_logging import get_logger
+
+settings = get_settings()
+logger = get_logger("resilience")
+
+# HTTP statuses worth retrying (529 = Anthropic "overloaded")
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504, 529}
+
+# Exception class names (checked across the MRO) that mean the request never
+# completed; matched by name so the SDKs don't have to be imported here
+RETRYABLE_EXCEPTION_NAMES = {
+    "APIConnectionError", "APITimeoutError",             # anthropic
+    "ConnectionError", "Timeout", "ChunkedEncodingError",  # requests
+    "ConnectError", "ReadTimeout", "RemoteProtocolError"   # httpx
+}
+
+
+class CircuitOpenError(Exception):
+    """The upstream's circuit is open; the call was not attempted"""
+
+    def __init__(self, upstream: str):
+        super().__init__(f"Circuit open for {upstream}, skipping call")
+        self.upstream = upstream
+
+
+def _status_code(exc: Exception) -> Optional[int]:
+    """HTTP status carried by an SDK / requests exception, if any"""
+    for attr in ("status_code", "status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(exc, "response", None)
+    value = getattr(response, "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Whether the error is transient and says something about upstream health"""
+    if isinstance(exc, CircuitOpenError):
+        return False
+
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_EXCEPTION_NAMES for cls in type(exc).__mro__)
+
+
+# Timeouts (across the MRO, by name as above); under a deadline these are
+# usually our own doing, since the call timeout is the time left
+TIMEOUT_EXCEPTION_NAMES = {"APITimeoutError", "Timeout", "ReadTimeout", "ConnectTimeout", "TimeoutException"}
+
+
+def is_timeout(exc: Exception) -> bool:
+    if isinstance(exc, TimeoutError):
+        return True
+    return any(cls.__name__ in TIMEOUT_EXCEPTION_NAMES for cls in type(exc).__mro__)
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    """Server-provided Retry-After (seconds), if present"""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failures
+    open -> half_open after `reset_timeout` seconds (one probe call allowed)
+    half_open -> closed on success, back to open on failure
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.opened_count = 0
+        self.short_circuited = 0
+
+    def allow(self) -> bool:
+        """Whether a call may be attempted right now"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_neutral(self):
+        """The call ended for a local reason; says nothing about upstream health"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened_count += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "opened_count": self.opened_count,
+                "short_circuited": self.short_circuited
+            }
+
+
+# One breaker per upstream
+breakers: Dict[str, CircuitBreaker] = {
+    name: CircuitBreaker(name, settings.circuit_failure_threshold, settings.circuit_reset_seconds)
+    for name in ("anthropic", "replicate", "imgbb")
+}
+
+
+def call_with_retry(
+    upstream: str,
+    fn: Callable[[], Any],
+    max_attempts: Optional[int] = None,
+    expires_at: Optional[float] = None
+) -> Any:
+    """
+    Call fn() through the upstream's circuit breaker, retrying transient errors
+
+    Backoff is exponential with full jitter (AWS style) and honours
+    Retry-After up to retry_max_delay; a longer Retry-After ends the
+    retries. No retry is attempted if it could not finish before
+    `expires_at` (a time.monotonic() value).
+    
+    A timeout under `expires_at` is the caller's deadline running out (the
+    call timeout is the time left), so it doesn't count against the
+    upstream's circuit: one impatient client must not open it for everyone.
+
+    Raises:
+        CircuitOpenError: immediately, when the circuit is open
+    """
+    breaker = breakers[upstream]
+    max_attempts = max_attempts or settings.retry_max_attempts
+
+    for attempt in range(max_attempts):
+        if not breaker.allow():
+            raise CircuitOpenError(upstream)
+
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_retryable(e):
+                if _status_code(e) is not None:
+                    # The upstream answered; the request itself was at fault
+                    breaker.record_success()
+                else:
+                    breaker.record_neutral()
+                raise
+            if expires_at is not None and is_timeout(e):
+                breaker.record_neutral()
+                raise
+            breaker.record_failure()
+
+            if attempt == max_attempts - 1:
+                raise
+            retry_after = _retry_after(e) or 0
+            if retry_after > settings.retry_max_delay:
+                # Not worth holding a worker thread for
+                raise
+            delay = random.uniform(0, min(settings.retry_max_delay, settings.retry_base_delay * 2 ** attempt))
+            delay = max(delay, retry_after)
+            if expires_at is not None and time.monotonic() + delay >= expires_at:
+                raise
+            logger.warning(f"[{upstream}] Transient error ({type(e).__name__}), retry {attempt + 1} in {delay:.2f}s", extra={"upstream": upstream})
+            upstream_retries.inc(upstream)
+            time.sleep(delay)
+            continue
+
+        breaker.record_success()
+        return result
+
+
+def get_circuit_stats() -> Dict[str, Any]:
+    """State of every upstream circuit"""
+    return {name: breaker.get_stats() for name, breaker in breakers.items()}
+
+
+def _circuit_metrics():
+    """Scrape-time circuit state (0 closed, 1 half open, 2 open) per upstream"""
+    states = {"closed": 0, "half_open": 1, "open": 2}
+    yield ("circuit_state", "gauge", "Circuit breaker state: 0 closed, 1 half open, 2 open", [
+        ({"upstream": name}, states[breaker.state]) for name, breaker in breakers.items()
+    ])
+    yield ("circuit_short_circuited_total", "counter", "Calls rejected while the circuit was open", [
+        ({"upstream": name}, breaker.short_circuited) for name, breaker in breakers.items()
+    ])
+
+
+registry.register_collector(_circuit_metrics)
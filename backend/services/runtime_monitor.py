@@ -0,0 +1,103 @@
+"""
+Runtime Monitor
+Event-loop lag and memory of this worker process
+
+A background task sleeps for a fixed interval and records how much later
+than requested it woke up; that overshoot is time the event loop spent
+blocked by other work (e.g. sync code on the loop). The last few minutes
+of samples are kept so a load test can ask for the lag during one stage.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from config import get_settings
+from services.metrics import registry
+from services.structured_logging import logging_system
+
+settings = get_settings()
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc isn't available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    try:
+        import resource  # Unix only
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _percentile(sorted_values, pct: float) -> float:
+    index = min(int(round(pct / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class RuntimeMonitor:
+    """Samples event-loop lag while the server runs"""
+
+    def __init__(self, interval_ms: int = 100, window: int = 3000):
+        self.interval = interval_ms / 1000.0
+        self._lock = threading.Lock()
+        # (unix time, lag seconds)
+        self._samples: deque = deque(maxlen=window)
+        self.max_lag = 0.0
+
+    async def run(self):
+        """Sample until cancelled (started from the lifespan hook)"""
+        if self.interval <= 0:
+            return
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(time.perf_counter() - start - self.interval, 0.0)
+            with self._lock:
+                self._samples.append((time.time(), lag))
+                self.max_lag = max(self.max_lag, lag)
+
+    def get_stats(self, since: Optional[float] = None) -> Dict[str, Any]:
+        """Lag percentiles over samples taken after `since` (unix time), plus memory"""
+        with self._lock:
+            lags = sorted(lag for at, lag in self._samples if since is None or at >= since)
+        return {
+            "pid": os.getpid(),
+            "samples": len(lags),
+            "loop_lag_ms": {
+                "p50": round(_percentile(lags, 50) * 1000, 2),
+                "p99": round(_percentile(lags, 99) * 1000, 2),
+                "max": round(lags[-1] * 1000, 2)
+            } if lags else None,
+            "rss_mb": round(rss_bytes() / 1e6, 1),
+            "peak_rss_mb": round(peak_rss_bytes() / 1e6, 1)
+        }
+
+
+# Create singleton
+runtime_monitor = RuntimeMonitor(settings.loop_monitor_interval_ms)
+
+
+def _runtime_metrics():
+    with runtime_monitor._lock:
+        max_lag = runtime_monitor.max_lag
+    yield ("event_loop_lag_max_seconds", "gauge", "Largest event-loop lag seen by this worker", [({}, max_lag)])
+    yield ("process_resident_memory_bytes", "gauge", "Resident memory of this worker", [({}, rss_bytes())])
+    log_stats = logging_system.get_stats()
+    yield ("log_queue_depth", "gauge", "Log records waiting for the writer thread", [({}, log_stats["queued"])])
+    yield ("log_records_dropped_total", "counter", "Log records dropped because the queue was full", [({}, log_stats["dropped"])])
+    yield ("log_records_sampled_out_total", "counter", "INFO/DEBUG records skipped by log_sample_rates", [({}, log_stats["sampled_out"])])
+
+
+registry.register_collector(_runtime_metrics)
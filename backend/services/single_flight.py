@@ -0,0 +1,159 @@
+"""
+Single-Flight Request Coalescing
+Concurrent callers asking for the same key share one in-flight computation
+
+Used around the design orchestration and PKG queries so a burst of identical
+requests (e.g. a demo preset) only triggers one 5-call agent pipeline
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from models import DesignRequest
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key
+    The first caller (leader) runs the function, later callers for the same
+    key wait for and receive the leader's result (or exception)
+
+    With memoize=True successful results are kept after completion, so later
+    (not just concurrent) callers reuse them too - meant for short-lived,
+    scoped instances such as a single batch
+    """
+
+    def __init__(self, name: str, memoize: bool = False):
+        self.name = name
+        self.memoize = memoize
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+
+        # Metrics
+        self.calls = 0
+        self.executions = 0
+        self.shared = 0
+
+    def _join_or_lead(self, key: Hashable) -> Tuple[Future, bool]:
+        """Return (future, is_leader) for the given key"""
+        with self._lock:
+            self.calls += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                # Memoized keys stay registered with their completed future
+                self.shared += 1
+                return future, False
+
+            future = Future()
+            self._inflight[key] = future
+            self.executions += 1
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None, error: BaseException = None):
+        """Publish the leader's outcome and release the key"""
+        with self._lock:
+            if error is not None or not self.memoize:
+                self._inflight.pop(key, None)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn(*args, **kwargs) once per concurrent key (blocking)"""
+        future, is_leader = self._join_or_lead(key)
+        if not is_leader:
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Async variant for use in endpoints
+        The leader runs the (blocking) function in a worker thread so the
+        event loop stays free; followers simply await the shared future
+
+        Waits are shielded: a caller that goes away (client disconnect)
+        stops waiting, but neither cancels the shared future nor, for the
+        leader, keeps the others from getting the computation's real outcome
+        """
+        future, is_leader = self._join_or_lead(key)
+        if not is_leader:
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        task = asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+
+        def publish(task: asyncio.Task):
+            if task.cancelled():
+                self._finish(key, future, error=asyncio.CancelledError())
+            elif task.exception() is not None:
+                self._finish(key, future, error=task.exception())
+            else:
+                self._finish(key, future, result=task.result())
+
+        task.add_done_callback(publish)
+        return await asyncio.shield(task)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Coalescing statistics"""
+        with self._lock:
+            inflight = sum(1 for f in self._inflight.values() if not f.done())
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "executions": self.executions,
+            "shared": self.shared,
+            "inflight": inflight,
+            # Fraction of calls that were served by another caller's computation
+            "coalescing_ratio": round(self.shared / self.calls, 4) if self.calls else 0.0
+        }
+
+
+def _normalize_text(text: str) -> str:
+    """Case- and whitespace-insensitive form of free text"""
+    return " ".join((text or "").lower().split())
+
+
+def design_request_key(request: DesignRequest, deadline_ms: Optional[int] = None) -> Tuple:
+    """
+    Normalized identity of a DesignRequest for coalescing
+    The deadline is part of it: a request with a long budget must never
+    receive the fallback-filled result of a flight run under a short one
+    """
+    return (
+        _normalize_text(request.prompt),
+        request.room_type.value,
+        request.room_size,
+        tuple(sorted(_normalize_text(s) for s in request.style_preferences)),
+        round(request.budget_max, 2) if request.budget_max is not None else None,
+        deadline_ms
+    )
+
+
+def style_context_key(style_context: Dict[str, Any]) -> Tuple:
+    """Identity of a StyleAgent input context"""
+    return (
+        _normalize_text(style_context.get("user_prompt", "")),
+        style_context.get("room_type"),
+        style_context.get("room_size"),
+        tuple(sorted(_normalize_text(s) for s in style_context.get("style_preferences", [])))
+    )
+
+
+def pkg_query_key(room_type: str, room_size: str, style_preference: str, max_results: int) -> Tuple:
+    """Identity of a get_compatible_products call"""
+    return (room_type, room_size, style_preference, max_results)
+
+
+# Shared coalescers
+design_flight = SingleFlight("design")
+pkg_flight = SingleFlight("pkg_query")
@@ -0,0 +1,220 @@
+"""
+Structured Logging
+JSON log records written by a background thread instead of print()
+
+Loggers hand records to a bounded queue (QueueHandler) and return at once;
+a QueueListener thread formats and writes them, so stdout I/O never runs
+on the event loop or in a request's worker thread. Every record carries
+the request ID and trace ID of the request that logged it. Levels can be
+set per logger, and chatty loggers (e.g. the agents) can be sampled.
+
+Usage:
+    from services.structured_logging import get_logger
+    logger = get_logger("image_service")
+    logger.info("Image uploaded", extra={"url": url})
+
+Loggers live under "arcana." (get_logger("agents.StyleAnalyst") is
+"arcana.agents.StyleAnalyst"), which is what log_levels and
+log_sample_rates refer to, e.g. "agents=WARNING" / "agents=0.1".
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import get_settings
+
+settings = get_settings()
+
+ROOT_LOGGER = "arcana"
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has; anything else came in through extra=
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id", "trace_id"}
+
+
+def set_request_id(request_id: Optional[str]) -> contextvars.Token:
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token: contextvars.Token):
+    _request_id.reset(token)
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def _parse_pairs(value: str) -> Dict[str, str]:
+    """'agents=WARNING,pkg=DEBUG' -> {'arcana.agents': 'WARNING', 'arcana.pkg': 'DEBUG'}"""
+    pairs = {}
+    for part in filter(None, (p.strip() for p in value.split(","))):
+        name, setting = part.split("=", 1)
+        name = name.strip()
+        pairs[name if name.startswith(ROOT_LOGGER) else f"{ROOT_LOGGER}.{name}"] = setting.strip()
+    return pairs
+
+
+class ContextFilter(logging.Filter):
+    """Stamps the request and trace IDs (runs in the logging thread, before queueing)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        from services.tracing import _current_trace  # deferred: tracing logs through this module
+
+        trace = _current_trace.get()
+        record.request_id = _request_id.get()
+        record.trace_id = trace.trace_id if trace is not None else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of DEBUG/INFO records per logger prefix; warnings always pass"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Longest prefix first, so "arcana.agents.StyleAnalyst" beats "arcana.agents"
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        for prefix, rate in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                if random.random() < rate:
+                    return True
+                self.sampled_out += 1
+                return False
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records when the queue is full instead of blocking"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message and traceback now (args may not be safe to
+        # format later) but keep them apart for the JSON formatter
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, IDs and extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key in ("request_id", "trace_id"):
+            if getattr(record, key, None):
+                entry[key] = getattr(record, key)
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """Readable lines for local development (log_format=text)"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s [%(name)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        if getattr(record, "request_id", None):
+            line += f" request_id={record.request_id}"
+        return line
+
+
+class LoggingSystem:
+    """The queue, its listener thread and the filters, configured once per process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.configured = False
+        self.queue_handler: Optional[DroppingQueueHandler] = None
+        self.sampling: Optional[SamplingFilter] = None
+        self.listener: Optional[logging.handlers.QueueListener] = None
+
+    def configure(self):
+        """Install the queue handler on the "arcana" logger and start the writer thread"""
+        if self.configured:
+            return
+        with self._lock:
+            if self.configured:
+                return
+
+            output = logging.StreamHandler(sys.stdout)
+            output.setFormatter(JsonFormatter() if settings.log_format == "json" else TextFormatter())
+
+            log_queue: queue.Queue = queue.Queue(maxsize=settings.log_queue_size)
+            self.queue_handler = DroppingQueueHandler(log_queue)
+            self.queue_handler.addFilter(ContextFilter())
+            self.sampling = SamplingFilter({name: float(rate) for name, rate in _parse_pairs(settings.log_sample_rates).items()})
+            self.queue_handler.addFilter(self.sampling)
+
+            root = logging.getLogger(ROOT_LOGGER)
+            root.setLevel(settings.log_level.upper())
+            root.addHandler(self.queue_handler)
+            root.propagate = False
+            for name, level in _parse_pairs(settings.log_levels).items():
+                logging.getLogger(name).setLevel(level.upper())
+
+            self.listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+            self.listener.start()
+            # Flush what is still queued when the process exits
+            atexit.register(self.shutdown)
+            self.configured = True
+
+    def shutdown(self):
+        with self._lock:
+            if self.listener is not None:
+                self.listener.stop()
+                self.listener = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue_handler.queue.qsize() if self.queue_handler else 0,
+            "dropped": self.queue_handler.dropped if self.queue_handler else 0,
+            "sampled_out": self.sampling.sampled_out if self.sampling else 0
+        }
+
+
+# Create singleton
+logging_system = LoggingSystem()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under "arcana." (configures logging on first use)"""
+    logging_system.configure()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
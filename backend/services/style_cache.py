@@ -0,0 +1,122 @@
+"""
+Style Analysis Cache
+Process-wide LRU of StyleAgent analyses, persisted across restarts
+
+Only analyses that came back from the LLM are cached. The most-used
+entries are saved to disk on shutdown and the top N are replayed into
+memory by the startup warm-up, so popular prompts skip the style call
+on a fresh pod.
+"""
+import copy
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from config import get_settings
+from services.single_flight import style_context_key
+from services.metrics import registry
+from services.structured_logging import get_logger
+
+settings = get_settings()
+logger = get_logger("style_cache")
+
+
+class StyleAnalysisCache:
+    """LRU keyed on the normalized style context, with per-entry hit counts"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.replayed = 0
+
+    def get(self, context: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Cached AgentResponse fields for this context, or None"""
+        key = style_context_key(context)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry["hits"] += 1
+            self.hits += 1
+            return copy.deepcopy(entry["response"])
+
+    def put(self, context: Dict[str, Any], response: Dict[str, Any], hits: int = 0):
+        key = style_context_key(context)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            self._entries[key] = {
+                "context": {
+                    "user_prompt": context.get("user_prompt", ""),
+                    "room_type": context.get("room_type"),
+                    "room_size": context.get("room_size"),
+                    "style_preferences": list(context.get("style_preferences", []))
+                },
+                "response": copy.deepcopy(response),
+                "hits": max(hits, previous["hits"] if previous else 0)
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def save(self, path: str):
+        """Write entries to disk, most-used first"""
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: e["hits"], reverse=True)
+        if not entries:
+            return
+        target = Path(path)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(target.suffix + ".tmp")
+        tmp.write_text(json.dumps(entries))
+        tmp.replace(target)
+
+    def load(self, path: str, top_n: int) -> int:
+        """Replay the top_n most-used saved analyses into memory"""
+        target = Path(path)
+        if top_n <= 0 or not target.exists():
+            return 0
+        try:
+            entries = json.loads(target.read_text())
+        except (OSError, ValueError) as e:
+            logger.warning(f"Style cache not loaded from {path}: {e}")
+            return 0
+
+        entries = sorted(entries, key=lambda e: e.get("hits", 0), reverse=True)[:top_n]
+        # Least used first, so the most used end up most recent in the LRU
+        for entry in reversed(entries):
+            self.put(entry["context"], entry["response"], hits=entry.get("hits", 0))
+        with self._lock:
+            self.replayed += len(entries)
+        return len(entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "replayed": self.replayed
+            }
+
+
+# Create singleton
+style_cache = StyleAnalysisCache(settings.style_cache_size)
+
+
+def _style_cache_metrics():
+    stats = style_cache.get_stats()
+    yield ("style_cache_lookups_total", "counter", "Style analysis cache lookups by result", [
+        ({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])
+    ])
+    yield ("style_cache_entries", "gauge", "Style analyses held in memory", [({}, stats["entries"])])
+
+
+registry.register_collector(_style_cache_metrics)
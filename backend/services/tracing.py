@@ -0,0 +1,243 @@
+"""
+Request Tracing
+Spans for one design request across its PKG query, agent phases, LLM calls
+and image generation, carried in a contextvar
+
+A trace is started per request; span() anywhere below it records a child
+of the current span (and does nothing when no trace is active, e.g. in
+scripts). Worker threads join the trace when submitted through
+contextvars.copy_context(). Finished traces are summarised for the
+Server-Timing header and optionally exported to a JSON-lines file and/or
+an OTLP/HTTP collector.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import get_settings
+from services.structured_logging import get_logger
+
+settings = get_settings()
+logger = get_logger("tracing")
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+# OTLP posts leave the request path
+_export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trace-export")
+_json_lock = threading.Lock()
+
+
+def _new_id(n_bytes: int) -> str:
+    return os.urandom(n_bytes).hex()
+
+
+class Span:
+    """One timed operation within a trace"""
+
+    def __init__(self, trace: "Trace", name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes)
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+
+    def set(self, **attributes):
+        """Add attributes known only once the operation ran (tokens, model, ...)"""
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+
+    @property
+    def offset_ms(self) -> float:
+        """Start relative to the start of the trace"""
+        return (self.start_ns - self.trace.root.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ms": round(self.offset_ms, 2),
+            "duration_ms": round(self.duration_ms, 2) if self.duration_ms is not None else None,
+            "attributes": self.attributes,
+            **({"error": self.error} if self.error else {})
+        }
+
+
+class Trace:
+    """All spans of one request"""
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.trace_id = _new_id(16)
+        self._lock = threading.Lock()
+        self.spans: List[Span] = []
+        self.root = Span(self, name, None, attributes)
+        self.spans.append(self.root)
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def children(self, parent: Span) -> List[Span]:
+        with self._lock:
+            return [s for s in self.spans if s.parent_id == parent.span_id and s.duration_ms is not None]
+
+    def summary(self) -> Dict[str, Any]:
+        """Compact timings for the response body"""
+        with self._lock:
+            spans = [s.to_dict() for s in self.spans if s.duration_ms is not None]
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round(self.root.duration_ms or 0.0, 2),
+            "steps": {s.name: round(s.duration_ms, 2) for s in self.children(self.root)},
+            "spans": spans
+        }
+
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """
+    Root span for one request; exports the trace when it ends
+
+    Usage:
+        with start_trace("design.multi", room_type=...) as trace:
+            ...
+        timings = trace.summary()
+    """
+    if not settings.tracing_enabled:
+        yield None
+        return
+
+    trace = Trace(name, attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(trace.root)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.root.error = type(e).__name__
+        raise
+    finally:
+        trace.root.finish()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        export(trace)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Child of the current span (no-op outside a trace)
+
+    Usage:
+        with span("llm.call", agent=self.agent_name) as s:
+            response = ...
+            if s: s.set(output_tokens=...)
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    current = Span(trace, name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.finish()
+        _current_span.reset(token)
+        trace.add(current)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def server_timing_header(timings: Dict[str, Any]) -> str:
+    """Server-Timing header value from a trace summary: total plus each top-level step"""
+    entries = [f"total;dur={timings['total_ms']:.1f}"]
+    entries.extend(f"{name};dur={ms:.1f}" for name, ms in timings["steps"].items())
+    return ", ".join(entries)
+
+
+# ============================================
+# Export
+# ============================================
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    """OTLP/HTTP JSON (ExportTraceServiceRequest) for one trace"""
+    with trace._lock:
+        finished = list(trace.spans)
+    spans = []
+    for s in finished:
+        if s.duration_ms is None:
+            continue
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": s.span_id,
+            "parentSpanId": s.parent_id or "",
+            "name": s.name,
+            "kind": 1,  # internal
+            "startTimeUnixNano": str(s.start_ns),
+            "endTimeUnixNano": str(s.start_ns + int(s.duration_ms * 1e6)),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+            "status": {"code": 2, "message": s.error} if s.error else {"code": 1}
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": settings.trace_service_name}}]},
+            "scopeSpans": [{"scope": {"name": "arcana.tracing"}, "spans": spans}]
+        }]
+    }
+
+
+def _write_json(trace: Trace):
+    target = Path(settings.trace_json_path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    line = json.dumps({"trace_id": trace.trace_id, "name": trace.root.name, **trace.summary()}, default=str)
+    with _json_lock, open(target, "a") as f:
+        f.write(line + "\n")
+
+
+def _post_otlp(trace: Trace):
+    from services.http_clients import clients  # deferred: the pool is only needed when exporting
+
+    try:
+        clients.httpx_client().post(settings.otlp_endpoint, json=to_otlp(trace), timeout=5.0)
+    except Exception as e:
+        logger.warning(f"OTLP trace export failed: {str(e)}")
+
+
+def export(trace: Trace):
+    """Send a finished trace to the configured exporters (comma-separated trace_exporters)"""
+    exporters = {e.strip() for e in settings.trace_exporters.split(",") if e.strip()}
+    if "json" in exporters:
+        try:
+            _write_json(trace)
+        except OSError as e:
+            logger.warning(f"Trace file export failed: {str(e)}")
+    if "otlp" in exporters:
+        _export_executor.submit(_post_otlp, trace)
@@ -0,0 +1,81 @@
+"""
+Upload Size Limit
+ASGI middleware that rejects oversized upload bodies with 413 while they stream in
+
+Starlette's multipart parser already spools file parts to a temporary
+file (in memory up to 1 MB, then on disk), but it reads the whole body
+before the endpoint runs. This middleware refuses a declared
+Content-Length over the limit before reading anything, and counts the
+bytes of chunked or mislabelled bodies, stopping as soon as they pass
+the limit.
+"""
+import json
+from typing import Iterable
+
+from services.structured_logging import get_logger
+
+logger = get_logger("upload_limit")
+
+
+class UploadTooLarge(Exception):
+    """Request body exceeded upload_max_bytes"""
+
+
+class UploadLimitMiddleware:
+    """Caps the request body size of the given path prefixes"""
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int):
+        self.app = app
+        self.paths = tuple(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0 or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                await self._reject(scope, send)
+                return
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            # FastAPI turns a failed body read into a 400; answer 413 instead
+            if exceeded and not response_started:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except Exception:
+            if not exceeded or response_started:
+                raise
+        if exceeded and not response_started:
+            await self._reject(scope, send)
+
+    async def _reject(self, scope, send):
+        logger.warning(f"Rejected upload over {self.max_bytes} bytes", extra={"path": scope["path"]})
+        body = json.dumps({"detail": f"Upload exceeds {self.max_bytes} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), (b"connection", b"close")]
+        })
+        await send({"type": "http.response.body", "body": body})
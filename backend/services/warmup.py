@@ -0,0 +1,102 @@
+"""
+Startup Warm-up
+Pays the cold-start costs before traffic arrives instead of on the first requests
+
+Runs as a background task from the FastAPI lifespan hook while /health
+reports "warming", so the load balancer keeps traffic away until the PKG
+indexes, query cache, upstream connections and style cache are ready.
+Warm-up is best effort: a failed step is recorded and does not block
+readiness.
+"""
+import asyncio
+import time
+from typing import Any, Callable, Dict, Optional
+
+from config import get_settings
+from models import RoomType
+from services.pkg_service import pkg_service
+from services.http_clients import clients
+from services.style_cache import style_cache
+from services.structured_logging import get_logger
+
+settings = get_settings()
+logger = get_logger("warmup")
+
+# The PKG query the design endpoints make (see main._pkg_products)
+PKG_WARM_STYLE = "modern"
+PKG_WARM_MAX_RESULTS = 10
+
+
+def warm_pkg() -> Dict[str, Any]:
+    """Build the graph and indexes, then pre-run every (room_type, room_size) query"""
+    pkg_service.build_indexes()
+    queries = 0
+    for room_type in RoomType:
+        for room_size in pkg_service.room_sizes():
+            pkg_service.get_compatible_products(
+                room_type=room_type.value,
+                room_size=room_size,
+                style_preference=PKG_WARM_STYLE,
+                max_results=PKG_WARM_MAX_RESULTS
+            )
+            queries += 1
+    return {"queries": queries}
+
+
+def warm_connections() -> Dict[str, Any]:
+    """Load the Anthropic SDK and open pooled connections to configured upstreams"""
+    clients.anthropic()
+    return clients.warm_up(settings.warmup_connect_timeout)
+
+
+def replay_style_cache() -> Dict[str, Any]:
+    """Restore the most-used style analyses from the last run"""
+    return {"replayed": style_cache.load(settings.style_cache_path, settings.warmup_style_replay)}
+
+
+class StartupWarmup:
+    """Tracks the warm-up steps and whether the pod is ready for traffic"""
+
+    def __init__(self):
+        self.status = "pending"
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.started_at: Optional[float] = None
+        self.duration_ms: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def mark_ready(self):
+        """Skip warm-up entirely (warmup_enabled=False)"""
+        self.status = "ready"
+
+    async def _step(self, name: str, fn: Callable[[], Dict[str, Any]]):
+        start = time.monotonic()
+        try:
+            result = await asyncio.to_thread(fn)
+            self.steps[name] = {"ok": True, "ms": round((time.monotonic() - start) * 1000, 1), **result}
+        except Exception as e:
+            logger.warning(f"Warm-up step '{name}' failed: {str(e)}")
+            self.steps[name] = {"ok": False, "ms": round((time.monotonic() - start) * 1000, 1), "error": str(e)}
+
+    async def run(self):
+        """Run all steps concurrently, then report ready"""
+        self.status = "warming"
+        self.started_at = time.monotonic()
+
+        steps = [self._step("pkg", warm_pkg), self._step("connections", warm_connections)]
+        if settings.style_cache_enabled and settings.warmup_style_replay > 0:
+            steps.append(self._step("style_cache", replay_style_cache))
+        await asyncio.gather(*steps)
+
+        self.duration_ms = round((time.monotonic() - self.started_at) * 1000, 1)
+        self.status = "ready"
+        logger.info(f"Warm-up finished in {self.duration_ms:.0f}ms")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"status": self.status, "duration_ms": self.duration_ms, "steps": dict(self.steps)}
+
+
+# Create singleton
+startup_warmup = StartupWarmup()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+ARCANA BACKEND - RECORD/REPLAY CASSETTE TESTS
+Request keys, latency models, and recording then replaying each upstream
+
+Runs without API keys or network (the upstream clients are fakes).
+
+Usage:
+    python -m pytest test_cassettes.py
+"""
+import json
+import os
+import random
+from types import SimpleNamespace
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+import pytest
+
+from services.cassettes import (
+    CassetteAnthropic, CassetteMiss, CassetteReplicate, CassetteSession, CassetteStore,
+    LatencyModel, request_key
+)
+
+MESSAGE = {
+    "id": "msg_01", "type": "message", "role": "assistant", "model": "claude-sonnet-4-20250514",
+    "content": [{"type": "tool_use", "id": "toolu_01", "name": "record_style_analysis", "input": {"primary_style": "modern"}}],
+    "stop_reason": "tool_use", "stop_sequence": None,
+    "usage": {"input_tokens": 120, "output_tokens": 40}
+}
+
+
+def store(tmp_path, mode, latency="none", overrides=""):
+    return CassetteStore(str(tmp_path), mode, latency, overrides, seed=7)
+
+
+def test_request_key_ignores_volatile_fields_and_order():
+    a = request_key("anthropic", {"messages": [1], "system": "s", "timeout": 3.2, "model": "claude-sonnet-4"})
+    b = request_key("anthropic", {"system": "s", "model": "claude-3-5-haiku", "messages": [1]})
+    assert a == b
+    assert a != request_key("replicate", {"messages": [1], "system": "s"})
+    assert a != request_key("anthropic", {"messages": [2], "system": "s"})
+
+
+@pytest.mark.parametrize("spec, recorded_ms, expected", [
+    ("recorded", 250.0, 0.25),
+    ("none", 250.0, 0.0),
+    ("fixed:40", 250.0, 0.04),
+])
+def test_latency_models(spec, recorded_ms, expected):
+    assert LatencyModel(spec).sample(recorded_ms, random.Random(1)) == pytest.approx(expected)
+
+
+def test_random_latency_models_stay_in_range():
+    rng = random.Random(1)
+    assert all(0.01 <= LatencyModel("uniform:10:20").sample(0, rng) <= 0.02 for _ in range(100))
+    assert all(LatencyModel("lognormal:200:0.5").sample(0, rng) > 0 for _ in range(100))
+
+
+@pytest.mark.parametrize("spec", ["gaussian:10", "fixed", "uniform:10", "fixed:abc"])
+def test_invalid_latency_spec_is_rejected(spec):
+    with pytest.raises(ValueError):
+        LatencyModel(spec)
+
+
+def test_replay_cycles_through_recorded_interactions(tmp_path):
+    recorder = store(tmp_path, "record")
+    request = {"ref": "model", "input": {"seed": 1}}
+    recorder.record("replicate", request, "first", 120.0)
+    recorder.record("replicate", request, "second", 80.0)
+
+    player = store(tmp_path, "replay", latency="recorded")
+    replayed = [player.replay("replicate", request) for _ in range(3)]
+    assert replayed == [("first", 0.12), ("second", 0.08), ("first", 0.12)]
+    assert player.get_stats()["replayed"] == 3
+
+
+def test_missing_recording_raises_and_is_counted(tmp_path):
+    player = store(tmp_path, "replay")
+    with pytest.raises(CassetteMiss):
+        player.replay("anthropic", {"messages": []})
+    assert player.get_stats()["misses"] == 1
+
+
+def test_replayed_latency_is_repeatable_and_overridable(tmp_path):
+    store(tmp_path, "record").record("imgbb", {"url": "u"}, {}, 500.0)
+    first = store(tmp_path, "replay", latency="uniform:10:1000").replay("imgbb", {"url": "u"})[1]
+    again = store(tmp_path, "replay", latency="uniform:10:1000").replay("imgbb", {"url": "u"})[1]
+    assert first == again
+    overridden = store(tmp_path, "replay", latency="uniform:10:1000", overrides="imgbb=fixed:5")
+    assert overridden.replay("imgbb", {"url": "u"})[1] == pytest.approx(0.005)
+
+
+def test_anthropic_create_and_stream_replay_a_recording(tmp_path):
+    from anthropic.types import Message
+
+    class Messages:
+        def create(self, **kwargs):
+            return Message.model_validate(MESSAGE)
+
+    kwargs = {"model": "claude-sonnet-4-20250514", "max_tokens": 100, "system": "s", "messages": [], "timeout": 5}
+    recorded = CassetteAnthropic(SimpleNamespace(messages=Messages()), store(tmp_path, "record")).messages.create(**kwargs)
+
+    replaying = CassetteAnthropic(None, store(tmp_path, "replay"))
+    replayed = replaying.messages.create(**dict(kwargs, timeout=1))
+    assert replayed == recorded
+
+    with replaying.messages.stream(**kwargs) as stream:
+        partial = "".join(e.delta.partial_json for e in stream if e.type == "content_block_delta")
+        final = stream.get_final_message()
+    assert json.loads(partial) == {"primary_style": "modern"}
+    assert final.content[0].input == {"primary_style": "modern"}
+    with pytest.raises(AttributeError):
+        replaying.beta
+
+
+def test_replicate_records_file_outputs_as_urls(tmp_path):
+    class Client:
+        def run(self, ref, input=None, **kwargs):
+            return [SimpleNamespace(url="https://replicate.delivery/out.png")]
+
+    request_input = {"image": "https://example.com/room.png", "prompt": "calm"}
+    output = CassetteReplicate(Client(), store(tmp_path, "record")).run("owner/model:v", input=request_input)
+    assert output == ["https://replicate.delivery/out.png"]
+    assert CassetteReplicate(None, store(tmp_path, "replay")).run("owner/model:v", input=request_input) == output
+
+
+def test_imgbb_cassette_never_stores_the_api_key(tmp_path):
+    class Session:
+        def post(self, url, data=None, **kwargs):
+            return SimpleNamespace(status_code=400, json=lambda: {"error": "bad image"})
+
+    CassetteSession(Session(), store(tmp_path, "record")).post("https://api.imgbb.com/1/upload", data={"key": "SECRET", "name": "a.png"})
+    saved = "".join(path.read_text() for path in tmp_path.rglob("*.json"))
+    assert "SECRET" not in saved
+
+    response = CassetteSession(None, store(tmp_path, "replay")).post("https://api.imgbb.com/1/upload", data={"key": "OTHER", "name": "a.png"})
+    assert response.status_code == 400
+    assert response.json() == {"error": "bad image"}
+    with pytest.raises(Exception, match="400"):
+        response.raise_for_status()
+
+
+def test_replaying_session_closes_cleanly(tmp_path):
+    """clients.close() at shutdown must not fail for lack of a real session"""
+    CassetteSession(None, store(tmp_path, "replay")).close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
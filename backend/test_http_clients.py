@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+ARCANA BACKEND - SHARED HTTP CLIENT TESTS
+One pooled client per upstream, cassette wrapping, warm-up and shutdown
+
+Runs without API keys or network.
+
+Usage:
+    python -m pytest test_http_clients.py
+"""
+import os
+import threading
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+import pytest
+
+from services import http_clients
+from services.cassettes import CassetteAnthropic, CassetteSession, cassettes
+from services.http_clients import ClientRegistry
+
+
+@pytest.fixture
+def registry():
+    registry = ClientRegistry()
+    yield registry
+    registry.close()
+
+
+def test_concurrent_getters_share_one_client(registry):
+    seen = []
+    barrier = threading.Barrier(8)
+
+    def get():
+        barrier.wait()
+        seen.append(registry.requests_session())
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(session) for session in seen}) == 1
+
+
+def test_anthropic_client_uses_the_shared_pool_without_sdk_retries(registry):
+    client = registry.anthropic()
+    assert client is registry.anthropic()
+    assert client._client is registry.httpx_client()
+    assert client.max_retries == 0
+    assert registry.get_stats()["created"] == ["anthropic", "httpx"]
+
+
+def test_replay_wraps_clients_without_building_them(registry, monkeypatch):
+    monkeypatch.setattr(http_clients.settings, "cassette_mode", "replay")
+    monkeypatch.setattr(cassettes, "mode", "replay")
+    assert isinstance(registry.anthropic(), CassetteAnthropic)
+    assert isinstance(registry.requests_session(), CassetteSession)
+    assert "httpx" not in registry.get_stats()["created"]
+    assert registry.warm_up(timeout=1) == {}
+
+
+def test_warm_up_reports_each_upstream(registry, monkeypatch):
+    def unreachable(*args, **kwargs):
+        raise ConnectionError("no route")
+
+    monkeypatch.setattr(http_clients.settings, "REPLICATE_API_TOKEN", "")
+    monkeypatch.setattr(http_clients.settings, "IMGBB_API_KEY", "key")
+    monkeypatch.setattr(registry.httpx_client(), "head", unreachable)
+    monkeypatch.setattr(registry.requests_session(), "head", lambda *args, **kwargs: None)
+    assert registry.warm_up(timeout=1) == {"anthropic": "failed: ConnectionError", "imgbb": "connected"}
+
+
+def test_close_closes_pools_and_forgets_clients(registry):
+    pool = registry.httpx_client()
+    registry.close()
+    assert pool.is_closed
+    assert registry.get_stats()["created"] == []
+    assert registry.httpx_client() is not pool
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+ARCANA BACKEND - LOCAL IMAGE HOST TESTS
+Content-addressed storage, deduplication, caching headers and ImgBB mirrors
+
+Runs without API keys or network (the ImgBB upload is replaced).
+
+Usage:
+    python -m pytest test_image_store.py
+"""
+import hashlib
+import os
+import threading
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from services import image_store as image_store_module
+from services.image_service import ImageService
+from services.image_store import ContentAddressedFiles, ImageStore, IMMUTABLE_CACHE_CONTROL
+
+DATA = b"\x89PNG fake image bytes"
+DIGEST = hashlib.sha256(DATA).hexdigest()
+
+
+@pytest.fixture
+def uploads(monkeypatch):
+    """Replaces the ImgBB upload; records what was mirrored"""
+    calls = []
+
+    def post_to_imgbb(image_data, filename):
+        calls.append(filename)
+        return f"https://i.ibb.co/{filename}"
+
+    monkeypatch.setattr(ImageService, "post_to_imgbb", staticmethod(post_to_imgbb))
+    return calls
+
+
+def test_put_stores_once_by_content(tmp_path, uploads):
+    store = ImageStore(str(tmp_path), mirror="off")
+    first = store.put(DATA)
+    second = store.put(DATA)
+
+    assert first.filename == f"{DIGEST}.png"
+    assert not first.deduplicated and second.deduplicated
+    assert first.url == second.url
+    assert (tmp_path / first.filename).read_bytes() == DATA
+    # No temporary files left behind
+    assert [p.name for p in tmp_path.iterdir()] == [first.filename]
+    assert store.get_stats()["bytes_saved"] == len(DATA)
+
+
+def test_concurrent_identical_puts_leave_one_complete_file(tmp_path, uploads):
+    store = ImageStore(str(tmp_path), mirror="off")
+    threads = [threading.Thread(target=store.put, args=(DATA,)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert [p.read_bytes() for p in tmp_path.iterdir()] == [DATA]
+
+
+def test_lazy_mirror_uploads_only_when_a_public_url_is_needed(tmp_path, uploads):
+    store = ImageStore(str(tmp_path), mirror="lazy")
+    stored = store.put(DATA)
+    assert uploads == []
+
+    assert store.public_url(stored.url, timeout=5) == f"https://i.ibb.co/{stored.filename}"
+    # Mirrored once, then served from memory
+    assert store.public_url(stored.url, timeout=5) == f"https://i.ibb.co/{stored.filename}"
+    assert uploads == [stored.filename]
+
+
+def test_eager_mirror_starts_on_put(tmp_path, uploads):
+    store = ImageStore(str(tmp_path), mirror="eager")
+    stored = store.put(DATA)
+    assert store.public_url(stored.url, timeout=5).startswith("https://i.ibb.co/")
+    assert uploads == [stored.filename]
+
+
+def test_failed_mirror_falls_back_to_local_url_and_retries(tmp_path, monkeypatch):
+    attempts = []
+
+    def post_to_imgbb(image_data, filename):
+        attempts.append(filename)
+        if len(attempts) == 1:
+            raise ConnectionError("imgbb down")
+        return "https://i.ibb.co/ok.png"
+
+    monkeypatch.setattr(ImageService, "post_to_imgbb", staticmethod(post_to_imgbb))
+    store = ImageStore(str(tmp_path), mirror="lazy")
+    stored = store.put(DATA)
+
+    assert store.public_url(stored.url, timeout=5) == stored.url
+    assert store.get_stats()["mirror_failures"] == 1
+    assert store.public_url(stored.url, timeout=5) == "https://i.ibb.co/ok.png"
+
+
+def test_off_and_foreign_urls_are_left_alone(tmp_path, uploads):
+    store = ImageStore(str(tmp_path), mirror="off")
+    stored = store.put(DATA)
+    assert store.public_url(stored.url) == stored.url
+    lazy = ImageStore(str(tmp_path), mirror="lazy")
+    assert lazy.public_url("https://example.com/room.png") == "https://example.com/room.png"
+    assert lazy.public_url(f"{image_store_module.settings.base_url}/uploads/{'0' * 64}.png") == f"{image_store_module.settings.base_url}/uploads/{'0' * 64}.png"
+    assert uploads == []
+
+
+def test_served_with_strong_etag_immutable_caching_and_ranges(tmp_path, uploads):
+    store = ImageStore(str(tmp_path), mirror="off")
+    stored = store.put(DATA)
+    (tmp_path / "legacy.png").write_bytes(DATA)
+    app = FastAPI()
+    app.mount("/uploads", ContentAddressedFiles(directory=str(tmp_path)), name="uploads")
+    client = TestClient(app)
+
+    response = client.get(f"/uploads/{stored.filename}")
+    assert response.content == DATA
+    assert response.headers["etag"] == f'"{DIGEST}"'
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+
+    assert client.get(f"/uploads/{stored.filename}", headers={"If-None-Match": f'"{DIGEST}"'}).status_code == 304
+
+    partial = client.get(f"/uploads/{stored.filename}", headers={"Range": "bytes=0-3"})
+    assert partial.status_code == 206 and partial.content == DATA[:4]
+
+    # Files that aren't content-addressed keep the default headers
+    assert "cache-control" not in client.get("/uploads/legacy.png").headers
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+ARCANA BACKEND - MOCK UPSTREAM TESTS
+Tool answers generated from the agents' schemas
+
+Runs without API keys or network.
+
+Usage:
+    python -m pytest test_mock_upstream.py
+"""
+import os
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+import pytest
+
+from agents.schemas import BudgetAnalysis, LayoutPlan, ProductSelection, StyleAnalysis, parse_structured, tool_definition
+from mock_upstream import sample_from_schema
+
+
+def sample(schema):
+    return sample_from_schema(tool_definition(schema)["input_schema"])
+
+
+def test_selected_product_indexes_differ():
+    products = sample(ProductSelection)["selected_products"]
+    indexes = [p["product_index"] for p in products]
+    assert len(indexes) >= 2
+    assert len(set(indexes)) == len(indexes)
+
+
+def test_placed_product_indexes_differ():
+    placements = sample(LayoutPlan)["product_placements"]
+    assert len({p["product_index"] for p in placements}) == len(placements)
+
+
+@pytest.mark.parametrize("schema", [StyleAnalysis, ProductSelection, LayoutPlan, BudgetAnalysis])
+def test_samples_validate_without_repair(schema):
+    _, repaired = parse_structured(schema, sample(schema))
+    assert not repaired
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
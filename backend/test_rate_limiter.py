@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+ARCANA BACKEND - RATE LIMITER TESTS
+Token buckets, FIFO ordering (threads and event loop), concurrency caps and timeout refunds
+
+Runs without API keys or network.
+
+Usage:
+    python -m pytest test_rate_limiter.py
+"""
+import asyncio
+import os
+import threading
+import time
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+import pytest
+
+from services.rate_limiter import ConcurrencyLimiter, RateLimiter, RateLimitTimeout, UpstreamLimiter
+
+
+def test_bucket_serves_burst_then_waits_for_refill():
+    limiter = RateLimiter("t", rate_per_minute=600, burst=2)   # 10 tokens/s
+    assert limiter.acquire() < 0.01
+    assert limiter.acquire() < 0.01
+    waited = limiter.acquire()
+    assert 0.05 < waited < 0.5
+
+
+def test_oversized_request_is_clamped_to_capacity():
+    limiter = RateLimiter("t", rate_per_minute=60, burst=5)
+    assert limiter.acquire(50, timeout=0.1) < 0.01
+    assert limiter.get_stats()["available"] == 0
+
+
+def test_timeout_raises_and_is_counted():
+    limiter = RateLimiter("t", rate_per_minute=1, burst=1)
+    limiter.acquire()
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(timeout=0.05)
+    assert limiter.get_stats()["timeouts"] == 1
+    assert limiter.get_stats()["queue_depth"] == 0
+
+
+def test_waiters_are_served_in_arrival_order():
+    limiter = RateLimiter("t", rate_per_minute=1200, burst=1)  # 20 tokens/s
+    limiter.acquire()
+    order = []
+
+    def worker(i):
+        limiter.acquire(timeout=5)
+        order.append(i)
+
+    threads = []
+    for i in range(4):
+        thread = threading.Thread(target=worker, args=(i,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+    assert order == [0, 1, 2, 3]
+
+
+def test_async_waiters_hold_no_threads_and_keep_fifo_order():
+    limiter = RateLimiter("t", rate_per_minute=1200, burst=1)  # 20 tokens/s
+    limiter.acquire()
+    order = []
+
+    async def waiter(i):
+        await limiter.acquire_async(timeout=5)
+        order.append(i)
+
+    async def main():
+        threads_before = threading.active_count()
+        tasks = []
+        for i in range(4):
+            tasks.append(asyncio.create_task(waiter(i)))
+            await asyncio.sleep(0.005)
+        waiting_threads = threading.active_count() - threads_before
+        await asyncio.gather(*tasks)
+        return waiting_threads
+
+    assert asyncio.run(main()) == 0
+    assert order == [0, 1, 2, 3]
+
+
+def test_cancelled_async_waiter_leaves_the_queue_without_taking_tokens():
+    limiter = RateLimiter("t", rate_per_minute=60, burst=1)    # 1 token/s
+    limiter.acquire()
+
+    async def main():
+        task = asyncio.create_task(limiter.acquire_async())
+        await asyncio.sleep(0.05)
+        assert limiter.get_stats()["queue_depth"] == 1
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(main())
+    stats = limiter.get_stats()
+    assert stats["queue_depth"] == 0
+    assert stats["acquired"] == 1
+    # The next caller isn't queued behind the abandoned waiter
+    assert limiter.acquire(timeout=2) < 1.5
+
+
+def test_async_timeout_raises():
+    limiter = RateLimiter("t", rate_per_minute=1, burst=1)
+    limiter.acquire()
+    with pytest.raises(RateLimitTimeout):
+        asyncio.run(limiter.acquire_async(timeout=0.05))
+    assert limiter.get_stats()["timeouts"] == 1
+
+
+def test_adjust_refunds_and_charges():
+    limiter = RateLimiter("t", rate_per_minute=0.001, burst=10)
+    limiter.acquire(10)
+    limiter.adjust(4)
+    assert limiter.get_stats()["available"] == pytest.approx(4, abs=0.01)
+    limiter.adjust(-6)
+    assert limiter.get_stats()["available"] == pytest.approx(-2, abs=0.01)
+
+
+def test_concurrency_limiter_caps_in_flight():
+    limiter = ConcurrencyLimiter("t", max_concurrency=1)
+    limiter.acquire()
+    with pytest.raises(RateLimitTimeout):
+        limiter.acquire(timeout=0.05)
+    limiter.release()
+    assert limiter.acquire(timeout=0.05) < 0.05
+
+
+def test_lease_settles_token_reservation():
+    limiter = UpstreamLimiter("t", tokens_per_minute=6000)     # burst 1000
+    with limiter.limit(tokens=800) as lease:
+        lease.settle(200)
+    assert limiter.tokens.get_stats()["available"] == pytest.approx(800, abs=5)
+
+
+def test_token_timeout_refunds_the_request_token():
+    limiter = UpstreamLimiter("t", requests_per_minute=0.01, tokens_per_minute=0.6)
+    limiter.tokens.acquire(limiter.tokens.capacity)
+    with pytest.raises(RateLimitTimeout):
+        with limiter.limit(tokens=1, timeout=0.05):
+            pass
+    # The request slot was never used, so the next caller gets it straight away
+    assert limiter.requests.get_stats()["available"] == pytest.approx(1, abs=0.01)
+
+
+def test_concurrency_timeout_refunds_requests_and_tokens():
+    limiter = UpstreamLimiter("t", requests_per_minute=24, tokens_per_minute=0.06, max_concurrency=1)   # 2 requests burst
+    with limiter.limit():
+        with pytest.raises(RateLimitTimeout):
+            with limiter.limit(tokens=0.01, timeout=0.05):
+                pass
+    # Only the admitted call's request token is spent (plus ~0.05s of refill)
+    assert limiter.requests.get_stats()["available"] == pytest.approx(1, abs=0.1)
+    assert limiter.tokens.get_stats()["available"] == pytest.approx(limiter.tokens.capacity, abs=0.001)
+    assert limiter.concurrency.in_flight == 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+ARCANA BACKEND - RETRY / CIRCUIT BREAKER TESTS
+CircuitBreaker state changes and call_with_retry's failure paths
+
+Runs without API keys or network.
+
+Usage:
+    python -m pytest test_resilience.py
+"""
+import os
+import time
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+import pytest
+
+from services import resilience
+from services.resilience import CircuitBreaker, CircuitOpenError, call_with_retry
+
+
+class APITimeoutError(Exception):
+    """Stands in for anthropic.APITimeoutError (matched by name)"""
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": {"retry-after": retry_after} if retry_after else {}})()
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    """A fresh breaker for a test upstream, and no real sleeping"""
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    monkeypatch.setitem(resilience.breakers, "test", breaker)
+    sleeps = []
+    monkeypatch.setattr(resilience.time, "sleep", sleeps.append)
+    breaker.sleeps = sleeps
+    return breaker
+
+
+def failing(exc):
+    def fn():
+        raise exc
+    return fn
+
+
+def test_breaker_opens_after_threshold_and_probes_after_reset():
+    breaker = CircuitBreaker("t", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()          # the single half-open probe
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("t", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+
+def test_retries_transient_errors_then_succeeds(breaker):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) < 2:
+            raise StatusError(503)
+        return "ok"
+
+    assert call_with_retry("test", fn, max_attempts=3) == "ok"
+    assert len(calls) == 2
+    assert breaker.state == "closed"
+
+
+def test_client_errors_are_not_retried_or_counted(breaker):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        call_with_retry("test", fn, max_attempts=3)
+    assert len(calls) == 1
+    assert breaker.get_stats()["consecutive_failures"] == 0
+
+
+def test_open_circuit_fails_fast(breaker):
+    for _ in range(3):
+        with pytest.raises(StatusError):
+            call_with_retry("test", failing(StatusError(503)), max_attempts=1)
+    with pytest.raises(CircuitOpenError):
+        call_with_retry("test", lambda: "never called")
+
+
+def test_deadline_timeouts_do_not_open_the_circuit(breaker):
+    """Short client deadlines must not take the upstream down for everyone"""
+    for _ in range(5):
+        with pytest.raises(APITimeoutError):
+            call_with_retry("test", failing(APITimeoutError()), max_attempts=3, expires_at=time.monotonic() + 0.1)
+    assert breaker.state == "closed"
+    assert breaker.get_stats()["consecutive_failures"] == 0
+    assert breaker.sleeps == []
+
+
+def test_timeouts_without_deadline_still_count(breaker):
+    with pytest.raises(APITimeoutError):
+        call_with_retry("test", failing(APITimeoutError()), max_attempts=3)
+    assert breaker.state == "open"
+
+
+def test_long_retry_after_gives_up_instead_of_sleeping(breaker):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise StatusError(429, retry_after="600")
+
+    with pytest.raises(StatusError):
+        call_with_retry("test", fn, max_attempts=3)
+    assert len(calls) == 1
+    assert breaker.sleeps == []
+
+
+def test_short_retry_after_is_honoured(breaker, monkeypatch):
+    monkeypatch.setattr(resilience.settings, "retry_base_delay", 0.0)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            raise StatusError(429, retry_after="2")
+        return "ok"
+
+    assert call_with_retry("test", fn, max_attempts=2) == "ok"
+    assert breaker.sleeps == [2.0]
+
+
+def test_no_retry_past_the_deadline(breaker):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        raise StatusError(503, retry_after="5")
+
+    with pytest.raises(StatusError):
+        call_with_retry("test", fn, max_attempts=3, expires_at=time.monotonic() + 1)
+    assert len(calls) == 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+ARCANA BACKEND - STRUCTURED OUTPUT TESTS
+Tool definitions, text fallbacks and local repair of partly invalid answers
+
+Runs without API keys or network.
+
+Usage:
+    python -m pytest test_schemas.py
+"""
+import os
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+import pytest
+
+from agents.schemas import (
+    LayoutPlan, ProductSelection, StructuredOutputError, StyleAnalysis,
+    _repair, parse_structured, tool_definition
+)
+
+
+def test_tool_definition_requires_every_field():
+    tool = tool_definition(ProductSelection)
+    assert tool["name"] == "record_product_selection"
+    schema = tool["input_schema"]
+    assert set(schema["required"]) == set(schema["properties"])
+    assert "product_index" in schema["$defs"]["SelectedProduct"]["required"]
+
+
+def test_valid_answer_is_not_repaired():
+    result, repaired = parse_structured(StyleAnalysis, {"primary_style": "industrial", "confidence_score": 0.7})
+    assert result.primary_style == "industrial"
+    assert not repaired
+
+
+def test_text_answer_in_a_fence_is_parsed():
+    result, _ = parse_structured(StyleAnalysis, '```json\n{"primary_style": "bohemian"}\n```')
+    assert result.primary_style == "bohemian"
+
+
+@pytest.mark.parametrize("raw", ["no json here", '{"primary_style": ', ["a list"]])
+def test_unusable_answers_raise(raw):
+    with pytest.raises(StructuredOutputError):
+        parse_structured(StyleAnalysis, raw)
+
+
+def test_out_of_range_float_is_clamped():
+    result, repaired = parse_structured(StyleAnalysis, {"confidence_score": 1.7})
+    assert result.confidence_score == 1.0
+    assert repaired
+
+
+def test_nested_percentages_are_clamped():
+    answer = {"product_placements": [{"product_index": 0, "position": {"x_percent": -5, "y_percent": 140}}]}
+    result, _ = parse_structured(LayoutPlan, answer)
+    position = result.product_placements[0].position
+    assert (position.x_percent, position.y_percent) == (0.0, 100.0)
+
+
+def test_invalid_field_falls_back_to_default():
+    result, repaired = parse_structured(ProductSelection, {"reasoning": ["not", "a", "string"]})
+    assert result.reasoning == ""
+    assert repaired
+
+
+def test_list_items_that_cannot_be_fixed_are_dropped():
+    answer = {"selected_products": [
+        {"product_index": 2, "priority": "essential"},
+        {"product_index": -1},          # negative index: dropped, never guessed
+        {"product_name": "no index"},   # required field missing
+        {"product_index": 5, "priority": "urgent"}
+    ]}
+    result, repaired = parse_structured(ProductSelection, answer)
+    assert [p.product_index for p in result.selected_products] == [2, 5]
+    assert result.selected_products[1].priority == "recommended"
+    assert repaired
+
+
+def test_repair_reports_unreachable_locations():
+    data = {"selected_products": []}
+    assert not _repair(data, {"loc": (), "type": "missing"})
+    assert not _repair(data, {"loc": ("selected_products", 3, "product_index"), "type": "missing"})
+
+
+def test_input_is_not_modified():
+    answer = {"confidence_score": 3.0}
+    parse_structured(StyleAnalysis, answer)
+    assert answer == {"confidence_score": 3.0}
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+ARCANA BACKEND - REQUEST COALESCING TESTS
+SingleFlight sharing, error propagation and the design coalescing key
+
+Runs without API keys or network.
+
+Usage:
+    python -m pytest test_single_flight.py
+"""
+import asyncio
+import os
+import threading
+import time
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+import pytest
+
+from models import DesignRequest
+from services.single_flight import SingleFlight, design_request_key
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = SingleFlight("test")
+    started = threading.Event()
+    release = threading.Event()
+    runs = []
+
+    def compute():
+        runs.append(1)
+        started.set()
+        release.wait(2)
+        return {"value": 42}
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", compute)))
+    leader.start()
+    started.wait(2)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("k", compute))) for _ in range(4)]
+    for t in followers:
+        t.start()
+    time.sleep(0.05)
+    release.set()
+    for t in [leader] + followers:
+        t.join(2)
+
+    assert len(runs) == 1
+    assert results == [{"value": 42}] * 5
+    stats = flight.get_stats()
+    assert stats["executions"] == 1 and stats["shared"] == 4 and stats["inflight"] == 0
+
+
+def test_leader_error_reaches_followers_and_releases_key():
+    flight = SingleFlight("test")
+    started = threading.Event()
+    release = threading.Event()
+
+    def boom():
+        started.set()
+        release.wait(2)
+        raise RuntimeError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            flight.do("k", boom)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(2)
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.05)
+    release.set()
+    leader.join(2)
+    follower.join(2)
+
+    assert errors == ["upstream down"] * 2
+    # A failure is never cached: the next caller runs again
+    assert flight.do("k", lambda: "recovered") == "recovered"
+
+
+def test_without_memoize_completed_keys_run_again():
+    flight = SingleFlight("test")
+    assert flight.do("k", lambda: 1) == 1
+    assert flight.do("k", lambda: 2) == 2
+
+
+def test_memoize_reuses_completed_results():
+    flight = SingleFlight("test", memoize=True)
+    assert flight.do("k", lambda: 1) == 1
+    assert flight.do("k", lambda: 2) == 1
+
+
+def test_async_followers_do_not_block_the_event_loop():
+    flight = SingleFlight("test")
+
+    def slow():
+        time.sleep(0.2)
+        return "done"
+
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        tick_task = asyncio.create_task(ticker())
+        results = await asyncio.gather(*(flight.do_async("k", slow) for _ in range(5)))
+        tick_task.cancel()
+        return results, ticks
+
+    results, ticks = asyncio.run(main())
+    assert results == ["done"] * 5
+    assert flight.get_stats()["executions"] == 1
+    # The loop kept running while the leader computed
+    assert ticks >= 10
+
+
+def run_cancelling(flight, cancel_index):
+    """Leader + 2 followers on a slow computation; one caller is cancelled mid-flight"""
+    def slow():
+        time.sleep(0.2)
+        return "done"
+
+    async def main():
+        tasks = []
+        for _ in range(3):
+            tasks.append(asyncio.create_task(flight.do_async("k", slow)))
+            await asyncio.sleep(0.01)
+        tasks[cancel_index].cancel()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    return asyncio.run(main())
+
+
+def test_cancelled_follower_leaves_the_others_their_result():
+    results = run_cancelling(SingleFlight("test"), cancel_index=1)
+    assert results[0] == "done" and results[2] == "done"
+    assert isinstance(results[1], asyncio.CancelledError)
+
+
+def test_cancelled_leader_still_publishes_the_real_result():
+    flight = SingleFlight("test")
+    results = run_cancelling(flight, cancel_index=0)
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert results[1:] == ["done", "done"]
+    assert flight.get_stats()["executions"] == 1
+
+
+def test_design_key_normalizes_text_but_separates_deadlines():
+    a = DesignRequest(prompt="Cozy  Reading Nook", room_type="living_room", room_size="medium")
+    b = DesignRequest(prompt="cozy reading nook ", room_type="living_room", room_size="medium")
+    assert design_request_key(a) == design_request_key(b)
+    assert design_request_key(a, 200) != design_request_key(a, 30000)
+    assert design_request_key(a, None) != design_request_key(a, 200)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
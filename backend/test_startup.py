@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+ARCANA BACKEND - COLD START REGRESSION TEST
+Fails if importing the app or serving the first /health gets slow again
+
+Runs without API keys. Budgets can be tuned per machine:
+    STARTUP_IMPORT_BUDGET_MS   cumulative `import main` time (-X importtime)
+    STARTUP_HEALTH_BUDGET_MS   process spawn -> first 200 from /health
+
+Usage:
+    python -m pytest test_startup.py
+    python test_startup.py
+"""
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1500"))
+HEALTH_BUDGET_MS = float(os.getenv("STARTUP_HEALTH_BUDGET_MS", "5000"))
+
+# Must only be imported when first used, never by `import main`
+DEFERRED_MODULES = ["networkx", "anthropic", "replicate", "instructor", "httpx", "requests"]
+
+
+def _clean_env():
+    """Environment without API keys, to prove they are optional"""
+    env = dict(os.environ)
+    for key in ("ANTHROPIC_API_KEY", "REPLICATE_API_TOKEN", "IMGBB_API_KEY"):
+        env.pop(key, None)
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def _import_profile():
+    """{module: cumulative_us} for `import main` in a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=_clean_env(), capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, f"import main failed:\n{result.stderr[-2000:]}"
+
+    profile = {}
+    for line in result.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            profile[match.group(3)] = int(match.group(1))
+    return profile
+
+
+def test_import_time_budget():
+    profile = _import_profile()
+    total_ms = profile["main"] / 1000
+    print(f"import main: {total_ms:.0f} ms (budget {IMPORT_BUDGET_MS:.0f} ms)")
+    assert total_ms <= IMPORT_BUDGET_MS, f"import main took {total_ms:.0f} ms"
+
+
+def test_heavy_modules_are_deferred():
+    profile = _import_profile()
+    eager = [name for name in DEFERRED_MODULES if name in profile]
+    assert not eager, f"imported eagerly by `import main`: {eager}"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_time_to_first_health():
+    port = _free_port()
+    start = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=_clean_env(), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE
+    )
+    try:
+        elapsed_ms = None
+        while time.monotonic() - start < 60:
+            assert server.poll() is None, f"server exited:\n{server.stderr.read().decode()[-2000:]}"
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        elapsed_ms = (time.monotonic() - start) * 1000
+                        break
+            except OSError:
+                time.sleep(0.02)
+        assert elapsed_ms is not None, "/health never answered"
+        print(f"first /health: {elapsed_ms:.0f} ms (budget {HEALTH_BUDGET_MS:.0f} ms)")
+        assert elapsed_ms <= HEALTH_BUDGET_MS, f"first /health took {elapsed_ms:.0f} ms"
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    failed = 0
+    for test in (test_import_time_budget, test_heavy_modules_are_deferred, test_time_to_first_health):
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            failed += 1
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+ARCANA BACKEND - INCREMENTAL JSON PARSER TESTS
+Array elements of a streamed tool input, emitted as soon as each one closes
+
+Runs without API keys or network.
+
+Usage:
+    python -m pytest test_streaming.py
+"""
+import json
+import os
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+import pytest
+
+from agents.streaming import IncrementalArrayParser
+
+PRODUCTS = [
+    {"product_index": 0, "selection_reason": "anchors the room {with} [brackets]"},
+    {"product_index": 3, "selection_reason": "a \"quoted\" pick \\ with a backslash", "tags": [1, [2, 3]]},
+    {"product_index": 7, "position": {"x_percent": 10, "nested": {"selected_products": []}}}
+]
+ANSWER = json.dumps({
+    "reasoning": "selected_products: [not this one]",
+    "selected_products": PRODUCTS,
+    "total_estimated_cost": 1200.5
+})
+
+
+def feed_all(parser, text, size):
+    items = []
+    for start in range(0, len(text), size):
+        items.extend(parser.feed(text[start:start + size]))
+    return items
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 64, len(ANSWER)])
+def test_elements_are_emitted_once_for_any_fragmentation(size):
+    parser = IncrementalArrayParser("selected_products")
+    assert feed_all(parser, ANSWER, size) == PRODUCTS
+    assert parser.emitted == len(PRODUCTS)
+
+
+def test_element_is_emitted_as_soon_as_it_closes():
+    parser = IncrementalArrayParser("selected_products")
+    first = json.dumps(PRODUCTS[0])
+    first_end = ANSWER.index(first) + len(first)
+    assert parser.feed(ANSWER[:first_end - 1]) == []
+    assert parser.feed(ANSWER[first_end - 1:first_end]) == [PRODUCTS[0]]
+
+
+def test_other_keys_and_nested_namesakes_are_ignored():
+    text = json.dumps({"other": [{"a": 1}], "layout": {"selected_products": [{"b": 2}]}})
+    assert feed_all(IncrementalArrayParser("selected_products"), text, 5) == []
+
+
+def test_malformed_element_is_skipped():
+    parser = IncrementalArrayParser("items")
+    items = parser.feed('{"items": [{"a": 1}, {"a": 1,, "b"}, {"c": 2}]}')
+    assert items == [{"a": 1}, {"c": 2}]
+    assert parser.emitted == 2
+
+
+def test_empty_and_unfinished_arrays_emit_nothing():
+    assert IncrementalArrayParser("items").feed('{"items": []}') == []
+    assert IncrementalArrayParser("items").feed('{"items": [{"a": 1') == []
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
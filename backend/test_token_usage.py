@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+ARCANA BACKEND - TOKEN USAGE TESTS
+Per-agent token accounting, prompt-cache cost ratios and TTFT
+
+Runs without API keys or network.
+
+Usage:
+    python -m pytest test_token_usage.py
+"""
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+import pytest
+
+from agents.usage import TimeToFirstToken, TokenUsageStats
+from services.metrics import registry
+
+SONNET = "claude-sonnet-4-20250514"
+
+
+def usage(input_tokens=100, output_tokens=50, cache_read=0, cache_creation=0):
+    return SimpleNamespace(
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        cache_read_input_tokens=cache_read,
+        cache_creation_input_tokens=cache_creation
+    )
+
+
+def test_cache_reads_do_not_count_against_the_rate_limit():
+    stats = TokenUsageStats()
+    assert stats.record(usage(input_tokens=20, output_tokens=50, cache_read=1500)) == 70
+    assert stats.record(usage(input_tokens=20, output_tokens=50, cache_creation=1500)) == 1570
+    assert stats.get_stats()["cache_hit_ratio"] == pytest.approx(1500 / 3040, abs=1e-4)
+
+
+def test_usage_totals_and_cost_ratio():
+    stats = TokenUsageStats()
+    stats.record(usage(input_tokens=100, output_tokens=50))
+    stats.record(usage(input_tokens=0, output_tokens=50, cache_creation=100))
+    result = stats.get_stats()
+    assert result["calls"] == 2
+    assert result["output_tokens"] == 100
+    assert result["cache_hit_ratio"] == 0.0
+    assert result["input_cost_ratio"] == pytest.approx((100 + 100 * 1.25) / 200)
+
+
+def test_ttft_is_recorded_per_call_mode():
+    ttft = TimeToFirstToken("TestAgent")
+    ttft.record(0.2, SONNET, "stream")
+    ttft.record(1.5, SONNET, "full")
+    stats = ttft.get_stats()
+    assert stats["stream"]["p50_ms"] == 200.0
+    assert stats["full"]["p50_ms"] == 1500.0
+    exported = registry.render()
+    assert 'agent="TestAgent",model="%s",mode="full"' % SONNET in exported
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))
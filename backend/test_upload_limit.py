@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+ARCANA BACKEND - UPLOAD LIMIT TESTS
+Body size limit middleware and the streaming upload pipeline
+
+Runs without API keys or network.
+
+Usage:
+    python -m pytest test_upload_limit.py
+"""
+import io
+import os
+
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from services import image_service as image_service_module
+from services.image_service import ImageService, ImageTooLarge
+from services.upload_limit import UploadLimitMiddleware
+
+LIMIT = 1000
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(UploadLimitMiddleware, paths=["/upload"], max_bytes=LIMIT)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    @app.post("/other")
+    async def other(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return TestClient(app)
+
+
+def multipart(payload: bytes):
+    return {"file": ("room.bin", payload, "application/octet-stream")}
+
+
+def encode(image: Image.Image, fmt: str, **options) -> io.BytesIO:
+    output = io.BytesIO()
+    image.save(output, fmt, **options)
+    output.seek(0)
+    return output
+
+
+def test_small_upload_passes_through(client):
+    response = client.post("/upload", files=multipart(b"x" * 100))
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+
+
+def test_declared_content_length_over_limit_is_refused(client):
+    response = client.post("/upload", files=multipart(b"x" * (LIMIT * 2)))
+    assert response.status_code == 413
+    assert str(LIMIT) in response.json()["detail"]
+
+
+def test_chunked_body_over_limit_is_refused(client):
+    """No Content-Length: the bytes are counted as they arrive"""
+    boundary = "limit-test"
+    head = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"room.bin\"\r\n"
+            "Content-Type: application/octet-stream\r\n\r\n").encode()
+
+    def chunks():
+        yield head
+        for _ in range(10):
+            yield b"y" * 300
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    response = client.post("/upload", content=chunks(), headers={"content-type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 413
+
+
+def test_other_paths_are_not_limited(client):
+    response = client.post("/other", files=multipart(b"x" * (LIMIT * 2)))
+    assert response.status_code == 200
+
+
+def test_image_over_pixel_limit_is_refused_before_decoding(monkeypatch):
+    monkeypatch.setattr(image_service_module.settings, "upload_max_pixels", 100 * 100)
+    with pytest.raises(ImageTooLarge):
+        ImageService.process_upload(encode(Image.new("RGB", (200, 200)), "PNG"))
+
+
+def test_decompression_bomb_is_image_too_large(monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    with pytest.raises(ImageTooLarge):
+        ImageService.process_upload(encode(Image.new("RGB", (200, 200)), "PNG"))
+
+
+def test_invalid_data_is_a_value_error():
+    with pytest.raises(ValueError) as excinfo:
+        ImageService.process_upload(io.BytesIO(b"not an image"))
+    assert not isinstance(excinfo.value, ImageTooLarge)
+
+
+def test_jpeg_is_downscaled_and_exif_rotated():
+    image = Image.new("RGB", (1600, 1200), (200, 120, 40))
+    exif = image.getexif()
+    exif[0x0112] = 6  # rotate 90° clockwise to display
+    output = ImageService.process_upload(encode(image, "JPEG", exif=exif.tobytes()), max_size=400)
+
+    result = Image.open(io.BytesIO(output))
+    assert result.format == "PNG"
+    assert result.size == (300, 400)
+
+
+def test_alpha_is_flattened_onto_white():
+    image = Image.new("RGBA", (64, 32), (0, 0, 0, 0))
+    result = Image.open(io.BytesIO(ImageService.process_upload(encode(image, "PNG"))))
+    assert result.mode == "RGB"
+    assert result.size == (64, 32)
+    assert result.getpixel((0, 0)) == (255, 255, 255)
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__, "-q"]))